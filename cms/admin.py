@@ -1,9 +1,12 @@
 from django.contrib import admin
+from django.db import IntegrityError, transaction
+from django.utils import timezone
 from django.utils.html import format_html
 from django.urls import reverse
 from django.utils.safestring import mark_safe
-from .models import Category, Post, Page, Comment, SiteSettings
+from .models import Category, Post, Page, Comment, SiteSettings, Job
 from .admin_site import custom_admin_site
+from .site_settings import get_site_settings
 
 
 @admin.register(Category)
@@ -15,15 +18,11 @@ class CategoryAdmin(admin.ModelAdmin):
     readonly_fields = ['created_at']
     
     def post_count(self, obj):
-        count = obj.posts.count()
-        url = reverse('admin:cms_post_changelist') + f'?category__id__exact={obj.id}'
-        return format_html('<a href="{}">{} posts</a>', url, count)
+        url = reverse('admin:cms_post_changelist') + f'?category__id__exact={obj.id}&status__exact=published'
+        return format_html('<a href="{}">{} published</a>', url, obj.published_post_count)
     
     post_count.short_description = 'Posts'
-    post_count.admin_order_field = 'posts__count'
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('posts')
+    post_count.admin_order_field = 'published_post_count'
 
 
 @admin.register(Post)
@@ -75,12 +74,14 @@ class PostAdmin(admin.ModelAdmin):
     status_badge.admin_order_field = 'status'
     
     def comment_count(self, obj):
-        count = obj.comments.count()
-        approved_count = obj.comments.filter(is_approved=True).count()
         url = reverse('admin:cms_comment_changelist') + f'?post__id__exact={obj.id}'
-        return format_html('<a href="{}">{} comments ({} approved)</a>', url, count, approved_count)
+        return format_html(
+            '<a href="{}">{} comments ({} approved)</a>',
+            url, obj.total_comment_count, obj.approved_comment_count
+        )
     
     comment_count.short_description = 'Comments'
+    comment_count.admin_order_field = 'total_comment_count'
     
     def save_model(self, request, obj, form, change):
         if not change:  # If creating new post
@@ -88,17 +89,17 @@ class PostAdmin(admin.ModelAdmin):
         super().save_model(request, obj, form, change)
     
     def make_published(self, request, queryset):
-        queryset.update(status='published')
-        self.message_user(request, f'{queryset.count()} posts were successfully published.')
+        count = queryset.publish()
+        self.message_user(request, f'{count} posts were successfully published or scheduled.')
     make_published.short_description = "Mark selected posts as published"
     
     def make_draft(self, request, queryset):
-        queryset.update(status='draft')
-        self.message_user(request, f'{queryset.count()} posts were moved to draft.')
+        count = queryset.exclude(status='draft').update(status='draft')
+        self.message_user(request, f'{count} posts were moved to draft.')
     make_draft.short_description = "Mark selected posts as draft"
     
     def get_queryset(self, request):
-        return super().get_queryset(request).select_related('author', 'category').prefetch_related('comments')
+        return super().get_queryset(request).select_related('author', 'category')
 
 
 @admin.register(Page)
@@ -183,15 +184,18 @@ class CommentAdmin(admin.ModelAdmin):
     is_approved_badge.admin_order_field = 'is_approved'
     
     def approve_comments(self, request, queryset):
-        queryset.update(is_approved=True)
-        self.message_user(request, f'{queryset.count()} comments were approved.')
+        count = queryset.approve()
+        self.message_user(request, f'{count} comments were approved.')
     approve_comments.short_description = "Approve selected comments"
     
     def reject_comments(self, request, queryset):
-        queryset.update(is_approved=False)
-        self.message_user(request, f'{queryset.count()} comments were rejected.')
+        count = queryset.reject()
+        self.message_user(request, f'{count} comments were rejected.')
     reject_comments.short_description = "Reject selected comments"
     
+    def delete_queryset(self, request, queryset):
+        queryset.bulk_delete()
+    
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         return qs.select_related('post')
@@ -218,16 +222,46 @@ class SiteSettingsAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         # Allow only one instance
-        return not SiteSettings.objects.exists()
+        return get_site_settings() is None
     
     def has_delete_permission(self, request, obj=None):
         # Don't allow deletion
         return False
 
 
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'priority', 'attempts', 'run_at', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name', 'dedup_key']
+    readonly_fields = [
+        'name', 'kwargs', 'dedup_key', 'attempts', 'locked_by', 'locked_at', 'last_error', 'created_at', 'finished_at'
+    ]
+    actions = ['retry_jobs']
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def retry_jobs(self, request, queryset):
+        # Jobs that still have a queued duplicate stay failed
+        retried = 0
+        for job in queryset.filter(status='failed'):
+            try:
+                with transaction.atomic():
+                    Job.objects.filter(pk=job.pk).update(
+                        status='queued', attempts=0, run_at=timezone.now(), finished_at=None
+                    )
+                retried += 1
+            except IntegrityError:
+                pass
+        self.message_user(request, f'{retried} jobs were queued again.')
+    retry_jobs.short_description = "Retry selected failed jobs"
+
+
 # Register models with custom admin site as well
 custom_admin_site.register(Category, CategoryAdmin)
 custom_admin_site.register(Post, PostAdmin)
 custom_admin_site.register(Page, PageAdmin)
 custom_admin_site.register(Comment, CommentAdmin)
 custom_admin_site.register(SiteSettings, SiteSettingsAdmin)
+custom_admin_site.register(Job, JobAdmin)
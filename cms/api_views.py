@@ -1,120 +1,328 @@
 from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
+from rest_framework.exceptions import Throttled
 from rest_framework.response import Response
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth.models import User
-from django.db.models import Count, Q
-from django.utils import timezone
-from datetime import timedelta
+from django.db.models import Prefetch
+from django.utils.decorators import method_decorator
 
 from .models import Category, Post, Page, Comment, SiteSettings
+from . import bulk, comment_intake, export, related, rollups, search, versions
+from .pagination import KeysetPagination
+from .stats import get_category_distribution, get_dashboard_stats, get_status_distribution
 from .serializers import (
     UserSerializer, CategorySerializer, PostListSerializer, 
     PostDetailSerializer, PostCreateUpdateSerializer, PageSerializer, 
-    CommentSerializer, SiteSettingsSerializer, DashboardStatsSerializer
+    CommentSerializer, CommentModerationSerializer, SiteSettingsSerializer, DashboardStatsSerializer,
+    SparseFieldsMixin
 )
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class SparseFieldsViewMixin:
+    """
+    Passes ``?fields=a,b`` and ``?include=x,y`` to sparse serializers on
+    read requests, and ``with_related()`` adds just the joins and prefetches
+    the requested output needs.
+    """
+    
+    def get_sparse_options(self):
+        if self.request is None or self.request.method not in permissions.SAFE_METHODS:
+            return None
+        if not issubclass(self.get_serializer_class(), SparseFieldsMixin):
+            return None
+        params = self.request.query_params
+        return {
+            param: [name.strip() for name in params[param].split(',') if name.strip()]
+            for param in ('fields', 'include') if param in params
+        }
+    
+    def get_serializer(self, *args, **kwargs):
+        for param, value in (self.get_sparse_options() or {}).items():
+            kwargs.setdefault(param, value)
+        return super().get_serializer(*args, **kwargs)
+    
+    def with_related(self, queryset):
+        options = self.get_sparse_options()
+        if options is None:
+            return queryset
+        serializer = self.get_serializer_class()(context=self.get_serializer_context(), **options)
+        select, prefetch = serializer.get_related_lookups()
+        if select:
+            queryset = queryset.select_related(*select)
+        return queryset.prefetch_related(*[self.get_prefetch(lookup) for lookup in prefetch])
+    
+    def get_prefetch(self, lookup):
+        """Hook to turn a prefetch lookup into a filtered ``Prefetch``"""
+        return lookup
+
+
+class PostSearchFilter(SearchFilter):
+    """
+    Search filter backed by the full-text index instead of icontains lookups.
+    Results are ordered by relevance unless an explicit ordering is requested,
+    so it must come after OrderingFilter in filter_backends.
+    """
+    search_description = 'Full-text search over title, excerpt and content.'
+    
+    def get_search_fields(self, view, request):
+        return ['title', 'excerpt', 'content']
+    
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        explicit_ordering = request.query_params.get(OrderingFilter.ordering_param)
+        return search.search_posts(queryset, query, rank=not explicit_ordering)
+
+
+# Tables whose changes can show up in each resource's responses
+POST_TABLES = ('post', 'comment', 'category', 'tag', 'user')
+CATEGORY_TABLES = ('category', 'post')
+PAGE_TABLES = ('page',)
+
+
+def _api_variant(request):
+    """What else shapes a response: query string, user and format"""
+    return (request.get_full_path(), request.user.pk, request.accepted_renderer.format)
+
+
+def post_list_validators(request, *args, **kwargs):
+    return versions.collection_validators(POST_TABLES, *_api_variant(request))
+
+
+def post_detail_validators(request, slug=None, **kwargs):
+    posts = Post.objects.filter(slug=slug)
+    if not request.user.is_authenticated:
+        posts = posts.filter(status='published')
+    updated_at = posts.values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return versions.object_validators(
+        updated_at, [table for table in POST_TABLES if table != 'post'], *_api_variant(request)
+    )
+
+
+def related_validators(request, *args, **kwargs):
+    return versions.collection_validators(POST_TABLES + ('related',), *_api_variant(request))
+
+
+def category_validators(request, *args, **kwargs):
+    return versions.collection_validators(CATEGORY_TABLES, *_api_variant(request))
+
+
+def page_list_validators(request, *args, **kwargs):
+    return versions.collection_validators(PAGE_TABLES, *_api_variant(request))
+
+
+def page_detail_validators(request, slug=None, **kwargs):
+    pages = Page.objects.filter(slug=slug)
+    if not request.user.is_authenticated:
+        pages = pages.filter(is_published=True)
+    updated_at = pages.values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return versions.object_validators(updated_at, (), *_api_variant(request))
+
+
+class CategoryViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Category CRUD operations
     """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # GET requests may read from a replica, see cms.replicas
+    replica_reads = True
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['name', 'description']
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
     lookup_field = 'slug'
     
-    @action(detail=True, methods=['get'])
+    @method_decorator(versions.conditional(category_validators))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(versions.conditional(category_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
     def posts(self, request, slug=None):
-        """Get all posts in this category"""
+        """Get the published posts in this category, one page at a time"""
         category = self.get_object()
         posts = Post.objects.filter(
             category=category, 
             status='published'
-        ).order_by('-publish_date')
+        ).select_related('author', 'category').prefetch_related('tags').order_by('-publish_date', '-id')
         
-        serializer = PostListSerializer(posts, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(posts)
+        serializer = PostListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Post CRUD operations
     """
     queryset = Post.objects.all()
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+    # GET requests may read from a replica, see cms.replicas
+    replica_reads = True
+    filter_backends = [DjangoFilterBackend, OrderingFilter, PostSearchFilter]
     filterset_fields = ['category', 'status', 'author']
-    search_fields = ['title', 'content', 'excerpt']
     ordering_fields = ['created_at', 'updated_at', 'publish_date']
     ordering = ['-publish_date']
+    pagination_class = KeysetPagination
     lookup_field = 'slug'
     
+    @method_decorator(versions.conditional(post_list_validators))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(versions.conditional(post_detail_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         """
         Return published posts for anonymous users,
         all posts for authenticated users
         """
         if self.request.user.is_authenticated:
-            return Post.objects.all().select_related('author', 'category').prefetch_related('tags', 'comments')
+            posts = Post.objects.all()
         else:
-            return Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('tags', 'comments')
+            posts = Post.objects.filter(status='published')
+        return self.with_related(posts)
+    
+    def get_prefetch(self, lookup):
+        if lookup == 'comments':
+            comments = Comment.objects.order_by('-created_at', '-id')
+            if not self.request.user.is_authenticated:
+                comments = comments.filter(is_approved=True)
+            return Prefetch('comments', queryset=comments)
+        return lookup
     
     def get_serializer_class(self):
         """
         Return appropriate serializer based on action
         """
-        if self.action == 'list':
+        if self.action in ['list', 'published', 'featured', 'related']:
             return PostListSerializer
         elif self.action in ['create', 'update', 'partial_update']:
             return PostCreateUpdateSerializer
         else:
             return PostDetailSerializer
     
+    def paginate_queryset(self, queryset):
+        """Attach highlighted snippets to the current page of search results"""
+        page = super().paginate_queryset(queryset)
+        query = self.request.query_params.get(PostSearchFilter.search_param, '').strip()
+        if page is not None and query:
+            search.highlight(page, query)
+        return page
+    
     def perform_create(self, serializer):
         """Set the author to the current user when creating a post"""
         serializer.save(author=self.request.user)
     
     @action(detail=True, methods=['post'])
     def add_comment(self, request, slug=None):
-        """Add a comment to this post"""
+        """Submit a comment on this post; it is stored unapproved, in the background"""
         post = self.get_object()
-        
         data = request.data.copy()
         data['post'] = post.id
         
         serializer = CommentSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Only well-formed comments use up the visitor's allowance
+            wait = comment_intake.check_rate_limit(request, post)
+            if wait:
+                raise Throttled(wait)
+            comment_intake.submit(
+                post, **{field: serializer.validated_data[field] for field in ('name', 'email', 'content')}
+            )
+            return Response(
+                {'detail': 'Your comment has been submitted and is awaiting approval.'},
+                status=status.HTTP_202_ACCEPTED
+            )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
+    @method_decorator(versions.conditional(post_list_validators))
     @action(detail=False, methods=['get'])
     def published(self, request):
         """Get only published posts"""
-        posts = Post.objects.filter(status='published').order_by('-publish_date')
+        posts = self.with_related(Post.objects.filter(status='published')).order_by('-publish_date', '-id')
         page = self.paginate_queryset(posts)
         if page is not None:
-            serializer = PostListSerializer(page, many=True)
+            serializer = self.get_serializer(page, many=True)
             return self.get_paginated_response(serializer.data)
         
-        serializer = PostListSerializer(posts, many=True)
+        serializer = self.get_serializer(posts, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk(self, request):
+        """
+        Create or update many posts at once. Takes a list of post objects
+        (items with an ``id`` update that post) and returns a result per
+        item; invalid items are reported without failing the others.
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response({'detail': 'Expected a list of posts.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > bulk.get_max_items():
+            return Response(
+                {'detail': 'At most %d posts per request.' % bulk.get_max_items()},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        results = bulk.bulk_save_posts(items, author=request.user)
+        counts = {'created': 0, 'updated': 0, 'error': 0}
+        for result in results:
+            counts[result['status']] += 1
+        return Response({
+            'created': counts['created'],
+            'updated': counts['updated'],
+            'errors': counts['error'],
+            'results': results,
+        })
+    
+    @action(detail=False, methods=['get'], renderer_classes=[export.NDJSONRenderer, export.CSVRenderer])
+    def export(self, request):
+        """
+        Stream every post visible to the user as NDJSON (default) or CSV
+        (``?format=csv``). Takes the list filters (status, category, author,
+        search) plus ``?updated_since=`` (ISO date or datetime).
+        """
+        posts = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            posts = posts.filter(updated_at__gte=export.parse_since(updated_since, 'updated_since'))
+        return export.streaming_export(
+            request.accepted_renderer, export.iter_post_rows(posts), export.POST_FIELDS + ['tags'], 'posts'
+        )
+    
     @action(detail=False, methods=['get'])
     def featured(self, request):
         """Get featured posts (posts with featured images)"""
-        posts = Post.objects.filter(
+        posts = self.with_related(Post.objects.filter(
             status='published',
             featured_image__isnull=False
-        ).exclude(featured_image='').order_by('-publish_date')[:10]
+        )).exclude(featured_image='').order_by('-publish_date')[:10]
         
-        serializer = PostListSerializer(posts, many=True)
+        serializer = self.get_serializer(posts, many=True)
+        return Response(serializer.data)
+    
+    @method_decorator(versions.conditional(related_validators))
+    @action(detail=True, methods=['get'])
+    def related(self, request, slug=None):
+        """Published posts most similar to this one, best first"""
+        post = self.get_object()
+        posts = self.with_related(related.get_related_posts(post, limit=related.get_top_k()))
+        serializer = self.get_serializer(posts, many=True)
         return Response(serializer.data)
 
 
@@ -125,12 +333,22 @@ class PageViewSet(viewsets.ModelViewSet):
     queryset = Page.objects.all()
     serializer_class = PageSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # GET requests may read from a replica, see cms.replicas
+    replica_reads = True
     filter_backends = [SearchFilter, OrderingFilter]
     search_fields = ['title', 'content']
     ordering_fields = ['title', 'created_at', 'updated_at']
     ordering = ['title']
     lookup_field = 'slug'
     
+    @method_decorator(versions.conditional(page_list_validators))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
+    @method_decorator(versions.conditional(page_detail_validators))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+    
     def get_queryset(self):
         """
         Return published pages for anonymous users,
@@ -142,18 +360,21 @@ class PageViewSet(viewsets.ModelViewSet):
             return Page.objects.filter(is_published=True)
 
 
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     ViewSet for Comment CRUD operations
     """
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # GET requests may read from a replica, see cms.replicas
+    replica_reads = True
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
     filterset_fields = ['post', 'is_approved']
     search_fields = ['name', 'email', 'content']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         """
@@ -161,25 +382,80 @@ class CommentViewSet(viewsets.ModelViewSet):
         all comments for authenticated users
         """
         if self.request.user.is_authenticated:
-            return Comment.objects.all().select_related('post')
+            comments = Comment.objects.all()
         else:
-            return Comment.objects.filter(is_approved=True).select_related('post')
+            comments = Comment.objects.filter(is_approved=True)
+        return self.with_related(comments)
+    
+    @action(detail=False, methods=['get'], renderer_classes=[export.NDJSONRenderer, export.CSVRenderer])
+    def export(self, request):
+        """
+        Stream every comment visible to the user as NDJSON (default) or CSV
+        (``?format=csv``). Takes the list filters (post, is_approved, search)
+        plus ``?category=``, ``?author=`` (of the post) and ``?created_since=``.
+        Email addresses are only included for authenticated users.
+        """
+        comments = self.filter_queryset(self.get_queryset())
+        params = request.query_params
+        if params.get('category'):
+            comments = comments.filter(post__category=export.parse_id(params['category'], 'category'))
+        if params.get('author'):
+            comments = comments.filter(post__author=export.parse_id(params['author'], 'author'))
+        if params.get('created_since'):
+            comments = comments.filter(created_at__gte=export.parse_since(params['created_since'], 'created_since'))
+        fields = export.COMMENT_FIELDS
+        if not request.user.is_authenticated:
+            fields = [field for field in fields if field != 'email']
+        return export.streaming_export(
+            request.accepted_renderer, export.iter_comment_rows(comments, fields), fields, 'comments'
+        )
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def approve(self, request, pk=None):
         """Approve a comment"""
-        comment = self.get_object()
-        comment.is_approved = True
-        comment.save()
+        Comment.objects.filter(pk=self.get_object().pk).approve()
         return Response({'status': 'comment approved'})
     
     @action(detail=True, methods=['post'], permission_classes=[permissions.IsAuthenticated])
     def reject(self, request, pk=None):
         """Reject a comment"""
-        comment = self.get_object()
-        comment.is_approved = False
-        comment.save()
+        Comment.objects.filter(pk=self.get_object().pk).reject()
         return Response({'status': 'comment rejected'})
+    
+    @action(detail=False, methods=['post'], permission_classes=[permissions.IsAuthenticated])
+    def bulk_moderate(self, request):
+        """
+        Approve, reject or delete many comments at once. The body gives the
+        ``action`` and optionally ``ids``; the list filters in the query
+        string (post, is_approved, search) narrow the selection further.
+        Without ids or filters nothing is selected. Returns how many comments
+        were actually changed.
+        """
+        serializer = CommentModerationSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        moderation = serializer.validated_data['action']
+        ids = serializer.validated_data.get('ids')
+        
+        filters = set(self.filterset_fields) | {'search'}
+        if ids is None and not any(request.query_params.get(name) for name in filters):
+            return Response(
+                {'detail': 'Give the comment ids or at least one filter.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if ids is not None and len(ids) > bulk.get_max_items():
+            return Response(
+                {'detail': 'At most %d ids per request.' % bulk.get_max_items()},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        comments = self.filter_queryset(Comment.objects.all())
+        if ids is not None:
+            comments = comments.filter(pk__in=ids)
+        if moderation == 'delete':
+            count = comments.bulk_delete()
+        else:
+            count = getattr(comments, moderation)()
+        return Response({'action': moderation, 'count': count})
 
 
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
@@ -194,14 +470,17 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     ordering_fields = ['username', 'date_joined']
     ordering = ['username']
     
-    @action(detail=True, methods=['get'])
+    @action(detail=True, methods=['get'], pagination_class=KeysetPagination)
     def posts(self, request, pk=None):
-        """Get all posts by this user"""
+        """Get the posts by this user, one page at a time"""
         user = self.get_object()
-        posts = Post.objects.filter(author=user).order_by('-publish_date')
+        posts = Post.objects.filter(author=user).select_related(
+            'author', 'category'
+        ).prefetch_related('tags').order_by('-publish_date', '-id')
         
-        serializer = PostListSerializer(posts, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(posts)
+        serializer = PostListSerializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
 
 class SiteSettingsViewSet(viewsets.ModelViewSet):
@@ -211,10 +490,15 @@ class SiteSettingsViewSet(viewsets.ModelViewSet):
     queryset = SiteSettings.objects.all()
     serializer_class = SiteSettingsSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    # GET requests may read from a replica, see cms.replicas
+    replica_reads = True
     
     def get_queryset(self):
-        # Return the first (and should be only) SiteSettings instance
-        return SiteSettings.objects.all()[:1]
+        # Return the first (and should be only) SiteSettings instance; a
+        # subquery rather than a slice so detail lookups can filter it
+        return SiteSettings.objects.filter(
+            pk__in=SiteSettings.objects.order_by('pk').values('pk')[:1]
+        ).order_by('pk')
 
 
 class DashboardViewSet(viewsets.ViewSet):
@@ -225,39 +509,21 @@ class DashboardViewSet(viewsets.ViewSet):
     
     def list(self, request):
         """Get dashboard statistics"""
-        # Basic counts
-        total_posts = Post.objects.count()
-        published_posts = Post.objects.filter(status='published').count()
-        draft_posts = Post.objects.filter(status='draft').count()
-        total_comments = Comment.objects.count()
-        pending_comments = Comment.objects.filter(is_approved=False).count()
-        approved_comments = Comment.objects.filter(is_approved=True).count()
-        total_categories = Category.objects.count()
-        total_pages = Page.objects.count()
-        total_users = User.objects.count()
-        
-        # Recent activity
-        recent_posts = Post.objects.order_by('-created_at')[:5]
-        recent_comments = Comment.objects.order_by('-created_at')[:5]
-        
-        # Popular categories
-        popular_categories = Category.objects.annotate(
-            post_count=Count('posts')
-        ).order_by('-post_count')[:5]
+        stats = get_dashboard_stats()
         
         data = {
-            'total_posts': total_posts,
-            'published_posts': published_posts,
-            'draft_posts': draft_posts,
-            'total_comments': total_comments,
-            'pending_comments': pending_comments,
-            'approved_comments': approved_comments,
-            'total_categories': total_categories,
-            'total_pages': total_pages,
-            'total_users': total_users,
-            'recent_posts': recent_posts,
-            'recent_comments': recent_comments,
-            'popular_categories': popular_categories,
+            'total_posts': stats['total_posts'],
+            'published_posts': stats['published_posts'],
+            'draft_posts': stats['draft_posts'],
+            'total_comments': stats['total_comments'],
+            'pending_comments': stats['pending_comments'],
+            'approved_comments': stats['approved_comments'],
+            'total_categories': stats['total_categories'],
+            'total_pages': stats['total_pages'],
+            'total_users': stats['total_users'],
+            'recent_posts': Post.objects.select_related('author', 'category').prefetch_related('tags').order_by('-created_at')[:5],
+            'recent_comments': Comment.objects.select_related('post').order_by('-created_at')[:5],
+            'popular_categories': stats['top_categories'],
         }
         
         serializer = DashboardStatsSerializer(data)
@@ -265,43 +531,38 @@ class DashboardViewSet(viewsets.ViewSet):
     
     @action(detail=False, methods=['get'])
     def analytics(self, request):
-        """Get analytics data for charts"""
-        # Posts created over time (last 6 months)
-        now = timezone.now()
-        monthly_data = []
-        monthly_labels = []
-        
-        for i in range(5, -1, -1):
-            month_date = now - timedelta(days=i*30)
-            month_start = month_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            if i == 0:
-                month_end = now
-            else:
-                next_month = month_start.replace(month=month_start.month + 1) if month_start.month < 12 else month_start.replace(year=month_start.year + 1, month=1)
-                month_end = next_month - timedelta(days=1)
-            
-            posts_count = Post.objects.filter(
-                created_at__range=[month_start, month_end]
-            ).count()
-            
-            monthly_data.append(posts_count)
-            monthly_labels.append(month_date.strftime('%b %Y'))
-        
-        # Category distribution
-        category_stats = Category.objects.annotate(
-            post_count=Count('posts')
-        ).values('name', 'post_count').order_by('-post_count')
+        """
+        Get analytics data for charts, read from the daily rollups.
+        Accepts ?months= (default 6) and ?days= (default 30) ranges and
+        optional ?category= / ?author= ids.
+        """
+        params = request.query_params
+        try:
+            months = min(max(int(params.get('months', 6)), 1), 60)
+            days = min(max(int(params.get('days', 30)), 1), 366)
+            filters = {name: int(params[name]) if params.get(name) else None for name in ('category', 'author')}
+        except ValueError:
+            return Response(
+                {'detail': 'months, days, category and author must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        # Status distribution
-        status_stats = Post.objects.values('status').annotate(
-            count=Count('id')
-        ).order_by('-count')
+        monthly = rollups.monthly_series(months, **filters)
+        daily = rollups.daily_series(days, **filters)
         
         return Response({
             'monthly_posts': {
-                'labels': monthly_labels,
-                'data': monthly_data
+                'labels': [month.strftime('%b %Y') for month in monthly['periods']],
+                'data': monthly['posts_created']
+            },
+            'monthly_activity': {
+                'labels': [month.strftime('%b %Y') for month in monthly['periods']],
+                **{metric: monthly[metric] for metric in rollups.METRICS}
+            },
+            'daily_activity': {
+                'labels': [day.isoformat() for day in daily['dates']],
+                **{metric: daily[metric] for metric in rollups.METRICS}
             },
-            'category_distribution': list(category_stats),
-            'status_distribution': list(status_stats)
-        })
\ No newline at end of file
+            'category_distribution': get_category_distribution(),
+            'status_distribution': get_status_distribution()
+        })
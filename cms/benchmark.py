@@ -0,0 +1,459 @@
+"""
+Endpoint benchmarks on synthetic datasets
+
+``prepare()`` points the default database at a dataset file of its own
+(1k, 100k or 1M posts made by ``cms.sample_data``, seeded once and kept
+for later runs) and ``run()`` sends every URL of cms.urls and cms.api_urls
+through the Django test client, reporting per endpoint the latency
+percentiles, the query count and the peak Python memory of one request.
+Writes run in a transaction that is rolled back, so the dataset stays the
+same from run to run. ``compare()`` lists the regressions against the
+results of an earlier run.
+
+``concurrency()`` runs worker processes reading pages and posting comments
+at the same time against copies of the dataset, once per database profile
+(Django's SQLite defaults and the production profile of ``cms.sqlite``),
+and reports the throughput and the failed requests of each.
+"""
+import math
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import OperationalError, close_old_connections, connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from . import querybudget, sample_data, sqlite
+from .models import Comment, Page, Post, SiteSettings
+
+
+# Posts of each named dataset; comments and tags scale with them
+DATASETS = {'1k': 1_000, '100k': 100_000, '1m': 1_000_000}
+COMMENTS_PER_POST = 3
+SEED = 0
+
+# Every named URL: (method, login)
+ENDPOINTS = {
+    'cms:post_list': ('get', False),
+    'cms:post_detail': ('get', False),
+    'cms:page_detail': ('get', False),
+    'cms:category_detail': ('get', False),
+    'cms:search': ('get', False),
+    'cms:add_comment': ('post', False),
+    'cms:dashboard': ('get', True),
+    'cms:create_post': ('get', True),
+    'cms:edit_post': ('get', True),
+    'cms:create_page': ('get', True),
+    'api:api-root': ('get', False),
+    'api:category-list': ('get', False),
+    'api:category-detail': ('get', False),
+    'api:category-posts': ('get', False),
+    'api:post-list': ('get', False),
+    'api:post-bulk': ('post', True),
+    'api:post-export': ('get', False),
+    'api:post-featured': ('get', False),
+    'api:post-published': ('get', False),
+    'api:post-detail': ('get', False),
+    'api:post-add-comment': ('post', True),
+    'api:post-related': ('get', False),
+    'api:page-list': ('get', False),
+    'api:page-detail': ('get', False),
+    'api:comment-list': ('get', False),
+    'api:comment-bulk-moderate': ('post', True),
+    'api:comment-export': ('get', False),
+    'api:comment-detail': ('get', False),
+    'api:comment-approve': ('post', True),
+    'api:comment-reject': ('post', True),
+    'api:user-list': ('get', True),
+    'api:user-detail': ('get', True),
+    'api:user-posts': ('get', True),
+    'api:sitesettings-list': ('get', False),
+    'api:sitesettings-detail': ('get', False),
+    'api:dashboard-list': ('get', True),
+    'api:dashboard-analytics': ('get', True),
+}
+
+PERCENTILES = (50, 90, 99)
+
+BENCHMARK_USER = 'benchmark'
+
+# Database profiles of concurrency(): pragmas (None for CMS_SQLITE_PRAGMAS)
+# and CONN_MAX_AGE. The first one is what SQLite and Django do unconfigured.
+PROFILES = {
+    'default': ({'journal_mode': 'DELETE', 'synchronous': 'FULL'}, 0),
+    'production': (None, 60),
+}
+
+
+def use_database(path, using='default'):
+    """Point ``using`` at the SQLite file ``path`` and migrate it"""
+    connection = connections[using]
+    connection.close()
+    # As the test runner does for its test database
+    settings.DATABASES[using]['NAME'] = connection.settings_dict['NAME'] = str(path)
+    ContentType.objects.clear_cache()
+    call_command('migrate', database=using, interactive=False, verbosity=0)
+
+
+def prepare(dataset, directory, reseed=False, progress=None):
+    """
+    Switch to the database file of ``dataset`` in ``directory``, seeding it
+    first unless it is complete; returns the row counts of the dataset
+    """
+    posts = DATASETS[dataset]
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, '%s.sqlite3' % dataset)
+    if reseed and os.path.exists(path):
+        os.remove(path)
+    use_database(path)
+    if Post.objects.count() != posts:
+        # An interrupted seeding leaves an incomplete dataset: start over
+        connections['default'].close()
+        os.remove(path)
+        use_database(path)
+        sample_data.generate(
+            posts, comments_per_post=COMMENTS_PER_POST, seed=SEED, processes=os.cpu_count(), progress=progress
+        )
+    ensure_fixtures()
+    return describe_dataset(dataset)
+
+
+def ensure_fixtures():
+    """The rows every endpoint needs beyond posts: a page, settings, a superuser"""
+    if not Page.objects.filter(is_published=True).exists():
+        Page.objects.create(title='About', content='<p>About this site.</p>', is_published=True)
+    if not SiteSettings.objects.exists():
+        SiteSettings.objects.create(site_title='Benchmark site')
+    user = User.objects.filter(username=BENCHMARK_USER).first()
+    if user is None:
+        user = User.objects.create_superuser(BENCHMARK_USER, 'benchmark@example.com', None)
+    return user
+
+
+def describe_dataset(dataset):
+    return {
+        'name': dataset,
+        'posts': Post.objects.count(),
+        'comments': Comment.objects.count(),
+        'tagged_items': Post.tags.through.objects.count(),
+        'users': User.objects.count(),
+    }
+
+
+def describe_environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of ``values``"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+
+class Targets:
+    """URL arguments and request bodies for each endpoint"""
+    
+    def __init__(self):
+        self.post = Post.objects.filter(status='published').order_by('-publish_date', '-id').first()
+        self.page = Page.objects.filter(is_published=True).first()
+        self.settings_object = SiteSettings.objects.order_by('pk').first()
+        comments = Comment.objects.filter(post=self.post).order_by('pk')
+        self.approved = comments.filter(is_approved=True).first() or comments.first()
+        self.pending = comments.filter(is_approved=False).first() or self.approved
+        self.comment_ids = list(comments.values_list('pk', flat=True))
+        self.recent_posts = list(Post.objects.order_by('-id').values_list('pk', 'title')[:5])
+    
+    def url_kwargs(self, name):
+        if name in ('cms:post_detail', 'cms:add_comment', 'cms:edit_post', 'api:post-detail',
+                    'api:post-add-comment', 'api:post-related'):
+            return {'slug': self.post.slug}
+        if name in ('cms:category_detail', 'api:category-detail', 'api:category-posts'):
+            return {'slug': self.post.category.slug}
+        if name in ('cms:page_detail', 'api:page-detail'):
+            return {'slug': self.page.slug}
+        if name in ('api:comment-detail', 'api:comment-reject'):
+            return {'pk': self.approved.pk}
+        if name == 'api:comment-approve':
+            return {'pk': self.pending.pk}
+        if name in ('api:user-detail', 'api:user-posts'):
+            return {'pk': self.post.author_id}
+        if name == 'api:sitesettings-detail':
+            return {'pk': self.settings_object.pk}
+        return {}
+    
+    def data(self, name):
+        if name in ('cms:add_comment', 'api:post-add-comment'):
+            return {'name': 'Reader', 'email': 'reader@example.com', 'content': 'Thanks for writing this.'}
+        if name == 'cms:search':
+            return {'q': 'django sqlite'}
+        if name == 'api:comment-bulk-moderate':
+            return {'action': 'approve', 'ids': self.comment_ids}
+        if name == 'api:post-bulk':
+            return [{'id': pk, 'title': title + ' (updated)'} for pk, title in self.recent_posts]
+        return None
+
+
+def _request(client, name, method, path, data):
+    """Send one request, reading streamed bodies to the end"""
+    if method == 'get':
+        response = client.get(path, data)
+    elif name.startswith('api:'):
+        response = client.post(path, data, content_type='application/json')
+    else:
+        response = client.post(path, data)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def _rolled_back(method, send):
+    """Run ``send`` and undo what it wrote, so every request sees the same data"""
+    if method == 'get':
+        return send()
+    with transaction.atomic():
+        response = send()
+        transaction.set_rollback(True)
+    return response
+
+
+def measure(client, name, method, path, data, repeat, warmup):
+    send = lambda: _rolled_back(method, lambda: _request(client, name, method, path, data))
+    for _ in range(warmup):
+        send()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = send()
+        timings.append((time.perf_counter() - start) * 1000)
+    with querybudget.QueryRecorder() as recorder:
+        send()
+    tracemalloc.start()
+    try:
+        send()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    result = {
+        'method': method.upper(),
+        'path': path,
+        'status': response.status_code,
+        'latency_ms': {'p%d' % percent: round(percentile(timings, percent), 3) for percent in PERCENTILES},
+        'queries': recorder.count,
+        'db_ms': round(recorder.duration * 1000, 3),
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+    result['latency_ms'].update(
+        min=round(min(timings), 3), max=round(max(timings), 3), mean=round(sum(timings) / len(timings), 3)
+    )
+    return result
+
+
+def _overrides(spool_dir, page_cache=False):
+    """Settings of benchmark runs: production-like, without limits that would skew them"""
+    unlimited = (sys.maxsize, 1)
+    overrides = {
+        'DEBUG': False,
+        'ALLOWED_HOSTS': ['testserver'],
+        'CMS_QUERY_BUDGET': None,
+        'CMS_JOBS_EAGER': False,
+        'CMS_COMMENT_SPOOL_DIR': spool_dir,
+        'CMS_COMMENT_RATE_PER_IP': unlimited,
+        'CMS_COMMENT_RATE_PER_POST': unlimited,
+    }
+    if not page_cache:
+        overrides['CMS_PAGE_CACHE_TIMEOUT'] = 0
+    return overrides
+
+
+def run(repeat=20, warmup=2, names=None, page_cache=False, progress=None):
+    """
+    Benchmark the endpoints ``names`` (all of ENDPOINTS by default) on the
+    current database; returns ``{name: result}``. ``progress`` is called
+    with each name and result. The full-page cache is off unless
+    ``page_cache`` is set, to time the views themselves.
+    """
+    user = ensure_fixtures()
+    targets = Targets()
+    spool_dir = tempfile.mkdtemp(prefix='cms-benchmark-')
+    results = {}
+    try:
+        with override_settings(**_overrides(spool_dir, page_cache)):
+            for cache in caches.all():
+                cache.clear()
+            anonymous, staff = Client(), Client()
+            staff.force_login(user)
+            for name in names or ENDPOINTS:
+                method, login = ENDPOINTS[name]
+                path = reverse(name, kwargs=targets.url_kwargs(name))
+                results[name] = measure(
+                    staff if login else anonymous, name, method, path, targets.data(name), repeat, warmup
+                )
+                if progress:
+                    progress(name, results[name])
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance=0.25, min_delta_ms=1.0, min_delta_kb=64):
+    """
+    Regressions of ``results`` against ``baseline`` (both ``{name: result}``):
+    more queries, a median or p90 latency more than ``tolerance`` slower and
+    by at least ``min_delta_ms``, or peak memory that much larger and by at
+    least ``min_delta_kb``. Endpoints missing from either side are skipped.
+    """
+    found = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result['queries'] > before['queries']:
+            found.append('%s: %d queries, was %d' % (name, result['queries'], before['queries']))
+        for key in ('p50', 'p90'):
+            now, then = result['latency_ms'][key], before['latency_ms'][key]
+            if now > then * (1 + tolerance) and now - then >= min_delta_ms:
+                found.append('%s: %s %.2fms, was %.2fms' % (name, key, now, then))
+        now, then = result['peak_memory_kb'], before['peak_memory_kb']
+        if now > then * (1 + tolerance) and now - then >= min_delta_kb:
+            found.append('%s: peak memory %.0fKB, was %.0fKB' % (name, now, then))
+    return found
+
+
+def _copy_database(path, journal_mode):
+    """Copy the current database to ``path`` with the backup API, in ``journal_mode``"""
+    source = sqlite3.connect(connections['default'].settings_dict['NAME'], uri=True)
+    try:
+        target = sqlite3.connect(path)
+        try:
+            source.backup(target)
+            target.execute('PRAGMA journal_mode = %s' % journal_mode)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+def _concurrency_worker(task):
+    """
+    One process of concurrency(): requests until the deadline, reading
+    pages or, with a chance of ``write_ratio``, posting a comment. Returns
+    the latencies of the requests and the count of those that failed.
+    """
+    path, pragmas, max_age, start_at, duration, write_ratio, seed, paths = task
+    connections['default'].settings_dict.update(NAME=path, CONN_MAX_AGE=max_age)
+    rng = random.Random(seed)
+    client = Client()
+    comment = {'name': 'Reader', 'email': 'reader@example.com', 'content': 'Thanks for writing this.'}
+    result = {'reads': [], 'writes': [], 'locked': 0, 'failed': 0}
+    with override_settings(CMS_SQLITE_PRAGMAS=pragmas):
+        time.sleep(max(start_at - time.time(), 0))
+        while time.time() < start_at + duration:
+            write = rng.random() < write_ratio
+            # The request boundaries of a WSGI server, which the test client skips
+            close_old_connections()
+            start = time.perf_counter()
+            try:
+                if write:
+                    response = client.post(rng.choice(paths['writes']), comment)
+                else:
+                    response = client.get(rng.choice(paths['reads']))
+            except OperationalError as error:
+                result['locked' if 'locked' in str(error) else 'failed'] += 1
+                continue
+            finally:
+                close_old_connections()
+            if response.status_code >= 400:
+                result['failed'] += 1
+                continue
+            result['writes' if write else 'reads'].append((time.perf_counter() - start) * 1000)
+    connections.close_all()
+    return result
+
+
+def concurrency(workers=8, duration=10.0, write_ratio=0.2, profiles=None, progress=None):
+    """
+    Run ``workers`` processes sending requests for ``duration`` seconds
+    against a copy of the current database, once per profile of PROFILES
+    (all by default); returns ``{profile: result}`` with the requests per
+    second, the latency percentiles and the failed requests, those with
+    "database is locked" counted apart. Comments are saved on submission,
+    not spooled, and the full-page cache is on, as in production, so the
+    database rather than rendering limits the throughput. ``progress`` is
+    called with each profile and result.
+    """
+    ensure_fixtures()
+    posts = Post.objects.filter(status='published').select_related('category').order_by('-publish_date')[:50]
+    paths = {
+        'reads': [reverse('cms:post_list')] + [
+            reverse('cms:post_detail', kwargs={'slug': post.slug}) for post in posts
+        ],
+        'writes': [reverse('cms:add_comment', kwargs={'slug': post.slug}) for post in posts],
+    }
+    paths['reads'] += sorted({
+        reverse('cms:category_detail', kwargs={'slug': post.category.slug}) for post in posts if post.category
+    })
+    directory = tempfile.mkdtemp(prefix='cms-concurrency-')
+    results = {}
+    try:
+        with override_settings(**_overrides(None, page_cache=True)):
+            for name in profiles or PROFILES:
+                pragmas, max_age = PROFILES[name]
+                if pragmas is None:
+                    pragmas = sqlite.get_pragmas()
+                path = os.path.join(directory, '%s.sqlite3' % name)
+                _copy_database(path, pragmas.get('journal_mode', 'DELETE'))
+                for cache in caches.all():
+                    cache.clear()
+                # Children must not share the parent's database connections
+                connections.close_all()
+                start_at = time.time() + 1
+                tasks = [
+                    (path, pragmas, max_age, start_at, duration, write_ratio, '%s:%d' % (SEED, worker), paths)
+                    for worker in range(workers)
+                ]
+                with multiprocessing.get_context('fork').Pool(workers) as pool:
+                    outcomes = pool.map(_concurrency_worker, tasks)
+                results[name] = _summarize(outcomes, duration, pragmas, max_age)
+                if progress:
+                    progress(name, results[name])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def _summarize(outcomes, duration, pragmas, max_age):
+    reads = [latency for outcome in outcomes for latency in outcome['reads']]
+    writes = [latency for outcome in outcomes for latency in outcome['writes']]
+    result = {
+        'pragmas': pragmas,
+        'conn_max_age': max_age,
+        'requests_per_second': round((len(reads) + len(writes)) / duration, 1),
+        'reads': len(reads),
+        'writes': len(writes),
+        'locked': sum(outcome['locked'] for outcome in outcomes),
+        'failed': sum(outcome['failed'] for outcome in outcomes),
+    }
+    for key, latencies in (('read_latency_ms', reads), ('write_latency_ms', writes)):
+        if latencies:
+            result[key] = {'p%d' % percent: round(percentile(latencies, percent), 3) for percent in PERCENTILES}
+    return result
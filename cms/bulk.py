@@ -0,0 +1,208 @@
+"""
+Bulk create/update of posts (``/api/posts/bulk/``)
+
+Items are validated one by one but without per-item queries, then written
+in batches, each in its own transaction: new posts with ``bulk_create``,
+existing ones with ``bulk_update`` and all tags of the batch with a single
+pass over the tag tables that writes only the differences. Derived data
+(counters, rollups, search index, page cache) is refreshed once per batch
+through ``signals.post_bulk_update``.
+"""
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from . import signals
+from .models import Category, Post
+from .serializers import PostBulkItemSerializer
+
+
+# Columns populate_derived_fields() derives from content
+TEXT_FIELDS = {'content_text', 'word_count', 'reading_time'}
+
+
+def get_batch_size():
+    return getattr(settings, 'CMS_BULK_BATCH_SIZE', 200)
+
+
+def get_max_items():
+    return getattr(settings, 'CMS_BULK_MAX_ITEMS', 1000)
+
+
+def _as_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def bulk_save_posts(items, author, using='default', batch_size=None):
+    """
+    Create or update posts from a list of dicts and return one result per
+    item, in order: ``{'index', 'status': 'created'|'updated'|'error', ...}``.
+    Items with an ``id`` update that post; new posts belong to ``author``.
+    Invalid items are reported and skipped; the others are still written.
+    """
+    batch_size = batch_size or get_batch_size()
+    results = [None] * len(items)
+    objects = [item if isinstance(item, dict) else {} for item in items]
+    
+    category_ids = {_as_int(item.get('category')) for item in objects} - {None}
+    categories = Category.objects.using(using).in_bulk(category_ids)
+    post_ids = {_as_int(item.get('id')) for item in objects} - {None}
+    existing = Post.objects.using(using).in_bulk(post_ids)
+    
+    pending = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            results[index] = _error(index, {'non_field_errors': ['Expected an object.']})
+            continue
+        instance = None
+        if item.get('id') is not None:
+            instance = existing.get(_as_int(item['id']))
+            if instance is None:
+                results[index] = _error(index, {'id': ['Post not found.']})
+                continue
+        serializer = PostBulkItemSerializer(
+            instance, data=item, partial=instance is not None, context={'categories': categories}
+        )
+        if not serializer.is_valid():
+            results[index] = _error(index, serializer.errors)
+            continue
+        
+        data = dict(serializer.validated_data)
+        data.pop('id', None)
+        tags = data.pop('tags', None)
+        post = instance or Post(author=author)
+        for attr, value in data.items():
+            setattr(post, attr, value)
+        post.populate_derived_fields()
+        fields = set(data)
+        if 'publish_date' in fields:
+            # Moving the date can turn a published post into a scheduled one and back
+            fields.add('status')
+        pending.append((index, post, tags, fields))
+    
+    pending = _reject_duplicate_slugs(pending, results, using)
+    for start in range(0, len(pending), batch_size):
+        _write_batch(pending[start:start + batch_size], results, using)
+    return results
+
+
+def _error(index, errors):
+    return {'index': index, 'status': 'error', 'errors': errors}
+
+
+def _reject_duplicate_slugs(pending, results, using):
+    """Report new posts whose slug is taken, in the database or earlier in the request"""
+    new_slugs = [post.slug for _, post, _, _ in pending if post.pk is None]
+    taken = set(Post.objects.using(using).filter(slug__in=new_slugs).values_list('slug', flat=True))
+    accepted = []
+    for entry in pending:
+        index, post, _, _ = entry
+        if post.pk is None:
+            if post.slug in taken:
+                results[index] = _error(index, {'title': ['A post with this slug already exists.']})
+                continue
+            taken.add(post.slug)
+        accepted.append(entry)
+    return accepted
+
+
+def _write_batch(batch, results, using):
+    created = [post for _, post, _, _ in batch if post.pk is None]
+    updated = [post for _, post, _, _ in batch if post.pk is not None]
+    created_ids = {id(post) for post in created}
+    fields = set().union(*(fields for _, _, _, fields in batch))
+    try:
+        with transaction.atomic(using=using):
+            Post.objects.using(using).bulk_create(created)
+            if updated:
+                now = timezone.now()
+                for post in updated:
+                    post.updated_at = now
+                update_fields = set().union(
+                    *(fields for _, post, _, fields in batch if id(post) not in created_ids)
+                ) | {'slug', 'excerpt', 'updated_at'}
+                if 'content' in update_fields:
+                    update_fields |= TEXT_FIELDS
+                Post.objects.using(using).bulk_update(updated, sorted(update_fields))
+            
+            tags = {post.pk: names for _, post, names, _ in batch if names is not None}
+            if tags:
+                set_tags(tags, using=using)
+                fields.add('tags')
+            if created:
+                fields |= {'author', 'slug', 'excerpt'} | TEXT_FIELDS
+            signals.post_bulk_update.send(
+                sender=Post, pks=[post.pk for _, post, _, _ in batch], fields=fields, using=using
+            )
+    except DatabaseError as exc:
+        for index, post, _, _ in batch:
+            if id(post) in created_ids:
+                post.pk = None
+            results[index] = _error(index, {'non_field_errors': ['Batch failed: %s' % exc]})
+        return
+    
+    for index, post, _, _ in batch:
+        results[index] = {
+            'index': index,
+            'status': 'created' if id(post) in created_ids else 'updated',
+            'id': post.pk,
+            'slug': post.slug,
+        }
+
+
+def set_tags(tags_by_post, using='default'):
+    """
+    Set the tags of many posts at once (``{post_id: [name, ...]}``):
+    missing tags are created, then only the tag links that differ are
+    inserted or deleted.
+    """
+    through = Post.tags.through
+    tag_model = through.tag_model()
+    content_type = ContentType.objects.db_manager(using).get_for_model(Post)
+    
+    wanted = {post_id: list(dict.fromkeys(names)) for post_id, names in tags_by_post.items()}
+    names = set().union(*wanted.values())
+    tags = {tag.name: tag for tag in tag_model.objects.using(using).filter(name__in=names)}
+    missing = [name for name in names if name not in tags]
+    if missing:
+        _create_tags(tag_model, sorted(missing), tags, using)
+    
+    links = through.objects.using(using).filter(content_type=content_type, object_id__in=list(wanted))
+    current = {}
+    for link_id, object_id, tag_id in links.values_list('pk', 'object_id', 'tag_id'):
+        current.setdefault(object_id, {})[tag_id] = link_id
+    
+    to_add, to_remove = [], []
+    for post_id, post_names in wanted.items():
+        wanted_ids = {tags[name].pk for name in post_names}
+        linked = current.get(post_id, {})
+        to_add.extend(
+            through(content_type=content_type, object_id=post_id, tag_id=tag_id)
+            for tag_id in wanted_ids - set(linked)
+        )
+        to_remove.extend(link_id for tag_id, link_id in linked.items() if tag_id not in wanted_ids)
+    if to_remove:
+        through.objects.using(using).filter(pk__in=to_remove).delete()
+    if to_add:
+        through.objects.using(using).bulk_create(to_add)
+
+
+def _create_tags(tag_model, names, tags, using):
+    slugs = {name: tag_model().slugify(name) for name in names}
+    taken = set(tag_model.objects.using(using).filter(slug__in=slugs.values()).values_list('slug', flat=True))
+    new_tags = []
+    for name in names:
+        if slugs[name] in taken:
+            # Let the tag model pick a unique slug
+            tag = tag_model(name=name)
+            tag.save(using=using)
+            tags[name] = tag
+        else:
+            taken.add(slugs[name])
+            new_tags.append(tag_model(name=name, slug=slugs[name]))
+    for tag in tag_model.objects.using(using).bulk_create(new_tags):
+        tags[tag.name] = tag
@@ -0,0 +1,214 @@
+"""
+Write-behind intake of visitor comments
+
+Submitting a comment does not touch the database: once validated and let
+through by the rate limits, it is written as a small JSON file to the
+spool directory (``CMS_COMMENT_SPOOL_DIR``) and the visitor is told it
+awaits approval. A single writer (``flush_comments``, serialized by a
+lock file) drains the spool in batches, one transaction and one
+``bulk_create`` per batch, so a spam flood turns into a few short write
+transactions instead of one per submission contending for the SQLite
+write lock with everyone else.
+
+The writer claims a batch by renaming its files before the insert and
+deletes them after the commit. Files still claimed at the next flush
+belong to a writer that died mid-batch: their comments are written unless
+an identical one is already stored, so a crash neither loses nor
+duplicates them. Files that are not a valid comment are renamed aside
+(``*.rejected``) with a warning instead of blocking the spool.
+
+With no spool directory configured, comments are saved immediately.
+"""
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from . import ratelimit, signals
+from .models import Comment, Post
+
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.json'
+CLAIMED_SUFFIX = '.claimed'
+REJECTED_SUFFIX = '.rejected'
+LOCK_FILE = '.writer.lock'
+RECORD_FIELDS = ('name', 'email', 'content')
+
+
+def get_spool_dir():
+    return getattr(settings, 'CMS_COMMENT_SPOOL_DIR', None)
+
+
+def get_rate_limits():
+    """``(capacity, period)`` of the per-IP and per-post buckets"""
+    return (
+        getattr(settings, 'CMS_COMMENT_RATE_PER_IP', (5, 60)),
+        getattr(settings, 'CMS_COMMENT_RATE_PER_POST', (30, 60)),
+    )
+
+
+def check_rate_limit(request, post):
+    """
+    Take a token from the visitor's and the post's buckets. Returns 0 when
+    the comment may go through, otherwise the seconds to wait.
+    """
+    per_ip, per_post = get_rate_limits()
+    return ratelimit.consume_all([
+        ratelimit.TokenBucket('comment-ip:%s' % request.META.get('REMOTE_ADDR', ''), *per_ip),
+        ratelimit.TokenBucket('comment-post:%s' % post.pk, *per_post),
+    ])
+
+
+def submit(post, name, email, content):
+    """Accept a validated comment on ``post``; it is stored unapproved"""
+    spool_dir = get_spool_dir()
+    if not spool_dir:
+        Comment.objects.create(post=post, name=name, email=email, content=content)
+        return
+    record = {
+        'post_id': post.pk,
+        'name': name,
+        'email': email,
+        'content': content,
+    }
+    os.makedirs(spool_dir, exist_ok=True)
+    # Sortable by arrival; written aside and renamed so the writer never
+    # reads a partial file
+    filename = '%d-%s' % (time.time_ns(), uuid.uuid4().hex)
+    temporary = os.path.join(spool_dir, '.%s.tmp' % filename)
+    with open(temporary, 'w', encoding='utf-8') as spool_file:
+        json.dump(record, spool_file)
+    os.replace(temporary, os.path.join(spool_dir, filename + SUFFIX))
+
+
+@contextmanager
+def _writer_lock(spool_dir):
+    """Yield True if this process is the single writer, False if another is"""
+    with open(os.path.join(spool_dir, LOCK_FILE), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def pending(suffix=SUFFIX):
+    spool_dir = get_spool_dir()
+    if not spool_dir or not os.path.isdir(spool_dir):
+        return []
+    return sorted(name for name in os.listdir(spool_dir) if name.endswith(suffix) and not name.startswith('.'))
+
+
+def flush(batch_size=500, using='default'):
+    """
+    Write spooled comments to the database in batches and return how many
+    were written. Returns 0 at once if another writer is running.
+    """
+    spool_dir = get_spool_dir()
+    if not spool_dir or not os.path.isdir(spool_dir):
+        return 0
+    written = 0
+    with _writer_lock(spool_dir) as is_writer:
+        if not is_writer:
+            return 0
+        # Left claimed by a writer that died mid-batch
+        names = pending(CLAIMED_SUFFIX)
+        for start in range(0, len(names), batch_size):
+            written += _write_batch(spool_dir, names[start:start + batch_size], using, recovering=True)
+        names = pending()
+        for start in range(0, len(names), batch_size):
+            written += _write_batch(spool_dir, _claim(spool_dir, names[start:start + batch_size]), using)
+    return written
+
+
+def _claim(spool_dir, names):
+    claimed = []
+    for name in names:
+        try:
+            os.replace(os.path.join(spool_dir, name), os.path.join(spool_dir, name + CLAIMED_SUFFIX))
+        except FileNotFoundError:
+            continue
+        claimed.append(name + CLAIMED_SUFFIX)
+    return claimed
+
+
+def _read_record(path):
+    """The comment spooled in ``path``; raises ValueError if it is not one"""
+    with open(path, encoding='utf-8') as spool_file:
+        record = json.load(spool_file)
+    if not isinstance(record, dict):
+        raise ValueError('not an object')
+    if not isinstance(record.get('post_id'), int) or isinstance(record['post_id'], bool):
+        raise ValueError('post_id is not an integer')
+    for field in RECORD_FIELDS:
+        if not isinstance(record.get(field), str):
+            raise ValueError('%s is not a string' % field)
+    return record
+
+
+def _reject(spool_dir, name):
+    base = name[:-len(CLAIMED_SUFFIX)] if name.endswith(CLAIMED_SUFFIX) else name
+    try:
+        os.replace(os.path.join(spool_dir, name), os.path.join(spool_dir, base + REJECTED_SUFFIX))
+    except FileNotFoundError:
+        pass
+
+
+def _write_batch(spool_dir, names, using, recovering=False):
+    records = []
+    for name in names:
+        try:
+            records.append(_read_record(os.path.join(spool_dir, name)))
+        except (OSError, ValueError) as exc:
+            logger.warning('Rejecting spooled comment %s: %s', name, exc)
+            _reject(spool_dir, name)
+    post_ids = set(
+        Post.objects.using(using).filter(pk__in={record['post_id'] for record in records}).values_list('pk', flat=True)
+    )
+    records = [record for record in records if record['post_id'] in post_ids]
+    if recovering:
+        # Their batch may have been committed before the writer died
+        records = [
+            record for record in records
+            if not Comment.objects.using(using).filter(
+                post_id=record['post_id'], **{field: record[field] for field in RECORD_FIELDS}
+            ).exists()
+        ]
+    comments = [
+        Comment(
+            post_id=record['post_id'],
+            name=record['name'],
+            email=record['email'],
+            content=record['content'],
+            is_approved=False,
+        )
+        for record in records
+    ]
+    with transaction.atomic(using=using):
+        Comment.objects.using(using).bulk_create(comments)
+        if comments:
+            # New rows have no previous post, so 'post' is left out and
+            # only their own posts are recounted
+            signals.post_bulk_update.send(
+                sender=Comment, pks=[comment.pk for comment in comments],
+                fields={'name', 'email', 'content', 'is_approved'}, using=using
+            )
+    for name in names:
+        try:
+            # Rejected files were renamed already
+            os.remove(os.path.join(spool_dir, name))
+        except FileNotFoundError:
+            pass
+    return len(comments)
@@ -0,0 +1,51 @@
+"""
+Denormalized counters kept on Post and Category
+
+Each refresh is a single UPDATE that recomputes the counter from the source
+rows with a correlated subquery, so it is atomic and can never drift
+regardless of the order concurrent writers run in.
+"""
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Category, Comment, Post
+
+
+def _count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def refresh_post_counters(post_ids=None, using='default'):
+    """
+    Recompute ``approved_comment_count``/``total_comment_count`` for the given
+    posts (all posts when ``post_ids`` is None).
+    """
+    posts = Post.objects.using(using)
+    if post_ids is not None:
+        post_ids = {pk for pk in post_ids if pk is not None}
+        if not post_ids:
+            return 0
+        posts = posts.filter(pk__in=post_ids)
+    comments = Comment.objects.using(using)
+    return posts.update(
+        total_comment_count=_count_subquery(comments, 'post'),
+        approved_comment_count=_count_subquery(comments.filter(is_approved=True), 'post'),
+    )
+
+
+def refresh_category_counters(category_ids=None, using='default'):
+    """
+    Recompute ``published_post_count`` for the given categories (all
+    categories when ``category_ids`` is None).
+    """
+    categories = Category.objects.using(using)
+    if category_ids is not None:
+        category_ids = {pk for pk in category_ids if pk is not None}
+        if not category_ids:
+            return 0
+        categories = categories.filter(pk__in=category_ids)
+    published = Post.objects.using(using).filter(status='published')
+    return categories.update(published_post_count=_count_subquery(published, 'category'))
@@ -0,0 +1,160 @@
+"""
+Streaming exports of posts and comments as NDJSON or CSV
+
+Rows are read with ``values().iterator(chunk_size=...)`` and written out as
+they arrive through a ``StreamingHttpResponse``, so memory stays flat however
+many rows are exported. Post tags are fetched with one query per chunk.
+"""
+import csv
+import json
+from datetime import datetime, time
+from itertools import islice
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Post
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+POST_FIELDS = [
+    'id', 'title', 'slug', 'status', 'author_id', 'author_username', 'category_id', 'category_slug',
+    'excerpt', 'content', 'meta_description', 'featured_image', 'publish_date', 'created_at',
+    'updated_at', 'approved_comment_count', 'total_comment_count', 'word_count', 'reading_time',
+]
+
+COMMENT_FIELDS = ['id', 'post_id', 'post_slug', 'name', 'email', 'content', 'is_approved', 'created_at']
+
+# Export columns read from related tables
+RELATED_FIELDS = {
+    'author_username': F('author__username'),
+    'category_slug': F('category__slug'),
+    'post_slug': F('post__slug'),
+}
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON: one object per line"""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Non-streamed responses (errors) become a single line
+        return ''.join(self.stream([data] if isinstance(data, dict) else data or [], None))
+    
+    def stream(self, rows, fields):
+        for row in rows:
+            if fields:
+                row = {field: row.get(field) for field in fields}
+            yield json.dumps(row, cls=JSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes"""
+    
+    def write(self, value):
+        return value
+
+
+class CSVRenderer(BaseRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = [data] if isinstance(data, dict) else list(data or [])
+        fields = list(rows[0]) if rows else []
+        return ''.join(self.stream(rows, fields))
+    
+    def stream(self, rows, fields):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fields)
+        for row in rows:
+            yield writer.writerow([self._cell(row.get(field)) for field in fields])
+    
+    def _cell(self, value):
+        if value is None:
+            return ''
+        if isinstance(value, (list, tuple)):
+            return ','.join(str(item) for item in value)
+        if hasattr(value, 'isoformat'):
+            return value.isoformat()
+        return value
+
+
+def parse_id(value, param):
+    """Parse an id query parameter"""
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({param: 'Enter a whole number.'})
+
+
+def parse_since(value, param):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError({param: 'Enter an ISO 8601 date or datetime.'})
+        parsed = datetime.combine(date, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _values(queryset, fields):
+    return queryset.order_by('pk').values(
+        *[field for field in fields if field not in RELATED_FIELDS],
+        **{field: RELATED_FIELDS[field] for field in fields if field in RELATED_FIELDS}
+    )
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_post_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """Post rows as plain dicts, with ``tags`` and the image URL filled in"""
+    rows = _values(queryset, POST_FIELDS).iterator(chunk_size=chunk_size)
+    through = Post.tags.through
+    content_type = ContentType.objects.db_manager(queryset.db).get_for_model(Post)
+    for chunk in _chunks(rows, chunk_size):
+        tags = {}
+        for object_id, name in through.objects.using(queryset.db).filter(
+            content_type=content_type, object_id__in=[row['id'] for row in chunk]
+        ).order_by('tag__name').values_list('object_id', 'tag__name'):
+            tags.setdefault(object_id, []).append(name)
+        for row in chunk:
+            row['tags'] = tags.get(row['id'], [])
+            if row['featured_image']:
+                row['featured_image'] = default_storage.url(row['featured_image'])
+            yield row
+
+
+def iter_comment_rows(queryset, fields=COMMENT_FIELDS, chunk_size=EXPORT_CHUNK_SIZE):
+    return _values(queryset, fields).iterator(chunk_size=chunk_size)
+
+
+def streaming_export(renderer, rows, fields, filename):
+    """Stream ``rows`` (an iterator of dicts) through an export renderer"""
+    response = StreamingHttpResponse(
+        renderer.stream(rows, fields),
+        content_type='%s; charset=%s' % (renderer.media_type, renderer.charset)
+    )
+    response['Content-Disposition'] = 'attachment; filename="%s.%s"' % (filename, renderer.format)
+    return response
@@ -0,0 +1,176 @@
+"""
+Responsive image derivatives for uploaded images
+
+When a post's featured image or the site logo is uploaded, a background
+job (see cms.jobs) renders it at the widths in ``CMS_IMAGE_WIDTHS``, as
+WebP and in a fallback format (PNG for images with transparency, JPEG
+otherwise). Files
+are content-addressed: they live under ``derivatives/<digest>/``, where the
+digest covers the source bytes and the encoding settings, so identical
+uploads share their files and derivatives never go stale.
+
+The list of derivatives is stored next to the image, in a JSON field named
+``<image field>_derivatives`` that also records which upload it was made
+from. Until the worker is done (or when the list belongs to a previous
+upload) pages simply use the original image.
+"""
+import hashlib
+import io
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps, features
+
+from . import jobs, signals
+
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVES_DIR = 'derivatives'
+
+# Encoder options by format; part of the digest, so changing them
+# produces new files
+ENCODERS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+    'png': {'format': 'PNG', 'optimize': True},
+}
+
+MIME_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+
+
+def get_widths():
+    return sorted(set(getattr(settings, 'CMS_IMAGE_WIDTHS', (320, 640, 960, 1280))))
+
+
+def derivatives_field(field_name):
+    return '%s_derivatives' % field_name
+
+
+def get_derivatives(instance, field_name):
+    """
+    The derivatives of ``instance.<field_name>`` as a list of
+    ``{'width', 'height', 'format', 'name'}``, or an empty list when there
+    is no image or its derivatives are not ready.
+    """
+    image = getattr(instance, field_name)
+    manifest = getattr(instance, derivatives_field(field_name)) or {}
+    if not image or manifest.get('source') != image.name:
+        return []
+    return manifest.get('renditions', [])
+
+
+def needs_derivatives(instance, field_name):
+    image = getattr(instance, field_name)
+    manifest = getattr(instance, derivatives_field(field_name)) or {}
+    return bool(image) and manifest.get('source') != image.name
+
+
+def srcset(renditions, storage, image_format):
+    return ', '.join(
+        '%s %sw' % (storage.url(rendition['name']), rendition['width'])
+        for rendition in renditions if rendition['format'] == image_format
+    )
+
+
+def _fallback_format(image, source_format):
+    has_alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+    return 'png' if has_alpha or source_format == 'PNG' else 'jpeg'
+
+
+def _encode(image, image_format):
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, **ENCODERS[image_format])
+    return buffer.getvalue()
+
+
+def render_derivatives(image_file, storage):
+    """
+    Write the derivatives of an image file to ``storage`` (skipping files
+    that already exist) and return the manifest to store with the image.
+    Unreadable images get a manifest without renditions.
+    """
+    image_file.open('rb')
+    try:
+        data = image_file.read()
+    finally:
+        image_file.close()
+    manifest = {'source': image_file.name, 'renditions': []}
+    try:
+        image = Image.open(io.BytesIO(data))
+        source_format = image.format
+        image.load()
+    except (OSError, ValueError, Image.DecompressionBombError) as exc:
+        logger.warning('Cannot read image %s: %s', image_file.name, exc)
+        return manifest
+    
+    image = ImageOps.exif_transpose(image)
+    width, height = image.size
+    formats = ['webp'] if features.check('webp') else []
+    formats.append(_fallback_format(image, source_format))
+    widths = sorted({min(target, width) for target in get_widths()})
+    
+    digest = hashlib.sha1(data + repr((widths, formats, ENCODERS)).encode('utf-8')).hexdigest()
+    directory = '%s/%s/%s' % (DERIVATIVES_DIR, digest[:2], digest)
+    for target in widths:
+        target_height = max(round(height * target / width), 1)
+        resized = image if target == width else image.resize((target, target_height), Image.LANCZOS)
+        for image_format in formats:
+            name = '%s/%sw.%s' % (directory, target, 'jpg' if image_format == 'jpeg' else image_format)
+            if not storage.exists(name):
+                saved = storage.save(name, ContentFile(_encode(resized, image_format)))
+                if saved != name:
+                    # Another worker wrote the same file in the meantime
+                    storage.delete(saved)
+            manifest['renditions'].append(
+                {'width': target, 'height': target_height, 'format': image_format, 'name': name}
+            )
+    return manifest
+
+
+def generate(model, pk, field_name, using='default', force=False):
+    """
+    Render the derivatives of one object's image and store their manifest,
+    unless they are already there (``force`` renders them anyway) or the
+    image was replaced in the meantime. Sends
+    ``signals.image_derivatives_ready`` once stored; returns whether it was.
+    """
+    manifest_field = derivatives_field(field_name)
+    instance = model._default_manager.using(using).filter(pk=pk).only(field_name, manifest_field).first()
+    if instance is None or not getattr(instance, field_name):
+        return False
+    if not force and not needs_derivatives(instance, field_name):
+        return False
+    image = getattr(instance, field_name)
+    manifest = render_derivatives(image, image.storage)
+    updated = model._default_manager.using(using).filter(pk=pk, **{field_name: image.name}).update(
+        **{manifest_field: manifest}
+    )
+    if updated:
+        signals.image_derivatives_ready.send(sender=model, pk=pk, field=field_name, using=using)
+    return bool(updated)
+
+
+@jobs.task(priority=50)
+def render_job(model, pk, field, using='default'):
+    generate(apps.get_model(model), pk, field, using=using)
+
+
+def schedule(instance, field_name, using='default'):
+    """
+    Queue the rendering of ``instance.<field_name>``'s derivatives; call
+    from the transaction saving the upload.
+    """
+    label = instance._meta.label_lower
+    jobs.enqueue(
+        render_job,
+        {'model': label, 'pk': instance.pk, 'field': field_name, 'using': using},
+        dedup_key='images:%s:%s:%s' % (label, instance.pk, field_name),
+        using=using,
+    )
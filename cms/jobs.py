@@ -0,0 +1,213 @@
+"""
+Durable background jobs kept in the database
+
+Work that should not hold up a request (image rendering and the like) is
+recorded as a ``Job`` row, usually from a signal receiver and inside the
+transaction that caused it, so a job exists exactly when its cause was
+committed. ``run_workers`` processes claim queued jobs by priority with an
+atomic ``UPDATE ... WHERE status = 'queued'``, which works on SQLite and
+needs no broker. Failed jobs are retried with exponential backoff; jobs
+whose worker died are picked up again once their lock times out.
+
+    @jobs.task(priority=50)
+    def warm_page(path):
+        ...
+    
+    jobs.enqueue(warm_page, {'path': '/'}, dedup_key='warm:/')
+"""
+import logging
+import os
+import random
+import socket
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRIORITY = 100
+
+
+def get_max_attempts():
+    return getattr(settings, 'CMS_JOBS_MAX_ATTEMPTS', 5)
+
+
+def get_retry_delay():
+    """Seconds before the first retry; doubled for every further attempt"""
+    return getattr(settings, 'CMS_JOBS_RETRY_DELAY', 10)
+
+
+def get_lock_timeout():
+    """Seconds after which a running job is presumed abandoned"""
+    return getattr(settings, 'CMS_JOBS_LOCK_TIMEOUT', 600)
+
+
+def get_keep_done():
+    """Seconds finished jobs are kept before being deleted"""
+    return getattr(settings, 'CMS_JOBS_KEEP_DONE', 24 * 60 * 60)
+
+
+def is_eager():
+    """
+    Run jobs in-process on commit instead of queueing them (development).
+    Delayed jobs are dropped, so scheduled posts wait for ``publish_scheduled``.
+    """
+    return getattr(settings, 'CMS_JOBS_EAGER', False)
+
+
+def task(func=None, *, priority=DEFAULT_PRIORITY, max_attempts=None):
+    """
+    Mark a function as runnable by the workers. Jobs call it with the
+    keyword arguments given to ``enqueue()``, which must be JSON-serializable.
+    """
+    def decorate(func):
+        func.job_name = '%s.%s' % (func.__module__, func.__qualname__)
+        func.job_priority = priority
+        func.job_max_attempts = max_attempts
+        return func
+    
+    return decorate(func) if func is not None else decorate
+
+
+def resolve(name):
+    func = import_string(name)
+    if getattr(func, 'job_name', None) != name:
+        raise ImportError('%s is not a job task' % name)
+    return func
+
+
+def enqueue(func, kwargs=None, priority=None, dedup_key=None, delay=0, using='default'):
+    """
+    Queue a call of the task ``func`` (a function or its import path). When
+    a queued job with the same ``dedup_key`` exists, nothing is added. Call
+    this inside the transaction making the change the job follows up on.
+    """
+    if isinstance(func, str):
+        func = resolve(func)
+    kwargs = kwargs or {}
+    if is_eager():
+        if delay > 0:
+            # Nothing in-process can wait for it; a job that queues its own
+            # follow-up would otherwise run again and again at once
+            logger.debug('Eager mode: not running delayed job %s', func.job_name)
+            return
+        transaction.on_commit(lambda: func(**kwargs), using=using)
+        return
+    max_attempts = func.job_max_attempts or get_max_attempts()
+    Job.objects.using(using).bulk_create([
+        Job(
+            name=func.job_name,
+            kwargs=kwargs,
+            priority=func.job_priority if priority is None else priority,
+            dedup_key=dedup_key or None,
+            max_attempts=max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+    ], ignore_conflicts=True)
+
+
+def backoff(attempts):
+    """Delay before retrying a job that failed ``attempts`` times, with jitter"""
+    delay = get_retry_delay() * 2 ** (attempts - 1)
+    return min(delay, 6 * 60 * 60) * random.uniform(0.8, 1.2)
+
+
+class Worker:
+    """
+    Runs queued jobs one at a time. Any number of workers, in any number
+    of processes, can share a queue.
+    """
+    
+    def __init__(self, using='default', poll_interval=1.0, name=None):
+        self.using = using
+        self.poll_interval = poll_interval
+        self.name = name or '%s:%s' % (socket.gethostname(), os.getpid())
+        self.stopping = False
+        self._last_maintenance = None
+    
+    @property
+    def jobs(self):
+        return Job.objects.using(self.using)
+    
+    def stop(self, *args):
+        """Finish the current job, then return from run()"""
+        self.stopping = True
+    
+    def run(self, burst=False):
+        """Process jobs until stopped; with ``burst``, until the queue is empty"""
+        while not self.stopping:
+            close_old_connections()
+            try:
+                self.maintain()
+                job = self.claim()
+            except DatabaseError as exc:
+                # Typically SQLite's "database is locked" under contention
+                logger.warning('Worker %s cannot claim a job: %s', self.name, exc)
+                job = None
+            if job is not None:
+                self.execute(job)
+            elif burst:
+                return
+            else:
+                time.sleep(self.poll_interval)
+    
+    def claim(self):
+        """Lock and return the next runnable job, or None"""
+        now = timezone.now()
+        candidates = self.jobs.filter(status='queued', run_at__lte=now).order_by(
+            'priority', 'run_at', 'id'
+        ).values_list('pk', flat=True)[:10]
+        for pk in candidates:
+            claimed = self.jobs.filter(pk=pk, status='queued').update(
+                status='running', locked_by=self.name, locked_at=now, attempts=F('attempts') + 1
+            )
+            if claimed:
+                return self.jobs.get(pk=pk)
+        return None
+    
+    def execute(self, job):
+        try:
+            resolve(job.name)(**job.kwargs)
+        except Exception:
+            logger.exception('Job %s (%s) failed', job.pk, job.name)
+            self.fail(job, traceback.format_exc())
+        else:
+            self.jobs.filter(pk=job.pk).update(status='done', finished_at=timezone.now(), last_error='')
+    
+    def fail(self, job, error):
+        now = timezone.now()
+        if job.attempts >= job.max_attempts:
+            self.jobs.filter(pk=job.pk).update(status='failed', finished_at=now, last_error=error)
+            return
+        try:
+            with transaction.atomic(using=self.using):
+                self.jobs.filter(pk=job.pk).update(
+                    status='queued', locked_by='', run_at=now + timedelta(seconds=backoff(job.attempts)),
+                    last_error=error
+                )
+        except IntegrityError:
+            # The same work was queued again meanwhile; that job will do it
+            self.jobs.filter(pk=job.pk).update(status='failed', finished_at=now, last_error=error)
+    
+    def maintain(self):
+        """Every minute: requeue abandoned jobs and delete old finished ones"""
+        now = timezone.now()
+        if self._last_maintenance and now - self._last_maintenance < timedelta(minutes=1):
+            return
+        self._last_maintenance = now
+        abandoned = self.jobs.filter(
+            status='running', locked_at__lt=now - timedelta(seconds=get_lock_timeout())
+        ).values_list('pk', 'attempts', 'max_attempts')
+        for pk, attempts, max_attempts in abandoned:
+            job = Job(pk=pk, attempts=attempts, max_attempts=max_attempts)
+            self.fail(job, 'Abandoned by its worker')
+        self.jobs.filter(status='done', finished_at__lt=now - timedelta(seconds=get_keep_done())).delete()
@@ -0,0 +1,167 @@
+"""
+Django management command to benchmark every endpoint on a synthetic dataset
+"""
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from cms import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark every view and API endpoint on a generated dataset of its own and '
+        'report latency percentiles, query counts and peak memory as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dataset', choices=sorted(benchmark.DATASETS, key=benchmark.DATASETS.get), default='1k',
+            help='Dataset size in posts (default: 1k); seeded on first use and kept'
+        )
+        parser.add_argument(
+            '--directory', default=str(settings.BASE_DIR / 'var' / 'benchmark'),
+            help='Directory holding the dataset databases (default: var/benchmark)'
+        )
+        parser.add_argument(
+            '--reseed', action='store_true',
+            help='Regenerate the dataset even if it exists'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Timed requests per endpoint (default: 20)'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Untimed requests per endpoint before timing (default: 2)'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints', choices=sorted(benchmark.ENDPOINTS), metavar='NAME',
+            help='Benchmark only this URL name, e.g. "cms:post_list" (repeatable)'
+        )
+        parser.add_argument(
+            '--page-cache', action='store_true',
+            help='Keep the full-page cache on (default: off, to time the views themselves)'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, metavar='WORKERS',
+            help=(
+                'Instead of timing each endpoint, run WORKERS processes reading pages and posting '
+                'comments at once, with each database profile, and compare their throughput'
+            )
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='Seconds each concurrency run lasts (default: 10)'
+        )
+        parser.add_argument(
+            '--write-ratio', type=float, default=0.2,
+            help='Share of concurrency requests posting a comment (default: 0.2)'
+        )
+        parser.add_argument(
+            '--profile', action='append', dest='profiles', choices=list(benchmark.PROFILES),
+            help='Database profile of the concurrency runs (repeatable; default: all)'
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of stdout'
+        )
+        parser.add_argument(
+            '--baseline',
+            help='JSON report of an earlier run; exit with an error on regressions against it'
+        )
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help='Allowed slowdown and memory growth as a fraction of the baseline (default: 0.25)'
+        )
+        parser.add_argument(
+            '--min-delta-ms', type=float, default=1.0,
+            help='Latency increases below this many milliseconds are noise (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        if options['concurrency'] is not None and options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        if options['concurrency'] and options['baseline']:
+            raise CommandError('--baseline applies to endpoint timings, not to --concurrency.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+            if baseline['dataset']['name'] != options['dataset']:
+                raise CommandError(
+                    f"The baseline was measured on the {baseline['dataset']['name']} dataset, not {options['dataset']}."
+                )
+
+        total = benchmark.DATASETS[options['dataset']]
+
+        def seeded(posts):
+            if posts == total or posts % max(total // 10, 1) == 0:
+                self.stderr.write(f'Seeded {posts}/{total} posts')
+
+        dataset = benchmark.prepare(options['dataset'], options['directory'], options['reseed'], progress=seeded)
+
+        if options['concurrency']:
+            self.concurrency(dataset, options)
+            return
+
+        def measured(name, result):
+            latency = result['latency_ms']
+            self.stderr.write(
+                f"{name:28} {result['status']} p50 {latency['p50']:8.2f}ms  p90 {latency['p90']:8.2f}ms  "
+                f"{result['queries']:3} queries  {result['peak_memory_kb']:8.0f}KB"
+            )
+
+        results = benchmark.run(
+            repeat=options['repeat'], warmup=options['warmup'], names=options['endpoints'],
+            page_cache=options['page_cache'], progress=measured
+        )
+        report = {
+            'dataset': dataset,
+            'environment': benchmark.describe_environment(),
+            'options': {key: options[key] for key in ('repeat', 'warmup', 'page_cache')},
+            'endpoints': results,
+        }
+        regressions = []
+        if baseline is not None:
+            regressions = benchmark.compare(
+                results, baseline['endpoints'], tolerance=options['tolerance'], min_delta_ms=options['min_delta_ms']
+            )
+            report['regressions'] = regressions
+
+        self.write_report(report, options)
+
+        if regressions:
+            raise CommandError('%d regressions against %s:\n  %s' % (
+                len(regressions), options['baseline'], '\n  '.join(regressions)
+            ))
+
+    def concurrency(self, dataset, options):
+        def measured(name, result):
+            self.stderr.write(
+                f"{name:12} {result['requests_per_second']:8.1f} requests/s  {result['reads']:6} reads  "
+                f"{result['writes']:6} writes  {result['locked']:4} locked  {result['failed']:4} failed"
+            )
+
+        results = benchmark.concurrency(
+            workers=options['concurrency'], duration=options['duration'], write_ratio=options['write_ratio'],
+            profiles=options['profiles'], progress=measured
+        )
+        report = {
+            'dataset': dataset,
+            'environment': benchmark.describe_environment(),
+            'options': {key: options[key] for key in ('concurrency', 'duration', 'write_ratio')},
+            'profiles': results,
+        }
+        self.write_report(report, options)
+
+    def write_report(self, report, options):
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output_file:
+                output_file.write(output + '\n')
+        else:
+            self.stdout.write(output)
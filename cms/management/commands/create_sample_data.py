@@ -1,17 +1,58 @@
 """
 Django management command to create sample data for the CMS
 """
-from django.core.management.base import BaseCommand
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth.models import User
+from cms import sample_data
 from cms.models import Category, Post, Page, SiteSettings
 from django.utils import timezone
 import random
 
 
 class Command(BaseCommand):
-    help = 'Create sample data for the CMS'
+    help = (
+        'Create sample data for the CMS: a few hand-written posts and pages, or with '
+        '--posts N that many generated posts with comments and tags'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int,
+            help='Generate this many synthetic posts instead of the hand-written samples'
+        )
+        parser.add_argument(
+            '--comments-per-post', type=int, default=3,
+            help='Comments on each generated published post (default: 3)'
+        )
+        parser.add_argument(
+            '--users', type=int,
+            help='Authors of the generated posts (default: one per 100 posts)'
+        )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Random seed; the same seed generates the same content (default: 0)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Posts written per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Processes generating content while the command writes (default: one per CPU)'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to load the generated posts into (default: "default")'
+        )
 
     def handle(self, *args, **options):
+        if options['posts'] is not None:
+            self.generate(options)
+            return
+        
         self.stdout.write(self.style.SUCCESS('Creating sample data...'))
         
         # Create site settings
@@ -277,4 +318,33 @@ class Command(BaseCommand):
                 self.stdout.write(f'Created page: {page.title}')
         
         self.stdout.write(self.style.SUCCESS('Sample data created successfully!'))
-        self.stdout.write(self.style.SUCCESS('Admin credentials: username=admin, password=admin123'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS('Admin credentials: username=admin, password=admin123'))
+
+    def generate(self, options):
+        total = options['posts']
+        if total < 1 or options['batch_size'] < 1 or options['comments_per_post'] < 0:
+            raise CommandError('--posts and --batch-size must be positive, --comments-per-post not negative')
+        if options['users'] is not None and options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        started = time.monotonic()
+        step = max(total // 20, 1)
+        
+        def progress(posts):
+            if posts == total or posts % step < options['batch_size']:
+                elapsed = time.monotonic() - started
+                self.stdout.write(f'{posts}/{total} posts ({posts / elapsed:.0f} posts/s)')
+        
+        created = sample_data.generate(
+            total,
+            comments_per_post=options['comments_per_post'],
+            users=options['users'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            processes=options['processes'],
+            using=options['database'],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created['posts']} posts, {created['comments']} comments and {created['tagged_items']} post tags "
+            f"by {created['users']} authors in {time.monotonic() - started:.0f}s."
+        ))
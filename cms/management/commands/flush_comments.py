@@ -0,0 +1,38 @@
+"""
+Django management command to write spooled comments to the database
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from cms import comment_intake
+
+
+class Command(BaseCommand):
+    help = 'Write comments waiting in the spool directory to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, flushing every INTERVAL seconds (default: flush once and exit)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Comments written per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to write to (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            written = comment_intake.flush(batch_size=options['batch_size'], using=options['database'])
+            if written or not options['interval']:
+                self.stdout.write(f'Wrote {written} comments.')
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
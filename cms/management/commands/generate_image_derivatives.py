@@ -0,0 +1,33 @@
+"""
+Django management command to render responsive image derivatives
+"""
+from django.core.management.base import BaseCommand
+
+from cms import images
+from cms.models import Post, SiteSettings
+
+
+class Command(BaseCommand):
+    help = 'Render the responsive derivatives of post featured images and the site logo'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Render images whose derivatives are already stored too'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to read the images from (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        rendered = 0
+        for model, field_name in ((Post, 'featured_image'), (SiteSettings, 'logo')):
+            pks = model._default_manager.using(using).exclude(
+                **{field_name: ''}
+            ).exclude(**{'%s__isnull' % field_name: True}).values_list('pk', flat=True)
+            for pk in list(pks):
+                if images.generate(model, pk, field_name, using=using, force=options['force']):
+                    rendered += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered derivatives of {rendered} images.'))
@@ -0,0 +1,54 @@
+"""
+Django management command for periodic SQLite maintenance
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cms import sqlite
+
+
+class Command(BaseCommand):
+    help = 'Refresh the SQLite query planner statistics (PRAGMA optimize) and checkpoint the write-ahead log'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, every INTERVAL seconds (default: run once and exit)'
+        )
+        parser.add_argument(
+            '--checkpoint', choices=sqlite.CHECKPOINT_MODES, default='TRUNCATE',
+            help='Checkpoint mode; TRUNCATE also empties the log file (default: TRUNCATE)'
+        )
+        parser.add_argument(
+            '--database', action='append', dest='databases', metavar='ALIAS',
+            help='Database alias to maintain (repeatable; default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['databases'] or ['default']
+        for alias in aliases:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError(f'{alias} is not an SQLite database.')
+        while True:
+            for alias in aliases:
+                sqlite.optimize(using=alias)
+                busy, log_pages, checkpointed = sqlite.checkpoint(using=alias, mode=options['checkpoint'])
+                if log_pages < 0:
+                    message = f'Optimized {alias}; not in WAL mode, nothing to checkpoint.'
+                else:
+                    message = f'Optimized {alias}; checkpointed {checkpointed} of {log_pages} log pages.'
+                if busy:
+                    message += ' Readers kept the rest of the log busy.'
+                if busy or not options['interval']:
+                    self.stdout.write(message)
+            if not options['interval']:
+                return
+            # A long-lived process must not keep its connections open forever
+            for alias in aliases:
+                connections[alias].close()
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,43 @@
+"""
+Django management command to publish scheduled posts whose date has come
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from cms import scheduling
+
+
+class Command(BaseCommand):
+    help = 'Publish scheduled posts whose publish date has come'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, checking at least every INTERVAL seconds (default: run once and exit)'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to publish on (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        while True:
+            published = scheduling.publish_due(using=using)
+            if published or not options['interval']:
+                self.stdout.write(f'Published {published} posts.')
+            next_publish = scheduling.next_publish_date(using=using)
+            if not options['interval']:
+                if next_publish is not None:
+                    # Let the workers take over from here
+                    scheduling.schedule(next_publish, using=using)
+                return
+            wait = options['interval']
+            if next_publish is not None:
+                wait = min(wait, max((next_publish - timezone.now()).total_seconds(), 0))
+            try:
+                time.sleep(wait)
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,20 @@
+"""
+Django management command to recompute the related posts of every post
+"""
+from django.core.management.base import BaseCommand
+
+from cms import related
+
+
+class Command(BaseCommand):
+    help = 'Recompute the stored related posts of all published posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to rebuild on (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        posts = related.rebuild(using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Computed related posts for {posts} posts.'))
@@ -0,0 +1,30 @@
+"""
+Django management command to rebuild the post full-text search index
+"""
+from django.core.management.base import BaseCommand
+
+from cms import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of posts indexed per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to rebuild the index on (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_available(options['database']):
+            self.stdout.write(
+                self.style.WARNING('Full-text index is not available on this database; nothing to rebuild.')
+            )
+            return
+
+        indexed = search.rebuild_index(batch_size=options['batch_size'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts.'))
@@ -0,0 +1,24 @@
+"""
+Django management command to repair denormalized post/category counters
+"""
+from django.core.management.base import BaseCommand
+
+from cms import counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute comment counters on posts and published post counters on categories'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to recount on (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        posts = counters.refresh_post_counters(using=using)
+        categories = counters.refresh_category_counters(using=using)
+        self.stdout.write(
+            self.style.SUCCESS(f'Recounted {posts} posts and {categories} categories.')
+        )
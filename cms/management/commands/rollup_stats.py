@@ -0,0 +1,69 @@
+"""
+Django management command to backfill the daily activity rollups
+"""
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from cms import rollups
+from cms.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyStats rollups (by default for yesterday and today; run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=2,
+            help='Number of days up to and including today to rebuild (default: 2)'
+        )
+        parser.add_argument(
+            '--since', type=date.fromisoformat,
+            help='Rebuild every day from this date (YYYY-MM-DD) up to today'
+        )
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Rebuild the whole history, starting from the oldest post'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to roll up (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        using = options['database']
+        today = timezone.localdate()
+
+        if options['all']:
+            oldest = Post.objects.using(using).aggregate(
+                created=Min('created_at'), published=Min('publish_date')
+            )
+            oldest = [value for value in oldest.values() if value is not None]
+            if not oldest:
+                self.stdout.write(self.style.WARNING('No posts to roll up.'))
+                return
+            start = rollups.local_date(min(oldest))
+        elif options['since']:
+            start = options['since']
+        else:
+            if options['days'] < 1:
+                raise CommandError('--days must be at least 1')
+            start = today - timedelta(days=options['days'] - 1)
+
+        # Scheduled posts can have publish dates in the future
+        latest = Post.objects.using(using).filter(publish_date__gt=timezone.now()).order_by('-publish_date').first()
+        end = max(today, rollups.local_date(latest.publish_date)) if latest else today
+
+        rows = 0
+        day = start
+        # Roll up a month at a time to keep each transaction short
+        while day <= end:
+            chunk_end = min(day + timedelta(days=30), end)
+            rows += rollups.rollup_range(day, chunk_end, using=using)
+            day = chunk_end + timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Rolled up {(end - start).days + 1} days into {rows} rows ({start} to {end}).')
+        )
@@ -0,0 +1,72 @@
+"""
+Django management command to run background job workers
+"""
+import multiprocessing
+import signal
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from cms import scheduling
+from cms.jobs import Worker
+
+
+def run_worker(using, poll_interval, burst):
+    worker = Worker(using=using, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run(burst=burst)
+
+
+class Command(BaseCommand):
+    help = 'Run worker processes executing queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Number of worker processes (default: 1)'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help='Seconds an idle worker waits before looking for jobs again (default: 1)'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Exit once the queue is empty'
+        )
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias holding the job queue (default: "default")'
+        )
+
+    def handle(self, *args, **options):
+        worker_args = (options['database'], options['poll_interval'], options['burst'])
+        # Posts scheduled without a queued publishing run (e.g. by a migration)
+        next_publish = scheduling.next_publish_date(using=options['database'])
+        if next_publish is not None:
+            scheduling.schedule(next_publish, using=options['database'])
+        if options['workers'] <= 1:
+            run_worker(*worker_args)
+            return
+
+        # Children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(target=run_worker, args=worker_args, name=f'cms-worker-{number}')
+            for number in range(options['workers'])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f'Started {len(processes)} workers.')
+
+        def stop(signum, frame):
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        # Ctrl-C reaches the workers directly; just wait for them
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for process in processes:
+            process.join()
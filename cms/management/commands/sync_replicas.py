@@ -0,0 +1,38 @@
+"""
+Django management command to copy the primary database to its SQLite read replicas
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from cms import replicas
+
+
+class Command(BaseCommand):
+    help = 'Copy the primary SQLite database to the replicas in CMS_READ_REPLICAS with the backup API'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep running, syncing every INTERVAL seconds (default: sync once and exit)'
+        )
+        parser.add_argument(
+            'aliases', nargs='*',
+            help='Replica aliases to sync (default: all of CMS_READ_REPLICAS)'
+        )
+
+    def handle(self, *args, **options):
+        aliases = options['aliases'] or replicas.get_replicas()
+        if not aliases:
+            raise CommandError('No replicas: list their aliases in CMS_READ_REPLICAS or on the command line.')
+        while True:
+            for alias in aliases:
+                seconds = replicas.sync(alias)
+                if not options['interval']:
+                    self.stdout.write(f'Synced {alias} in {seconds:.2f}s.')
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
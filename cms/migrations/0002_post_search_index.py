@@ -0,0 +1,49 @@
+from django.db import migrations, OperationalError
+
+from cms.text import html_to_text
+
+
+INDEX_TABLE = 'cms_post_search'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    try:
+        schema_editor.execute(
+            f'CREATE VIRTUAL TABLE {INDEX_TABLE} USING fts5('
+            "title, excerpt, body, tokenize = 'porter unicode61 remove_diacritics 2')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to icontains
+        return
+
+    Post = apps.get_model('cms', 'Post')
+    rows = [
+        (post.pk, post.title or '', post.excerpt or '', html_to_text(post.content))
+        for post in Post.objects.only('id', 'title', 'excerpt', 'content').iterator()
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} (rowid, title, excerpt, body) VALUES (%s, %s, %s, %s)',
+                rows
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {INDEX_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
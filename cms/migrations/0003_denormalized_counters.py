@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:22
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _count_subquery(queryset, field):
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+        count=Count('pk')
+    ).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def populate_counters(apps, schema_editor):
+    Category = apps.get_model('cms', 'Category')
+    Post = apps.get_model('cms', 'Post')
+    Comment = apps.get_model('cms', 'Comment')
+    Post.objects.update(
+        total_comment_count=_count_subquery(Comment.objects.all(), 'post'),
+        approved_comment_count=_count_subquery(Comment.objects.filter(is_approved=True), 'post'),
+    )
+    Category.objects.update(
+        published_post_count=_count_subquery(Post.objects.filter(status='published'), 'category')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0002_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='published_post_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='total_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:26
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max, Min
+from django.utils import timezone
+
+
+def backfill_daily_stats(apps, schema_editor):
+    from cms.rollups import local_date, rollup_range
+
+    Post = apps.get_model('cms', 'Post')
+    Comment = apps.get_model('cms', 'Comment')
+    DailyStats = apps.get_model('cms', 'DailyStats')
+    bounds = Post.objects.aggregate(
+        first_created=Min('created_at'), first_published=Min('publish_date'),
+        last_published=Max('publish_date'),
+    )
+    if bounds['first_created'] is None:
+        return
+    start = local_date(min(bounds['first_created'], bounds['first_published']))
+    # Comments are never older than their post nor newer than today
+    end = max(local_date(bounds['last_published']), timezone.localdate())
+    rollup_range(
+        start, end, using=schema_editor.connection.alias,
+        post_model=Post, comment_model=Comment, stats_model=DailyStats,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('cms', '0003_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('posts_created', models.PositiveIntegerField(default=0)),
+                ('posts_published', models.PositiveIntegerField(default=0)),
+                ('comments_received', models.PositiveIntegerField(default=0)),
+                ('comments_approved', models.PositiveIntegerField(default=0)),
+                ('author', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='daily_stats', to='cms.category')),
+            ],
+            options={
+                'verbose_name': 'Daily Stats',
+                'verbose_name_plural': 'Daily Stats',
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['date'], name='cms_dailyst_date_a49825_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
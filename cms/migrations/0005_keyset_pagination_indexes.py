@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0004_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['-created_at', '-id'], name='cms_comment_created_01decd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['is_approved', '-created_at', '-id'], name='cms_comment_is_appr_942669_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-publish_date', '-id'], name='cms_post_status_836cc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', 'status', '-publish_date', '-id'], name='cms_post_categor_ad383a_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:47
+
+from django.db import migrations, models
+
+from cms.text import count_words, html_to_text, reading_time
+
+
+def populate_content_text(apps, schema_editor):
+    Post = apps.get_model('cms', 'Post')
+    last_pk = 0
+    while True:
+        batch = list(Post.objects.filter(pk__gt=last_pk).only('id', 'content').order_by('pk')[:500])
+        if not batch:
+            break
+        for post in batch:
+            post.content_text = html_to_text(post.content)
+            post.word_count = count_words(post.content_text)
+            post.reading_time = reading_time(post.word_count)
+        Post.objects.bulk_update(batch, ['content_text', 'word_count', 'reading_time'])
+        last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0008_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='content_text',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reading_time',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, help_text='Minutes'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='word_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_content_text, migrations.RunPython.noop),
+    ]
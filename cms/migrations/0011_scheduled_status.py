@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:56
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _recount_categories(apps, category_ids, using):
+    Category = apps.get_model('cms', 'Category')
+    Post = apps.get_model('cms', 'Post')
+    for category_id in category_ids:
+        count = Post.objects.using(using).filter(category_id=category_id, status='published').count()
+        Category.objects.using(using).filter(pk=category_id).update(published_post_count=count)
+
+
+def _move(apps, schema_editor, posts, status):
+    using = schema_editor.connection.alias
+    posts = posts.using(using)
+    category_ids = set(posts.exclude(category=None).values_list('category_id', flat=True).distinct())
+    posts.update(status=status)
+    _recount_categories(apps, category_ids, using)
+
+
+def schedule_future_posts(apps, schema_editor):
+    # run_workers queues their publishing run when it starts
+    Post = apps.get_model('cms', 'Post')
+    _move(apps, schema_editor, Post.objects.filter(status='published', publish_date__gt=timezone.now()), 'scheduled')
+
+
+def publish_scheduled_posts(apps, schema_editor):
+    Post = apps.get_model('cms', 'Post')
+    _move(apps, schema_editor, Post.objects.filter(status='scheduled'), 'published')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0010_related_posts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='post',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Draft'), ('scheduled', 'Scheduled'), ('published', 'Published')], default='draft', max_length=10),
+        ),
+        migrations.RunPython(schedule_future_posts, publish_scheduled_posts),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0012_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermFrequency',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, unique=True)),
+                ('documents', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RelatedTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.FloatField()),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_terms', to='cms.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'post'], name='cms_related_term_918485_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='relatedterm',
+            constraint=models.UniqueConstraint(fields=('post', 'term'), name='cms_relatedterm_unique_term'),
+        ),
+    ]
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
 from django.utils import timezone
@@ -6,12 +6,134 @@ from ckeditor_uploader.fields import RichTextUploadingField
 from taggit.managers import TaggableManager
 from django.utils.text import slugify
 
+from . import signals
+from .text import count_words, html_to_text, reading_time, truncate_text
+
+
+class TrackedFieldsMixin:
+    """
+    Remember field values as they were loaded from the database so save()
+    and signal receivers can tell which fields actually changed.
+    """
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def loaded_value(self, attname, default=None):
+        return getattr(self, '_loaded_values', {}).get(attname, default)
+    
+    def has_changed(self, attname):
+        loaded_values = getattr(self, '_loaded_values', None)
+        if loaded_values is None or attname not in loaded_values:
+            return True
+        return loaded_values[attname] != getattr(self, attname)
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._snapshot_loaded_values()
+    
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        self._snapshot_loaded_values(fields)
+    
+    def _snapshot_loaded_values(self, fields=None):
+        deferred = self.get_deferred_fields()
+        loaded_values = getattr(self, '_loaded_values', {}) if fields else {}
+        for field in self._meta.concrete_fields:
+            if field.attname in deferred:
+                continue
+            if fields and field.name not in fields and field.attname not in fields:
+                continue
+            loaded_values[field.attname] = getattr(self, field.attname)
+        self._loaded_values = loaded_values
+
+
+class SignalingQuerySet(models.QuerySet):
+    """
+    QuerySet whose update() announces changes to ``tracked_fields`` through
+    ``signals.post_bulk_update``, since bulk updates skip post_save, and
+    whose bulk_delete() announces deletions through ``signals.post_bulk_delete``.
+    """
+    tracked_fields = ()
+    # Primary keys per DELETE statement in bulk_delete()
+    DELETE_BATCH_SIZE = 500
+    
+    def update(self, **kwargs):
+        fields = set(kwargs)
+        if not fields & set(self.tracked_fields):
+            return super().update(**kwargs)
+        
+        with transaction.atomic(using=self.db):
+            pks = list(self.values_list('pk', flat=True))
+            rows = super().update(**kwargs)
+            if pks:
+                signals.post_bulk_update.send(
+                    sender=self.model, pks=pks, fields=fields, using=self.db
+                )
+        return rows
+    
+    def bulk_delete(self, fields=()):
+        """
+        Delete the rows with plain DELETE statements (one per 500 rows) and
+        send ``signals.post_bulk_delete`` once, instead of sending
+        post_delete for every object. Only for models no other rows
+        reference. Returns the number of rows deleted.
+        """
+        with transaction.atomic(using=self.db):
+            instances = list(self.select_related(None).prefetch_related(None).order_by().only('pk', *fields))
+            if not instances:
+                return 0
+            pks = [instance.pk for instance in instances]
+            rows = 0
+            for start in range(0, len(pks), self.DELETE_BATCH_SIZE):
+                rows += self.model._base_manager.using(self.db).filter(
+                    pk__in=pks[start:start + self.DELETE_BATCH_SIZE]
+                )._raw_delete(self.db)
+            signals.post_bulk_delete.send(sender=self.model, instances=instances, using=self.db)
+        return rows
+
+
+class PostQuerySet(SignalingQuerySet):
+    tracked_fields = ('status', 'category', 'category_id')
+    
+    def publish(self):
+        """
+        Publish the posts whose date has come and schedule the others;
+        returns how many changed status
+        """
+        now = timezone.now()
+        posts = self.exclude(status='published')
+        return (
+            posts.filter(publish_date__lte=now).update(status='published')
+            + posts.filter(publish_date__gt=now).exclude(status='scheduled').update(status='scheduled')
+        )
+
+
+class CommentQuerySet(SignalingQuerySet):
+    tracked_fields = ('is_approved', 'post', 'post_id')
+    
+    def approve(self):
+        """Approve the comments not approved yet; returns how many were"""
+        return self.filter(is_approved=False).update(is_approved=True)
+    
+    def reject(self):
+        """Unapprove the approved comments; returns how many were"""
+        return self.filter(is_approved=True).update(is_approved=False)
+    
+    def bulk_delete(self, fields=('post_id', 'created_at')):
+        # The fields the post_bulk_delete receivers read
+        return super().bulk_delete(fields)
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
     slug = models.SlugField(max_length=100, unique=True, blank=True)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    published_post_count = models.PositiveIntegerField(default=0, editable=False)
     
     class Meta:
         verbose_name_plural = 'Categories'
@@ -29,9 +151,10 @@ class Category(models.Model):
         return reverse('cms:category_detail', kwargs={'slug': self.slug})
 
 
-class Post(models.Model):
+class Post(TrackedFieldsMixin, models.Model):
     STATUS_CHOICES = (
         ('draft', 'Draft'),
+        ('scheduled', 'Scheduled'),
         ('published', 'Published'),
     )
     
@@ -42,32 +165,60 @@ class Post(models.Model):
     content = RichTextUploadingField()
     excerpt = models.TextField(max_length=300, blank=True, help_text="Brief description of the post")
     featured_image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    # Responsive renditions of featured_image, see cms.images
+    featured_image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     publish_date = models.DateTimeField(default=timezone.now)
     meta_description = models.CharField(max_length=160, blank=True, help_text="SEO meta description")
     tags = TaggableManager(blank=True)
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    total_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Plain text of content and its statistics, kept current by save()
+    content_text = models.TextField(blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=0, editable=False, help_text="Minutes")
+    
+    objects = PostQuerySet.as_manager()
     
     class Meta:
         ordering = ['-publish_date']
         indexes = [
             models.Index(fields=['-publish_date']),
-            models.Index(fields=['status']),
+            # Keyset pagination of the published listings; filters on
+            # status alone use the first one too
+            models.Index(fields=['status', '-publish_date', '-id']),
+            models.Index(fields=['category', 'status', '-publish_date', '-id']),
+            models.Index(fields=['author', 'status', '-publish_date', '-id']),
+            # Recent posts, and covers the dashboard's status counts
+            models.Index(fields=['-created_at', 'status']),
         ]
     
     def __str__(self):
         return self.title
     
     def save(self, *args, **kwargs):
+        self.populate_derived_fields()
+        super().save(*args, **kwargs)
+    
+    def populate_derived_fields(self):
+        """
+        Fill in a blank slug and excerpt, tell published from scheduled by
+        the publish date and, when the content changed, derive its plain
+        text and statistics; bulk writes call this as they skip save()
+        """
         if not self.slug:
             self.slug = slugify(self.title)
-        if not self.excerpt and self.content:
-            # Generate excerpt from content (strip HTML tags)
-            import re
-            clean_content = re.sub(r'<[^>]+>', '', self.content)
-            self.excerpt = clean_content[:300] + '...' if len(clean_content) > 300 else clean_content
-        super().save(*args, **kwargs)
+        if self.status in ('published', 'scheduled'):
+            # Published posts wait as scheduled until their date, see cms.scheduling
+            self.status = 'scheduled' if self.publish_date > timezone.now() else 'published'
+        if self.has_changed('content'):
+            self.content_text = html_to_text(self.content)
+            self.word_count = count_words(self.content_text)
+            self.reading_time = reading_time(self.word_count)
+        if not self.excerpt and self.content_text:
+            self.excerpt = truncate_text(self.content_text, 300)
     
     def get_absolute_url(self):
         return reverse('cms:post_detail', kwargs={'slug': self.slug})
@@ -101,7 +252,7 @@ class Page(models.Model):
         return reverse('cms:page_detail', kwargs={'slug': self.slug})
 
 
-class Comment(models.Model):
+class Comment(TrackedFieldsMixin, models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
     name = models.CharField(max_length=100)
     email = models.EmailField()
@@ -109,8 +260,22 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     is_approved = models.BooleanField(default=False)
     
+    objects = CommentQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the comment listings
+            models.Index(fields=['-created_at', '-id']),
+            models.Index(fields=['is_approved', '-created_at', '-id']),
+            # Comments of a post, and (partial: SQL filters on a boolean
+            # column are not equality lookups) its approved comments
+            models.Index(fields=['post', '-created_at', '-id']),
+            models.Index(
+                fields=['post', '-created_at', '-id'], condition=models.Q(is_approved=True),
+                name='cms_comment_approved_post_idx'
+            ),
+        ]
     
     def __str__(self):
         return f'Comment by {self.name} on {self.post.title}'
@@ -126,6 +291,7 @@ class SiteSettings(models.Model):
     social_linkedin = models.URLField(blank=True)
     footer_text = models.TextField(blank=True)
     logo = models.ImageField(upload_to='site/', blank=True, null=True)
+    logo_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     favicon = models.ImageField(upload_to='site/', blank=True, null=True)
     
     class Meta:
@@ -136,8 +302,141 @@ class SiteSettings(models.Model):
         return self.site_title
     
     def save(self, *args, **kwargs):
-        if not self.pk and SiteSettings.objects.exists():
+        if not self.pk:
             # If this is a new instance and one already exists, update the existing one
-            existing = SiteSettings.objects.first()
-            self.pk = existing.pk
+            existing = SiteSettings.objects.only('pk').first()
+            if existing is not None:
+                self.pk = existing.pk
         super().save(*args, **kwargs)
+
+
+class DailyStats(models.Model):
+    """
+    Per-day activity rollup broken down by category and author, maintained
+    incrementally by signal receivers and backfilled by ``rollup_stats``
+    """
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='daily_stats')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='daily_stats')
+    posts_created = models.PositiveIntegerField(default=0)
+    posts_published = models.PositiveIntegerField(default=0)
+    comments_received = models.PositiveIntegerField(default=0)
+    comments_approved = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Daily Stats'
+        verbose_name_plural = 'Daily Stats'
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f'Stats for {self.date}'
+
+
+class RelatedPost(models.Model):
+    """
+    Precomputed "related posts" of a post, best first, maintained by
+    cms.related from tag, category and text similarity
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_from')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    
+    class Meta:
+        ordering = ['post', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'rank'], name='cms_relatedpost_unique_rank'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id} -> {self.related_id} ({self.score:.3f})'
+
+
+class RelatedTerm(models.Model):
+    """
+    One weighted term of a published post's text vector, kept by
+    cms.related so refreshes find the posts sharing a term in the index
+    """
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='related_terms')
+    term = models.CharField(max_length=100)
+    weight = models.FloatField()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['term', 'post']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'term'], name='cms_relatedterm_unique_term'),
+        ]
+    
+    def __str__(self):
+        return f'{self.post_id}: {self.term} ({self.weight:.3f})'
+
+
+class TermFrequency(models.Model):
+    """Number of published posts using a term, as of the last related posts rebuild"""
+    term = models.CharField(max_length=100, unique=True)
+    documents = models.PositiveIntegerField()
+    
+    def __str__(self):
+        return f'{self.term} ({self.documents})'
+
+
+class ContentVersion(models.Model):
+    """
+    Change counter of a content table, bumped by signal receivers on every
+    save and delete. Collection ETags are built from these rows instead of
+    querying the tables themselves.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f'{self.name} v{self.version}'
+
+
+class Job(models.Model):
+    """
+    A unit of background work, run by the ``run_workers`` command (see
+    cms.jobs). ``name`` is the import path of a function decorated with
+    ``jobs.task``; at most one queued job exists per ``dedup_key``.
+    """
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+    
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=100, help_text="Lower numbers run first")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    dedup_key = models.CharField(max_length=200, blank=True, null=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['priority', 'run_at', 'id']
+        indexes = [
+            # Claiming the next job
+            models.Index(fields=['status', 'priority', 'run_at', 'id']),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dedup_key'], condition=models.Q(status='queued'), name='cms_job_queued_dedup_key'
+            ),
+        ]
+    
+    def __str__(self):
+        return f'{self.name} ({self.status})'
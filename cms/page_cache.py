@@ -0,0 +1,258 @@
+"""
+Full-page cache for the public HTML views, served to anonymous visitors
+
+Entries are keyed on scheme, host, path and the normalized query string, and
+record the version of every tag (``post:12``, ``category:3``, ``settings``...)
+the page was rendered from. Invalidating a tag just gives it a new version, so
+every entry that depends on it stops matching without having to be found and
+deleted. Receivers call ``invalidate()`` when content changes.
+
+The CSRF token is the only per-visitor part of the pages: it is rendered as a
+placeholder and filled in with the visitor's own token when a page is served.
+
+Scheduled posts go live when a background worker (or ``publish_scheduled``)
+publishes them, and that process invalidates the pages. With a per-process
+cache the web processes never hear of it, so there pages listing posts
+expire by the next publish date instead.
+
+Pages rendered from a read replica may predate the tag versions they are
+stored under, so they are kept no longer than ``CMS_REPLICA_MAX_LAG``.
+"""
+import hashlib
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from . import replicas, scheduling
+
+
+ENTRY_KEY = 'cms:page:%s'
+TAG_KEY = 'cms:page-tag:%s'
+
+CSRF_PLACEHOLDER = 'cms-page-cache-csrf-token'
+
+# Headers that belong to a single response rather than to the page
+_SKIPPED_HEADERS = {'set-cookie', 'vary', 'x-page-cache'}
+
+
+def get_timeout():
+    """Lifetime of an entry in seconds; 0 disables the page cache"""
+    return getattr(settings, 'CMS_PAGE_CACHE_TIMEOUT', 600)
+
+
+def is_shared():
+    """Whether invalidations reach every process, i.e. the cache is not in-process memory"""
+    return not isinstance(caches[DEFAULT_CACHE_ALIAS], LocMemCache)
+
+
+def seconds_until_next_publish(now=None):
+    """
+    Seconds until the next scheduled post is due, or None. Overdue posts
+    give 1 until they are published.
+    """
+    next_publish = scheduling.next_publish_date()
+    if next_publish is None:
+        return None
+    return max(int((next_publish - (now or timezone.now())).total_seconds()) + 1, 1)
+
+
+def post_tag(pk):
+    return 'post:%s' % pk
+
+
+def comments_tag(post_pk):
+    return 'comments:%s' % post_pk
+
+
+def category_tag(pk):
+    return 'category:%s' % pk
+
+
+def author_tag(pk):
+    return 'author:%s' % pk
+
+
+def page_tag(pk):
+    return 'page:%s' % pk
+
+
+def related_tag(post_pk):
+    return 'related:%s' % post_pk
+
+
+def get_tag_versions(tags):
+    """Current version of each tag, or None for tags with no version yet"""
+    tags = list(tags)
+    found = cache.get_many([TAG_KEY % tag for tag in tags])
+    return {tag: found.get(TAG_KEY % tag) for tag in tags}
+
+
+def _ensure_tag_versions(tags):
+    versions = get_tag_versions(tags)
+    missing = [tag for tag, version in versions.items() if version is None]
+    for tag in missing:
+        # add() so a concurrent invalidate() is never overwritten
+        cache.add(TAG_KEY % tag, uuid.uuid4().hex, None)
+    if missing:
+        versions.update(get_tag_versions(missing))
+    return versions
+
+
+def invalidate(*tags, using='default'):
+    """
+    Expire every cached page depending on any of ``tags``. Inside a
+    transaction this waits for the commit, so a page rendered from the old
+    rows in the meantime can't be stored under the new versions.
+    """
+    tags = {tag for tag in tags if tag}
+    if tags:
+        transaction.on_commit(lambda: _bump(tags), using=using)
+
+
+def _bump(tags):
+    cache.set_many({TAG_KEY % tag: uuid.uuid4().hex for tag in tags}, None)
+
+
+def is_cacheable_request(request):
+    if get_timeout() <= 0 or request.method not in ('GET', 'HEAD'):
+        return False
+    if request.user.is_authenticated:
+        return False
+    return not has_pending_messages(request)
+
+
+def has_pending_messages(request):
+    """Whether flash messages are waiting to be rendered into the next page"""
+    if CookieStorage.cookie_name in request.COOKIES:
+        return True
+    return bool(settings.SESSION_COOKIE_NAME in request.COOKIES and request.session.get('_messages'))
+
+
+def get_cache_key(request):
+    query = urlencode(sorted((key, value) for key, values in request.GET.lists() for value in values))
+    url = '%s://%s%s?%s' % (request.scheme, request.get_host(), request.path, query)
+    return ENTRY_KEY % hashlib.md5(url.encode('utf-8')).hexdigest()
+
+
+def get_cached_response(request):
+    """Build the response for ``request`` from a current entry, if there is one"""
+    entry = cache.get(get_cache_key(request))
+    if entry is None or get_tag_versions(entry['versions']) != entry['versions']:
+        return None
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers']:
+        response[header] = value
+    response['X-Page-Cache'] = 'HIT'
+    return _fill_csrf_token(request, response)
+
+
+def store_response(request, response, tags, timeout=None):
+    """
+    Cache a rendered response under the request's key, tagged with ``tags``,
+    and return it ready to be sent.
+    """
+    timeout = get_timeout() if timeout is None else timeout
+    if getattr(request, 'replica', None):
+        # The replica may not have the writes the current versions stand for
+        timeout = min(timeout, replicas.get_max_lag())
+    cacheable = (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+        and timeout > 0
+    )
+    if cacheable:
+        cache.set(get_cache_key(request), {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': [
+                (header, value) for header, value in response.items()
+                if header.lower() not in _SKIPPED_HEADERS
+            ],
+            'versions': _ensure_tag_versions(tags),
+        }, timeout)
+    response['X-Page-Cache'] = 'MISS'
+    return _fill_csrf_token(request, response)
+
+
+def _fill_csrf_token(request, response):
+    placeholder = CSRF_PLACEHOLDER.encode('ascii')
+    if placeholder in response.content:
+        response.content = response.content.replace(placeholder, get_token(request).encode('ascii'))
+    return response
+
+
+class CachedPageMixin:
+    """
+    Serve anonymous GET requests of a class-based view from the page cache.
+    
+    Views declare what a page depends on by calling ``add_cache_tags()``
+    while building the context; ``settings`` is always included. Set
+    ``page_cache_follows_schedule`` on views that list published posts so
+    their entries expire when a scheduled post is due. Async views
+    (``async def get()``) get the cache lookups run in a thread.
+    """
+    page_cache_follows_schedule = False
+    
+    def dispatch(self, request, *args, **kwargs):
+        if self.view_is_async:
+            return self._async_dispatch(request, *args, **kwargs)
+        if not is_cacheable_request(request):
+            self.page_cache_tags = None
+            return super().dispatch(request, *args, **kwargs)
+        
+        response = get_cached_response(request)
+        if response is not None:
+            return response
+        
+        self.page_cache_tags = {'settings'}
+        response = super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+        return store_response(request, response, self.page_cache_tags, self.get_page_cache_timeout())
+    
+    async def _async_dispatch(self, request, *args, **kwargs):
+        # The session, the cache and the CSRF token are only used synchronously
+        if not await sync_to_async(is_cacheable_request)(request):
+            self.page_cache_tags = None
+            return await super().dispatch(request, *args, **kwargs)
+        
+        response = await sync_to_async(get_cached_response)(request)
+        if response is not None:
+            return response
+        
+        self.page_cache_tags = {'settings'}
+        response = await super().dispatch(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            await sync_to_async(response.render)()
+        timeout = await sync_to_async(self.get_page_cache_timeout)()
+        return await sync_to_async(store_response)(request, response, self.page_cache_tags, timeout)
+    
+    def add_cache_tags(self, *tags):
+        if self.page_cache_tags is not None:
+            self.page_cache_tags.update(tags)
+    
+    def get_page_cache_timeout(self):
+        timeout = get_timeout()
+        if self.page_cache_follows_schedule and timeout > 0 and not is_shared():
+            remaining = seconds_until_next_publish()
+            if remaining is not None:
+                timeout = min(timeout, remaining)
+        return timeout
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.page_cache_tags is not None:
+            # Overrides the csrf context processor; filled in per visitor
+            context['csrf_token'] = CSRF_PLACEHOLDER
+        return context
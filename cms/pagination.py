@@ -0,0 +1,315 @@
+"""
+Keyset (cursor) pagination for the post and comment listings
+
+Instead of OFFSET, each page continues from the ordering values of the last
+row of the previous one (``WHERE (publish_date, id) < (...)``) and no COUNT(*)
+is run, so a deep page costs the same index range scan as the first and rows
+published in the meantime don't shift the pages being read. Cursors are
+opaque base64 tokens carrying those values.
+"""
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.http import Http404
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+CURSOR_QUERY_PARAM = 'cursor'
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_keys(queryset):
+    """
+    The queryset ordering as ``(attname, descending)`` pairs, ending with the
+    primary key so that every row has a unique position.
+    """
+    opts = queryset.model._meta
+    ordering = list(queryset.query.order_by) or list(opts.ordering)
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str) or item == '?' or '__' in item:
+            raise ValueError('Keyset pagination needs plain field orderings, not %r' % (item,))
+        descending = item.startswith('-')
+        name = item.lstrip('-')
+        if name == 'pk':
+            name = opts.pk.attname
+        try:
+            name = opts.get_field(name).attname
+        except FieldDoesNotExist:
+            # An annotation such as the search rank
+            pass
+        keys.append((name, descending))
+    if opts.pk.attname not in [name for name, _ in keys]:
+        keys.append((opts.pk.attname, keys[0][1] if keys else True))
+    return keys
+
+
+def _json_default(value):
+    # Full precision: DjangoJSONEncoder drops microseconds
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError('Cannot encode %r in a cursor' % (value,))
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': int(reverse)}, default=_json_default, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return ``(values, reverse)`` from a cursor, or raise InvalidCursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = data['v']
+        reverse = bool(data.get('r'))
+    except (TypeError, ValueError, KeyError, AttributeError, binascii.Error, UnicodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values, reverse
+
+
+class KeysetPage:
+    """
+    One page of results. Mirrors the parts of Django's ``Page`` the
+    templates use, with cursors in place of page numbers.
+    """
+    
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.first_url = self.next_url = self.previous_url = None
+    
+    def __iter__(self):
+        return iter(self.object_list)
+    
+    def __len__(self):
+        return len(self.object_list)
+    
+    def __getitem__(self, index):
+        return self.object_list[index]
+    
+    def has_next(self):
+        return self.next_cursor is not None
+    
+    def has_previous(self):
+        return self.previous_cursor is not None
+    
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.keys = get_keys(queryset)
+    
+    def get_page(self, cursor=None):
+        queryset, values, reverse = self._page_queryset(cursor)
+        return self._make_page(list(queryset[:self.per_page + 1]), values, reverse)
+    
+    async def aget_page(self, cursor=None):
+        """get_page() on the async ORM"""
+        queryset, values, reverse = self._page_queryset(cursor)
+        return self._make_page([row async for row in queryset[:self.per_page + 1]], values, reverse)
+    
+    def _page_queryset(self, cursor):
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        if values is not None and len(values) != len(self.keys):
+            raise InvalidCursor(cursor)
+        
+        queryset = self.queryset.order_by(*[
+            ('-' if descending != reverse else '') + name for name, descending in self.keys
+        ])
+        if values is not None:
+            try:
+                queryset = queryset.filter(self._after(values, reverse))
+            except (ValidationError, ValueError, TypeError):
+                # Values of the wrong type for their field: an edited cursor
+                raise InvalidCursor(cursor)
+        return queryset, values, reverse
+    
+    def _make_page(self, rows, values, reverse):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+        
+        if reverse:
+            has_next, has_previous = values is not None, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+        return KeysetPage(
+            rows,
+            next_cursor=encode_cursor(self._position(rows[-1])) if rows and has_next else None,
+            previous_cursor=encode_cursor(self._position(rows[0]), reverse=True) if rows and has_previous else None,
+        )
+    
+    def _position(self, obj):
+        return [getattr(obj, name) for name, _ in self.keys]
+    
+    def _after(self, values, reverse):
+        """
+        Rows strictly past ``values`` in reading order, written with an
+        inclusive bound on the leading key so the index range scan is used.
+        """
+        def lookup(descending, strict):
+            forward = 'lt' if descending != reverse else 'gt'
+            return forward if strict else forward + 'e'
+        
+        first, first_descending = self.keys[0]
+        condition = Q()
+        for index, (name, descending) in enumerate(self.keys):
+            equal = {key: value for (key, _), value in zip(self.keys[:index], values)}
+            condition |= Q(**equal, **{'%s__%s' % (name, lookup(descending, True)): values[index]})
+        return Q(**{'%s__%s' % (first, lookup(first_descending, False)): values[0]}) & condition
+
+
+def paginate(request, queryset, per_page):
+    """
+    Keyset-paginate ``queryset`` for an HTML view, reading the cursor from
+    the query string. The page carries ready-made first/next/previous URLs.
+    """
+    try:
+        page = KeysetPaginator(queryset, per_page).get_page(request.GET.get(CURSOR_QUERY_PARAM))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+    return _add_urls(request, page)
+
+
+async def apaginate(request, queryset, per_page):
+    """paginate() for async views"""
+    try:
+        page = await KeysetPaginator(queryset, per_page).aget_page(request.GET.get(CURSOR_QUERY_PARAM))
+    except InvalidCursor:
+        raise Http404('Invalid page cursor.')
+    return _add_urls(request, page)
+
+
+def _add_urls(request, page):
+    url = request.get_full_path()
+    page.first_url = remove_query_param(url, CURSOR_QUERY_PARAM)
+    if page.has_next():
+        page.next_url = replace_query_param(url, CURSOR_QUERY_PARAM, page.next_cursor)
+    if page.has_previous():
+        page.previous_url = replace_query_param(url, CURSOR_QUERY_PARAM, page.previous_cursor)
+    return page
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset pagination for ``ListView`` subclasses using ``paginate_by``.
+    Async views fetch the page with ``apaginate()`` and pass it as the
+    object list.
+    """
+    
+    def paginate_queryset(self, queryset, page_size):
+        if isinstance(queryset, KeysetPage):
+            page = queryset
+        else:
+            page = paginate(self.request, queryset, page_size)
+        return None, page, page.object_list, page.has_other_pages()
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class on top of ``KeysetPaginator``. Follows the ordering
+    the filter backends left on the queryset (OrderingFilter, search rank)
+    and responds with ``next``/``previous`` links and ``results``.
+    """
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = CURSOR_QUERY_PARAM
+    invalid_cursor_message = 'Invalid cursor'
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        self.request = request
+        try:
+            self.page = KeysetPaginator(queryset, page_size).get_page(
+                request.query_params.get(self.cursor_query_param)
+            )
+        except InvalidCursor:
+            raise NotFound(self.invalid_cursor_message)
+        return list(self.page)
+    
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+    
+    def get_next_link(self):
+        if not self.page.has_next():
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.next_cursor)
+    
+    def get_previous_link(self):
+        if not self.page.has_previous():
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.previous_cursor)
+    
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+    
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+    
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'The pagination cursor value.',
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': 'Number of results to return per page.',
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,184 @@
+"""
+Per-request SQL budget and N+1 detection
+
+``QueryRecorder`` wraps every database connection and records each query
+with its duration and its shape (the SQL with ``IN (...)`` lists
+collapsed). With ``phases`` (the default under DEBUG) it also notes
+whether each query ran while a template was rendering or a serializer was
+building its output: lazy querysets and relation lookups in loops, where
+N+1 queries come from. Finding the phase walks the stack on every query,
+so production recorders only count and time.
+
+``QueryBudgetMiddleware`` records each request and logs those exceeding
+``CMS_QUERY_BUDGET`` queries or ``CMS_QUERY_BUDGET_TIME`` seconds in the
+database, or repeating one query shape more than
+``CMS_QUERY_REPEAT_LIMIT`` times. Tests use the recorder through
+``problems()`` to hold each URL to its own budget.
+"""
+import logging
+import re
+import sys
+import time
+from collections import Counter, namedtuple
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+Query = namedtuple('Query', ['sql', 'shape', 'duration', 'phase'])
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def get_budget():
+    """Queries allowed per request; None disables the middleware"""
+    return getattr(settings, 'CMS_QUERY_BUDGET', None)
+
+
+def get_time_budget():
+    return getattr(settings, 'CMS_QUERY_BUDGET_TIME', None)
+
+
+def get_repeat_limit():
+    return getattr(settings, 'CMS_QUERY_REPEAT_LIMIT', 3)
+
+
+def query_shape(sql):
+    return _IN_LIST_RE.sub('IN (...)', sql)
+
+
+def _current_phase():
+    """'template' or 'serializer' when called below one of those, else None"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        name = frame.f_code.co_name
+        if name == 'render' and frame.f_globals.get('__name__') == 'django.template.base':
+            return 'template'
+        if name == 'to_representation' and _is_serializer(frame.f_locals.get('self')):
+            return 'serializer'
+        frame = frame.f_back
+    return None
+
+
+def _is_serializer(obj):
+    try:
+        from rest_framework.serializers import BaseSerializer
+    except ImportError:
+        return False
+    return isinstance(obj, BaseSerializer)
+
+
+class QueryRecorder:
+    """Context manager recording the queries run on every connection in this thread"""
+    
+    def __init__(self, phases=None):
+        self.queries = []
+        # Phases cost a stack walk per query: only while debugging unless asked for
+        self.phases = settings.DEBUG if phases is None else phases
+        self._stack = None
+    
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+    
+    def __exit__(self, *exc_info):
+        self._stack.close()
+    
+    def __call__(self, execute, sql, params, many, context):
+        phase = _current_phase() if self.phases else None
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append(Query(sql, query_shape(sql), time.perf_counter() - start, phase))
+    
+    @property
+    def count(self):
+        return len(self.queries)
+    
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+    
+    def repeated(self, limit=1):
+        """``{shape: count}`` of the query shapes run more than ``limit`` times"""
+        counts = Counter(query.shape for query in self.queries)
+        return {shape: count for shape, count in counts.most_common() if count > limit}
+    
+    def lazy(self):
+        """Queries run while rendering templates or serializing, by phase"""
+        return Counter(query.phase for query in self.queries if query.phase)
+
+
+def problems(recorder, budget=None, time_budget=None, repeat_limit=None):
+    """Human-readable list of what in ``recorder`` breaks the given limits"""
+    found = []
+    if budget is not None and recorder.count > budget:
+        found.append('%d queries (budget %d)' % (recorder.count, budget))
+    if time_budget is not None and recorder.duration > time_budget:
+        found.append('%.3fs in the database (budget %.3fs)' % (recorder.duration, time_budget))
+    if repeat_limit is not None:
+        for shape, count in recorder.repeated(repeat_limit).items():
+            phases = sorted({query.phase for query in recorder.queries if query.shape == shape and query.phase})
+            where = ' while rendering %ss' % '/'.join(phases) if phases else ''
+            found.append('%dx%s: %s' % (count, where, shape))
+    return found
+
+
+def describe(recorder):
+    """One-line summary: count, time and queries issued lazily"""
+    summary = '%d queries, %.3fs' % (recorder.count, recorder.duration)
+    lazy = recorder.lazy()
+    if lazy:
+        summary += ' (%s)' % ', '.join(
+            '%d while rendering %ss' % (count, phase) for phase, count in sorted(lazy.items())
+        )
+    return summary
+
+
+class QueryBudgetMiddleware:
+    """Log requests breaking the query budget, with their repeated query shapes"""
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        if get_budget() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        self.check(request, recorder)
+        return response
+    
+    async def __acall__(self, request):
+        # Record the connections of the thread running the request's database code
+        recorder = QueryRecorder()
+        await sync_to_async(recorder.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(recorder.__exit__)(None, None, None)
+        self.check(request, recorder)
+        return response
+    
+    def check(self, request, recorder):
+        found = problems(recorder, get_budget(), get_time_budget(), get_repeat_limit())
+        if found:
+            logger.warning(
+                'Query budget exceeded by %s %s: %s; %s',
+                request.method, request.get_full_path(), describe(recorder), '; '.join(found)
+            )
@@ -0,0 +1,70 @@
+"""
+Token-bucket rate limiting backed by the Django cache
+
+A bucket holds up to ``capacity`` tokens and refills at ``capacity`` tokens
+per ``period`` seconds; every action takes one. Its state is a single
+``(tokens, updated)`` pair in the cache named by ``CMS_RATE_LIMIT_CACHE``,
+so all processes using a shared cache (file, database or memcached) see
+the same buckets. Updates are not atomic: under heavy concurrency a few
+extra actions may slip through, which is fine for flood protection.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+KEY = 'cms:ratelimit:%s'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CMS_RATE_LIMIT_CACHE', 'default')]
+
+
+class TokenBucket:
+    
+    def __init__(self, name, capacity, period):
+        self.key = KEY % name
+        self.capacity = capacity
+        self.period = period
+    
+    @property
+    def rate(self):
+        """Tokens added per second"""
+        return self.capacity / self.period
+    
+    def _current(self, now):
+        state = get_cache().get(self.key)
+        if state is None:
+            return float(self.capacity)
+        tokens, updated = state
+        return min(self.capacity, tokens + (now - updated) * self.rate)
+    
+    def wait_time(self, now=None):
+        """Seconds until a token is available (0 when one is)"""
+        now = time.time() if now is None else now
+        tokens = self._current(now)
+        return 0 if tokens >= 1 else (1 - tokens) / self.rate
+    
+    def consume(self, now=None):
+        """Take a token and return True, or return False when the bucket is empty"""
+        now = time.time() if now is None else now
+        tokens = self._current(now)
+        if tokens < 1:
+            return False
+        get_cache().set(self.key, (tokens - 1, now), int(self.period) + 1)
+        return True
+
+
+def consume_all(buckets):
+    """
+    Take a token from every bucket if all of them have one. Returns 0 on
+    success, otherwise the seconds to wait before trying again.
+    """
+    now = time.time()
+    wait = max((bucket.wait_time(now) for bucket in buckets), default=0)
+    if wait:
+        return wait
+    for bucket in buckets:
+        bucket.consume(now)
+    return 0
@@ -0,0 +1,431 @@
+"""
+Signal receivers keeping derived data in sync with the content models, and
+configuring new database connections
+"""
+from django.contrib.auth import get_user_model
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import counters, images, page_cache, related, rollups, scheduling, search, signals, sqlite, versions
+from .models import Category, Comment, Page, Post, RelatedPost, SiteSettings
+from .site_settings import invalidate_site_settings
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, using='default', **kwargs):
+    """Keep the full-text index current when a post is saved"""
+    if raw:
+        return
+    search.index_post(instance, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, using='default', **kwargs):
+    """Remove deleted posts from the full-text index"""
+    search.remove_post(instance.pk, using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def reindex_posts_on_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if fields & {'title', 'excerpt', 'content'}:
+        search.index_posts(pks, using=using)
+
+
+@receiver(post_save, sender=Post)
+def update_post_counters(sender, instance, created=False, raw=False, using='default', **kwargs):
+    """
+    Refresh category counters when a post's status or category changed, and
+    repair the post's own comment counters, which a full save() may have
+    overwritten with stale in-memory values.
+    """
+    if raw:
+        return
+    if not created:
+        counters.refresh_post_counters([instance.pk], using=using)
+    if created or instance.has_changed('status') or instance.has_changed('category_id'):
+        counters.refresh_category_counters(
+            [instance.category_id, instance.loaded_value('category_id')], using=using
+        )
+
+
+@receiver(post_delete, sender=Post)
+def update_counters_on_post_delete(sender, instance, using='default', **kwargs):
+    counters.refresh_category_counters([instance.category_id], using=using)
+
+
+@receiver(post_save, sender=Category)
+def update_category_counters(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw or created:
+        return
+    counters.refresh_category_counters([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Comment)
+def update_comment_counters(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    counters.refresh_post_counters(
+        [instance.post_id, instance.loaded_value('post_id')], using=using
+    )
+
+
+@receiver(post_delete, sender=Comment)
+def update_counters_on_comment_delete(sender, instance, using='default', **kwargs):
+    counters.refresh_post_counters([instance.post_id], using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def update_counters_on_post_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if fields & {'category', 'category_id'}:
+        # The previous categories are gone by now; the table is small
+        counters.refresh_category_counters(using=using)
+        return
+    category_ids = Post.objects.using(using).filter(pk__in=pks).order_by().values_list(
+        'category_id', flat=True
+    ).distinct()
+    counters.refresh_category_counters(category_ids, using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Comment)
+def update_counters_on_comment_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if fields & {'post', 'post_id'}:
+        counters.refresh_post_counters(using=using)
+        return
+    post_ids = Comment.objects.using(using).filter(pk__in=pks).order_by().values_list(
+        'post_id', flat=True
+    ).distinct()
+    counters.refresh_post_counters(post_ids, using=using)
+
+
+@receiver(signals.post_bulk_delete, sender=Comment)
+def update_counters_on_comment_bulk_delete(sender, instances, using='default', **kwargs):
+    counters.refresh_post_counters({comment.post_id for comment in instances}, using=using)
+
+
+ROLLUP_POST_FIELDS = ('status', 'category_id', 'author_id', 'publish_date')
+
+
+def _post_rollup_days(post, include_loaded=True):
+    days = {rollups.local_date(post.created_at), rollups.local_date(post.publish_date)}
+    if include_loaded:
+        days.add(rollups.local_date(post.loaded_value('publish_date')))
+    return days
+
+
+@receiver(post_save, sender=Post)
+def update_rollups_on_post_save(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created or any(instance.has_changed(field) for field in ROLLUP_POST_FIELDS):
+        rollups.schedule(_post_rollup_days(instance), using=using)
+
+
+@receiver(post_delete, sender=Post)
+def update_rollups_on_post_delete(sender, instance, using='default', **kwargs):
+    rollups.schedule(_post_rollup_days(instance, include_loaded=False), using=using)
+
+
+@receiver(post_save, sender=Comment)
+def update_rollups_on_comment_save(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created or instance.has_changed('is_approved') or instance.has_changed('post_id'):
+        rollups.schedule([rollups.local_date(instance.created_at)], using=using)
+
+
+@receiver(post_delete, sender=Comment)
+def update_rollups_on_comment_delete(sender, instance, using='default', **kwargs):
+    rollups.schedule([rollups.local_date(instance.created_at)], using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def update_rollups_on_post_bulk_update(sender, pks, fields, using='default', **kwargs):
+    days = set()
+    for created_at, publish_date in Post.objects.using(using).filter(pk__in=pks).values_list(
+        'created_at', 'publish_date'
+    ):
+        days.add(rollups.local_date(created_at))
+        days.add(rollups.local_date(publish_date))
+    rollups.schedule(days, using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Comment)
+def update_rollups_on_comment_bulk_update(sender, pks, fields, using='default', **kwargs):
+    days = {
+        rollups.local_date(created_at)
+        for created_at in Comment.objects.using(using).filter(pk__in=pks).values_list('created_at', flat=True)
+    }
+    rollups.schedule(days, using=using)
+
+
+@receiver(signals.post_bulk_delete, sender=Comment)
+def update_rollups_on_comment_bulk_delete(sender, instances, using='default', **kwargs):
+    rollups.schedule({rollups.local_date(comment.created_at) for comment in instances}, using=using)
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def clear_site_settings_cache(sender, using='default', **kwargs):
+    invalidate_site_settings(using=using)
+
+
+PAGE_CACHE_LISTING_FIELDS = ('status', 'publish_date', 'category_id', 'author_id')
+PAGE_CACHE_SEARCH_FIELDS = ('title', 'excerpt', 'content')
+
+
+def _post_listing_tags(post, include_loaded=True):
+    """Tags of the pages listing or counting ``post``"""
+    tags = {
+        'post-list', 'categories',
+        page_cache.category_tag(post.category_id), page_cache.author_tag(post.author_id),
+    }
+    if include_loaded:
+        tags.add(page_cache.category_tag(post.loaded_value('category_id')))
+        tags.add(page_cache.author_tag(post.loaded_value('author_id')))
+    return tags
+
+
+@receiver(post_save, sender=Post)
+def expire_pages_on_post_save(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    tags = {page_cache.post_tag(instance.pk)}
+    if created or any(instance.has_changed(field) for field in PAGE_CACHE_LISTING_FIELDS):
+        tags |= _post_listing_tags(instance)
+    if created or any(instance.has_changed(field) for field in PAGE_CACHE_SEARCH_FIELDS):
+        tags.add('post-search')
+    page_cache.invalidate(*tags, using=using)
+
+
+@receiver(post_delete, sender=Post)
+def expire_pages_on_post_delete(sender, instance, using='default', **kwargs):
+    page_cache.invalidate(
+        page_cache.post_tag(instance.pk), page_cache.comments_tag(instance.pk), 'post-search', 'post-tags',
+        *_post_listing_tags(instance, include_loaded=False), using=using
+    )
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def expire_pages_on_post_tags_change(sender, instance, action, reverse=False, pk_set=None,
+                                     using='default', **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, Post):
+        page_cache.invalidate(page_cache.post_tag(instance.pk), 'post-tags', using=using)
+    else:
+        # A tag renamed or cleared from the tag's side; its posts are unknown
+        page_cache.invalidate('post-list', 'post-tags', using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def expire_pages_on_post_bulk_update(sender, pks, fields, using='default', **kwargs):
+    tags = {'post-list', 'categories'}
+    for pk, category_id, author_id in Post.objects.using(using).filter(pk__in=pks).values_list(
+        'pk', 'category_id', 'author_id'
+    ):
+        tags |= {page_cache.post_tag(pk), page_cache.category_tag(category_id), page_cache.author_tag(author_id)}
+    if fields & set(PAGE_CACHE_SEARCH_FIELDS):
+        tags.add('post-search')
+    if 'tags' in fields:
+        tags.add('post-tags')
+    if fields & {'category', 'category_id'}:
+        # The previous categories are gone by now
+        tags |= {
+            page_cache.category_tag(pk) for pk in Category.objects.using(using).values_list('pk', flat=True)
+        }
+    page_cache.invalidate(*tags, using=using)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def expire_pages_on_comment_change(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    page_cache.invalidate(
+        page_cache.comments_tag(instance.post_id),
+        page_cache.comments_tag(instance.loaded_value('post_id')),
+        using=using
+    )
+
+
+@receiver(signals.post_bulk_update, sender=Comment)
+def expire_pages_on_comment_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if fields & {'post', 'post_id'}:
+        post_ids = Post.objects.using(using).values_list('pk', flat=True)
+    else:
+        post_ids = Comment.objects.using(using).filter(pk__in=pks).values_list('post_id', flat=True)
+    page_cache.invalidate(*{page_cache.comments_tag(post_id) for post_id in post_ids}, using=using)
+
+
+@receiver(signals.post_bulk_delete, sender=Comment)
+def expire_pages_on_comment_bulk_delete(sender, instances, using='default', **kwargs):
+    page_cache.invalidate(*{page_cache.comments_tag(comment.post_id) for comment in instances}, using=using)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def expire_pages_on_category_change(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    page_cache.invalidate(page_cache.category_tag(instance.pk), 'categories', using=using)
+
+
+@receiver(post_save, sender=Page)
+@receiver(post_delete, sender=Page)
+def expire_pages_on_page_change(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    page_cache.invalidate(page_cache.page_tag(instance.pk), using=using)
+
+
+@receiver(post_save, sender=SiteSettings)
+@receiver(post_delete, sender=SiteSettings)
+def expire_pages_on_site_settings_change(sender, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    page_cache.invalidate('settings', using=using)
+
+
+# Image fields rendered into responsive derivatives, by model
+IMAGE_FIELDS = {
+    Post: ('featured_image',),
+    SiteSettings: ('logo',),
+}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=SiteSettings)
+def schedule_image_derivatives(sender, instance, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    for field_name in IMAGE_FIELDS[sender]:
+        if images.needs_derivatives(instance, field_name):
+            images.schedule(instance, field_name, using=using)
+
+
+@receiver(signals.image_derivatives_ready, sender=Post)
+def expire_pages_on_post_image_ready(sender, pk, using='default', **kwargs):
+    # Every page showing the image carries the post's tag
+    page_cache.invalidate(page_cache.post_tag(pk), using=using)
+    versions.bump('post', using=using)
+
+
+@receiver(signals.image_derivatives_ready, sender=SiteSettings)
+def expire_pages_on_logo_ready(sender, using='default', **kwargs):
+    invalidate_site_settings(using=using)
+    page_cache.invalidate('settings', using=using)
+    versions.bump('settings', using=using)
+
+
+@receiver(post_save, sender=Post)
+def schedule_publication(sender, instance, raw=False, using='default', **kwargs):
+    if raw or instance.status != 'scheduled':
+        return
+    if instance.has_changed('status') or instance.has_changed('publish_date'):
+        scheduling.schedule(instance.publish_date, using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def schedule_publication_on_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if not fields & {'status', 'publish_date'}:
+        return
+    for publish_date in Post.objects.using(using).filter(pk__in=pks, status='scheduled').order_by().values_list(
+        'publish_date', flat=True
+    ).distinct():
+        scheduling.schedule(publish_date, using=using)
+
+
+# Post fields the related-posts similarity depends on
+RELATED_POST_FIELDS = ('title', 'content', 'category_id', 'status')
+
+
+@receiver(post_save, sender=Post)
+def refresh_related_on_post_save(sender, instance, created=False, raw=False, using='default', **kwargs):
+    if raw:
+        return
+    if created or any(instance.has_changed(field) for field in RELATED_POST_FIELDS):
+        related.schedule([instance.pk], using=using)
+
+
+@receiver(pre_delete, sender=Post)
+def refresh_related_on_post_delete(sender, instance, using='default', **kwargs):
+    # The posts listing this one; their entries go with it
+    related.schedule(
+        RelatedPost.objects.using(using).filter(related=instance).values_list('post_id', flat=True), using=using
+    )
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def refresh_related_on_post_tags_change(sender, instance, action, using='default', **kwargs):
+    if action.startswith('post_') and isinstance(instance, Post):
+        related.schedule([instance.pk], using=using)
+
+
+@receiver(signals.post_bulk_update, sender=Post)
+def refresh_related_on_post_bulk_update(sender, pks, fields, using='default', **kwargs):
+    if fields & {'title', 'content', 'category', 'category_id', 'status', 'tags'}:
+        related.schedule(pks, using=using)
+
+
+@receiver(signals.related_posts_changed, sender=Post)
+def expire_pages_on_related_posts_change(sender, pks, using='default', **kwargs):
+    page_cache.invalidate(*(page_cache.related_tag(pk) for pk in pks), using=using)
+    versions.bump('related', using=using)
+
+
+# Content version of each model, read by the ETag validators
+VERSIONED_MODELS = {
+    Post: 'post',
+    Comment: 'comment',
+    Category: 'category',
+    Page: 'page',
+    SiteSettings: 'settings',
+    get_user_model(): 'user',
+}
+
+
+def bump_content_version(sender, raw=False, update_fields=None, using='default', **kwargs):
+    name = VERSIONED_MODELS[sender]
+    if raw:
+        return
+    if name == 'user' and update_fields is not None and set(update_fields) <= {'last_login'}:
+        # Logging in changes nothing that is shown
+        return
+    versions.bump(name, using=using)
+
+
+# Connected per model: a post_delete receiver for every sender would stop
+# Django from deleting any other model's rows without loading them first
+for _model in VERSIONED_MODELS:
+    post_save.connect(bump_content_version, sender=_model)
+    post_delete.connect(bump_content_version, sender=_model)
+
+
+@receiver(signals.post_bulk_update)
+def bump_content_version_on_bulk_update(sender, pks, fields, using='default', **kwargs):
+    name = VERSIONED_MODELS.get(sender)
+    if name is None:
+        return
+    names = [name, 'tag'] if 'tags' in fields else [name]
+    versions.bump(*names, using=using)
+
+
+@receiver(signals.post_bulk_delete)
+def bump_content_version_on_bulk_delete(sender, using='default', **kwargs):
+    name = VERSIONED_MODELS.get(sender)
+    if name is not None:
+        versions.bump(name, using=using)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def bump_tag_version(sender, action, using='default', **kwargs):
+    if action.startswith('post_'):
+        versions.bump('tag', using=using)
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply the production pragmas (CMS_SQLITE_PRAGMAS) to new SQLite connections"""
+    if connection.vendor == 'sqlite':
+        sqlite.apply_pragmas(connection)
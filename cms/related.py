@@ -0,0 +1,365 @@
+"""
+Related posts from tag, category and text similarity
+
+Every published post is described by its tag set, its category and a
+TF-IDF vector of its title and plain text (its strongest terms only). Two
+posts score the weighted sum of the Jaccard index of their tags, whether
+they share a category and the cosine of their text vectors. Each post's
+best ``CMS_RELATED_POSTS_TOP_K`` matches are stored in ``RelatedPost``, so
+pages read them with one indexed lookup.
+
+Vectors are sparse dicts and candidates come from inverted indexes (posts
+by tag, by category and by term), so only posts sharing something are
+ever compared. ``rebuild_related_posts`` computes everything from the
+texts and stores each post's vector (``RelatedTerm``) and the document
+frequency of every term (``TermFrequency``). When posts change, a
+background job recomputes their vectors against those frequencies, then
+loads from the indexes only the posts sharing a tag, a term or the
+category with them, and recomputes their lists and the lists they may
+enter or leave. Term weights drift from the live corpus until the next
+rebuild, so run it now and then (nightly on busy sites).
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Count, Min
+
+from . import jobs, signals
+from .models import Post, RelatedPost, RelatedTerm, TermFrequency
+
+
+TAG_WEIGHT = 0.5
+CATEGORY_WEIGHT = 0.2
+TEXT_WEIGHT = 0.3
+
+# Strongest terms kept in each post's text vector
+MAX_TERMS = 40
+
+# Title words count as this many occurrences
+TITLE_BOOST = 3
+
+_TERM_RE = re.compile(r'[^\W\d_]{3,}', re.UNICODE)
+
+# Longer "words" are noise and do not fit RelatedTerm.term
+MAX_TERM_LENGTH = 100
+
+# Ids per IN (...) list
+CHUNK_SIZE = 500
+
+
+def get_top_k():
+    """Related posts stored per post; views show the first few still published"""
+    return getattr(settings, 'CMS_RELATED_POSTS_TOP_K', 6)
+
+
+def get_related_posts(post, limit=3):
+    """Published related posts of ``post``, best first, in one query"""
+    return Post.objects.filter(related_from__post=post, status='published').order_by('related_from__rank')[:limit]
+
+
+def _terms(text):
+    return [term for term in _TERM_RE.findall(text.lower()) if len(term) <= MAX_TERM_LENGTH]
+
+
+def _term_counts(title, text):
+    terms = Counter(_terms(text))
+    for term in _terms(title):
+        terms[term] += TITLE_BOOST
+    return terms
+
+
+def _vector(terms, document_frequency, total):
+    """Unit TF-IDF vector of a post's strongest terms; ``terms`` are its term counts"""
+    weights = {
+        term: (1 + math.log(count)) * math.log(total / document_frequency.get(term, 1))
+        for term, count in terms.items()
+    }
+    top = heapq.nlargest(MAX_TERMS, ((weight, term) for term, weight in weights.items() if weight > 0))
+    norm = math.sqrt(sum(weight * weight for weight, _ in top))
+    return {term: weight / norm for weight, term in top} if norm else {}
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _tag_links(using):
+    return Post.tags.through.objects.using(using).filter(
+        content_type=ContentType.objects.db_manager(using).get_for_model(Post)
+    )
+
+
+def _post_tags(post_ids=None, using='default'):
+    """``{post_id: [tag_id, ...]}`` of ``post_ids``, or of every post"""
+    links = _tag_links(using)
+    if post_ids is None:
+        batches = [links]
+    else:
+        batches = (links.filter(object_id__in=chunk) for chunk in _chunks(post_ids))
+    tags = defaultdict(list)
+    for batch in batches:
+        for object_id, tag_id in batch.values_list('object_id', 'tag_id'):
+            tags[object_id].append(tag_id)
+    return tags
+
+
+class Corpus:
+    """Features and inverted indexes of a set of published posts"""
+    
+    def __init__(self):
+        self.tags = {}
+        self.categories = {}
+        self.vectors = {}
+        self.by_tag = defaultdict(set)
+        self.by_category = defaultdict(set)
+        self.by_term = defaultdict(list)
+        self.document_frequency = Counter()
+    
+    def add(self, post_id, category_id, tag_ids, vector):
+        self.tags[post_id] = set(tag_ids)
+        self.categories[post_id] = category_id
+        self.vectors[post_id] = vector
+        for tag_id in tag_ids:
+            self.by_tag[tag_id].add(post_id)
+        if category_id is not None:
+            self.by_category[category_id].add(post_id)
+        for term, weight in vector.items():
+            self.by_term[term].append((post_id, weight))
+    
+    @classmethod
+    def build(cls, posts):
+        """From the texts of all posts: ``(id, category_id, tag_ids, title, text)``"""
+        corpus = cls()
+        posts = [
+            (post_id, category_id, tag_ids, _term_counts(title, text))
+            for post_id, category_id, tag_ids, title, text in posts
+        ]
+        corpus.document_frequency = Counter(term for *_, terms in posts for term in terms)
+        for post_id, category_id, tag_ids, terms in posts:
+            corpus.add(post_id, category_id, tag_ids, _vector(terms, corpus.document_frequency, len(posts)))
+        return corpus
+    
+    @classmethod
+    def load(cls, using='default'):
+        """Every published post, from its text"""
+        posts = Post.objects.using(using).filter(status='published').order_by().values_list(
+            'id', 'category_id', 'title', 'content_text'
+        )
+        tags = _post_tags(using=using)
+        return cls.build(
+            (post_id, category_id, tags.get(post_id, ()), title, text)
+            for post_id, category_id, title, text in posts
+        )
+    
+    def load_stored(self, post_ids, using='default'):
+        """Add the published posts among ``post_ids`` not loaded yet, from the stored vectors"""
+        missing = {post_id for post_id in post_ids if post_id not in self}
+        if not missing:
+            return
+        categories = {}
+        vectors = defaultdict(dict)
+        for chunk in _chunks(missing):
+            categories.update(
+                Post.objects.using(using).filter(pk__in=chunk, status='published').values_list('id', 'category_id')
+            )
+            for post_id, term, weight in RelatedTerm.objects.using(using).filter(post_id__in=chunk).values_list(
+                'post_id', 'term', 'weight'
+            ):
+                vectors[post_id][term] = weight
+        tags = _post_tags(categories, using)
+        for post_id, category_id in categories.items():
+            self.add(post_id, category_id, tags.get(post_id, ()), vectors.get(post_id, {}))
+    
+    def load_neighbors(self, post_ids, k, using='default'):
+        """
+        Load every post sharing a tag or a term with the (loaded) posts
+        ``post_ids``, and enough of the newest posts of their categories:
+        those share nothing else, all score the same and ties go to the
+        newer post.
+        """
+        post_ids = [post_id for post_id in post_ids if post_id in self]
+        tag_ids = set().union(*(self.tags[post_id] for post_id in post_ids))
+        terms = set().union(*(self.vectors[post_id] for post_id in post_ids))
+        neighbors = set()
+        for chunk in _chunks(tag_ids):
+            neighbors.update(_tag_links(using).filter(tag_id__in=chunk).values_list('object_id', flat=True))
+        for chunk in _chunks(terms):
+            neighbors.update(RelatedTerm.objects.using(using).filter(term__in=chunk).values_list('post_id', flat=True))
+        # Room for k category-only posts past the others and the posts themselves
+        newest = k + len(post_ids) + len(neighbors)
+        for category_id in {self.categories[post_id] for post_id in post_ids} - {None}:
+            posts = Post.objects.using(using).filter(category_id=category_id, status='published')
+            neighbors.update(posts.order_by('-id').values_list('id', flat=True)[:newest])
+        self.load_stored(neighbors, using)
+    
+    def __contains__(self, post_id):
+        return post_id in self.tags
+    
+    def scores(self, post_id):
+        """``{other_id: score}`` for every post sharing something with ``post_id``"""
+        scores = defaultdict(float)
+        tags = self.tags[post_id]
+        shared = Counter(other for tag_id in tags for other in self.by_tag[tag_id])
+        for other, count in shared.items():
+            scores[other] += TAG_WEIGHT * count / (len(tags) + len(self.tags[other]) - count)
+        category_id = self.categories[post_id]
+        if category_id is not None:
+            for other in self.by_category[category_id]:
+                scores[other] += CATEGORY_WEIGHT
+        for term, weight in self.vectors[post_id].items():
+            for other, other_weight in self.by_term[term]:
+                scores[other] += TEXT_WEIGHT * weight * other_weight
+        scores.pop(post_id, None)
+        return scores
+    
+    def most_similar(self, post_id, k):
+        """The ``k`` best ``(other_id, score)``; ties go to the newer post"""
+        return heapq.nlargest(k, self.scores(post_id).items(), key=lambda item: (item[1], item[0]))
+
+
+def _store(lists, using):
+    """
+    Replace the related posts of the posts in ``lists`` and return the ids
+    whose list actually changed
+    """
+    current = defaultdict(list)
+    for post_id, related_id in RelatedPost.objects.using(using).filter(post_id__in=list(lists)).values_list(
+        'post_id', 'related_id'
+    ):
+        current[post_id].append(related_id)
+    changed = [
+        post_id for post_id, entries in lists.items()
+        if current.get(post_id, []) != [related_id for related_id, _ in entries]
+    ]
+    with transaction.atomic(using=using):
+        RelatedPost.objects.using(using).filter(post_id__in=changed).delete()
+        RelatedPost.objects.using(using).bulk_create([
+            RelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+            for post_id in changed
+            for rank, (related_id, score) in enumerate(lists[post_id])
+        ], batch_size=500)
+    return changed
+
+
+def update_vectors(post_ids, using='default'):
+    """Recompute and store the vectors of ``post_ids``, weighed by the stored term frequencies"""
+    posts = {}
+    for chunk in _chunks(post_ids):
+        for post_id, title, text in Post.objects.using(using).filter(pk__in=chunk, status='published').values_list(
+            'id', 'title', 'content_text'
+        ):
+            posts[post_id] = _term_counts(title, text)
+    terms = set().union(*posts.values())
+    document_frequency = {}
+    for chunk in _chunks(terms):
+        document_frequency.update(
+            TermFrequency.objects.using(using).filter(term__in=chunk).values_list('term', 'documents')
+        )
+    total = Post.objects.using(using).filter(status='published').count()
+    with transaction.atomic(using=using):
+        for chunk in _chunks(post_ids):
+            RelatedTerm.objects.using(using).filter(post_id__in=chunk).delete()
+        RelatedTerm.objects.using(using).bulk_create([
+            RelatedTerm(post_id=post_id, term=term, weight=weight)
+            for post_id, counts in posts.items()
+            for term, weight in _vector(counts, document_frequency, total).items()
+        ], batch_size=500)
+
+
+def refresh(post_ids, using='default'):
+    """
+    Recompute the related posts of ``post_ids`` after they changed, along
+    with the lists of other posts they may have entered or left
+    """
+    if not TermFrequency.objects.using(using).exists():
+        # Never rebuilt, so there are no stored vectors to start from
+        rebuild(using)
+        return
+    k = get_top_k()
+    post_ids = set(post_ids)
+    update_vectors(post_ids, using)
+    corpus = Corpus()
+    corpus.load_stored(post_ids, using)
+    corpus.load_neighbors(post_ids, k, using)
+    
+    targets = set(post_ids)
+    for chunk in _chunks(post_ids):
+        targets.update(RelatedPost.objects.using(using).filter(related_id__in=chunk).values_list('post_id', flat=True))
+    scores = {post_id: corpus.scores(post_id) for post_id in post_ids if post_id in corpus}
+    candidates = set().union(*scores.values())
+    thresholds = {}
+    for chunk in _chunks(candidates):
+        thresholds.update(
+            (row['post_id'], row['low'] if row['count'] >= k else 0)
+            for row in RelatedPost.objects.using(using).filter(post_id__in=chunk).order_by().values(
+                'post_id'
+            ).annotate(count=Count('id'), low=Min('score'))
+        )
+    for post_scores in scores.values():
+        targets.update(other for other, score in post_scores.items() if score > thresholds.get(other, 0))
+    
+    corpus.load_stored(targets, using)
+    corpus.load_neighbors(targets, k, using)
+    lists = {
+        post_id: corpus.most_similar(post_id, k) if post_id in corpus else []
+        for post_id in targets
+    }
+    changed = _store(lists, using)
+    if changed:
+        signals.related_posts_changed.send(sender=Post, pks=changed, using=using)
+    return changed
+
+
+def rebuild(using='default'):
+    """
+    Recompute the related posts, vectors and term frequencies of every
+    post; returns the number of posts
+    """
+    corpus = Corpus.load(using)
+    k = get_top_k()
+    entries = [
+        RelatedPost(post_id=post_id, related_id=related_id, rank=rank, score=score)
+        for post_id in corpus.tags
+        for rank, (related_id, score) in enumerate(corpus.most_similar(post_id, k))
+    ]
+    with transaction.atomic(using=using):
+        RelatedPost.objects.using(using).all().delete()
+        RelatedPost.objects.using(using).bulk_create(entries, batch_size=500)
+        RelatedTerm.objects.using(using).all().delete()
+        RelatedTerm.objects.using(using).bulk_create((
+            RelatedTerm(post_id=post_id, term=term, weight=weight)
+            for post_id, vector in corpus.vectors.items()
+            for term, weight in vector.items()
+        ), batch_size=500)
+        TermFrequency.objects.using(using).all().delete()
+        TermFrequency.objects.using(using).bulk_create((
+            TermFrequency(term=term, documents=documents)
+            for term, documents in corpus.document_frequency.items()
+        ), batch_size=500)
+    signals.related_posts_changed.send(sender=Post, pks=list(corpus.tags), using=using)
+    return len(corpus.tags)
+
+
+@jobs.task(priority=150)
+def refresh_job(post_ids, using='default'):
+    refresh(post_ids, using=using)
+
+
+def schedule(post_ids, using='default'):
+    """Queue a refresh of the related posts around ``post_ids``"""
+    post_ids = sorted(set(post_ids))
+    if not post_ids:
+        return
+    jobs.enqueue(
+        refresh_job,
+        {'post_ids': post_ids, 'using': using},
+        dedup_key='related:%s' % post_ids[0] if len(post_ids) == 1 else None,
+        using=using,
+    )
@@ -0,0 +1,208 @@
+"""
+Read replicas with read-your-writes stickiness
+
+``ReplicaMiddleware`` picks, for each safe request to a view marked with
+``replica_reads``, one of the ``CMS_READ_REPLICAS`` database aliases that
+is not lagging more than ``CMS_REPLICA_MAX_LAG`` seconds, and
+``ReplicaRouter`` sends that request's reads there. Everything else (all
+writes, transactions, sessions, the job queue, admin and unsafe requests)
+stays on the primary. A request that writes, or uses an unsafe method,
+sets a cookie keeping that visitor's reads on the primary for
+``CMS_REPLICA_STICKY_SECONDS``, long enough for the replicas to catch up.
+
+SQLite replicas are copies of the primary file made with the backup API by
+``manage.py sync_replicas``; the modification time of a copy tells its lag.
+"""
+import contextvars
+import os
+import random
+import sqlite3
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+STICKY_COOKIE = 'cms_primary_until'
+
+# Tables whose rows must be read as soon as they are written
+PRIMARY_MODELS = {'sessions.session', 'cms.job'}
+
+# Replica alias reads go to in the current request, None for the primary
+_replica = contextvars.ContextVar('cms_replica', default=None)
+
+# Statements on the primary that do not change data
+_READ_STATEMENTS = ('SELECT', 'SAVEPOINT', 'RELEASE', 'PRAGMA')
+
+
+def get_replicas():
+    return tuple(getattr(settings, 'CMS_READ_REPLICAS', ()))
+
+
+def get_max_lag():
+    return getattr(settings, 'CMS_REPLICA_MAX_LAG', 10)
+
+
+def get_sticky_seconds():
+    return getattr(settings, 'CMS_REPLICA_STICKY_SECONDS', 15)
+
+
+def replica_reads(view):
+    """Mark a function view whose GET/HEAD requests may read from a replica"""
+    view.replica_reads = True
+    return view
+
+
+def reads_from_replica(view_func):
+    """Whether ``view_func`` (a function, class-based or DRF view) is marked"""
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    return getattr(view_class or view_func, 'replica_reads', False)
+
+
+def get_lag(alias):
+    """
+    Seconds since the SQLite replica ``alias`` was last synced, None when it
+    was never synced. Test mirrors of the primary have no lag.
+    """
+    name = connections[alias].settings_dict['NAME']
+    if name == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return 0.0
+    try:
+        return max(time.time() - os.path.getmtime(name), 0.0)
+    except OSError:
+        return None
+
+
+def choose_replica():
+    """A replica alias within the lag limit, or None to read from the primary"""
+    max_lag = get_max_lag()
+    fresh = [alias for alias in get_replicas() if (lag := get_lag(alias)) is not None and lag <= max_lag]
+    return random.choice(fresh) if fresh else None
+
+
+def sync(alias, pages=-1):
+    """
+    Copy the primary database into the SQLite replica ``alias`` with the
+    backup API; returns the seconds the copy took. Readers of the replica
+    see the previous copy until it completes.
+    """
+    source_name = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+    target_name = connections[alias].settings_dict['NAME']
+    os.makedirs(os.path.dirname(os.path.abspath(target_name)), exist_ok=True)
+    start = time.monotonic()
+    # URIs like Django's own connections, so test databases work too
+    source = sqlite3.connect(source_name, uri=True)
+    try:
+        target = sqlite3.connect(target_name, uri=True)
+        try:
+            source.backup(target, pages=pages)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    # Marks the sync time even when no page changed
+    os.utime(target_name)
+    return time.monotonic() - start
+
+
+class ReplicaRouter:
+    """Send reads to the replica chosen for the current request, the rest to the primary"""
+    
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or model._meta.label_lower in PRIMARY_MODELS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            # Reads inside a transaction must see its writes
+            return None
+        return alias
+    
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema with the data, from the primary
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaMiddleware:
+    """Choose where each request reads from and keep writers on the primary"""
+    
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.replica = None
+        request.wrote = False
+        token = _replica.set(None)
+        try:
+            # Also sees writes with an explicit using='default', which skip the router
+            with connections[DEFAULT_DB_ALIAS].execute_wrapper(self.watch_writes(request)):
+                response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.stick(request, response)
+    
+    async def __acall__(self, request):
+        request.replica = None
+        request.wrote = False
+        token = _replica.set(None)
+        try:
+            # The connection of the thread running the request's database code
+            primary = await sync_to_async(connections.__getitem__)(DEFAULT_DB_ALIAS)
+            with primary.execute_wrapper(self.watch_writes(request)):
+                response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        return self.stick(request, response)
+    
+    def stick(self, request, response):
+        """Keep a visitor who just wrote on the primary for a while"""
+        if request.method not in self.SAFE_METHODS or request.wrote:
+            sticky = get_sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, str(int(time.time() + sticky)), max_age=sticky, httponly=True, samesite='Lax'
+            )
+        return response
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in self.SAFE_METHODS or not reads_from_replica(view_func):
+            return None
+        if self.is_sticky(request):
+            return None
+        request.replica = choose_replica()
+        _replica.set(request.replica)
+        return None
+    
+    def watch_writes(self, request):
+        def wrapper(execute, sql, params, many, context):
+            if not request.wrote and not sql.lstrip().upper().startswith(_READ_STATEMENTS):
+                # Read this request's own writes from here on
+                request.wrote = True
+                _replica.set(None)
+            return execute(sql, params, many, context)
+        return wrapper
+    
+    def is_sticky(self, request):
+        try:
+            return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
@@ -0,0 +1,166 @@
+"""
+Daily activity rollups (``DailyStats``)
+
+Each day is rebuilt from the source rows with a few GROUP BY queries, so a
+rollup is always exact for the days it covers. Receivers queue a background
+job rebuilding just the days touched by a write, so saving a post or a
+comment costs a single insert; ``rollup_stats`` backfills ranges.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from . import jobs
+from .models import Comment, DailyStats, Post
+
+
+METRICS = ('posts_created', 'posts_published', 'comments_received', 'comments_approved')
+
+
+def local_date(value):
+    """Calendar date of an aware datetime in the current time zone"""
+    if value is None:
+        return None
+    return timezone.localtime(value).date()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def rollup_range(start, end, using='default', post_model=Post, comment_model=Comment, stats_model=DailyStats):
+    """
+    Rebuild the rollup rows for every day from ``start`` to ``end``
+    (inclusive) and return the number of rows written. The model arguments
+    let migrations run it against historical models.
+    """
+    start_dt, end_dt = _day_start(start), _day_start(end + timedelta(days=1))
+    buckets = defaultdict(lambda: dict.fromkeys(METRICS, 0))
+    posts = post_model._default_manager.using(using).order_by()
+    comments = comment_model._default_manager.using(using).order_by()
+
+    created = posts.filter(created_at__gte=start_dt, created_at__lt=end_dt).annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'category_id', 'author_id').annotate(count=Count('pk'))
+    for row in created:
+        buckets[row['day'], row['category_id'], row['author_id']]['posts_created'] += row['count']
+
+    published = posts.filter(status='published', publish_date__gte=start_dt, publish_date__lt=end_dt).annotate(
+        day=TruncDate('publish_date')
+    ).values('day', 'category_id', 'author_id').annotate(count=Count('pk'))
+    for row in published:
+        buckets[row['day'], row['category_id'], row['author_id']]['posts_published'] += row['count']
+
+    received = comments.filter(created_at__gte=start_dt, created_at__lt=end_dt).annotate(
+        day=TruncDate('created_at')
+    ).values('day', 'post__category_id', 'post__author_id').annotate(
+        received=Count('pk'), approved=Count('pk', filter=Q(is_approved=True))
+    )
+    for row in received:
+        bucket = buckets[row['day'], row['post__category_id'], row['post__author_id']]
+        bucket['comments_received'] += row['received']
+        bucket['comments_approved'] += row['approved']
+
+    rows = [
+        stats_model(date=day, category_id=category_id, author_id=author_id, **metrics)
+        for (day, category_id, author_id), metrics in buckets.items()
+    ]
+    with transaction.atomic(using=using):
+        stats_model._default_manager.using(using).filter(date__gte=start, date__lte=end).delete()
+        stats_model._default_manager.using(using).bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+# Days touched by one write that are at most this far apart are rebuilt as
+# one range: redoing the untouched days between them costs less than
+# another round of queries
+MAX_GAP_DAYS = 7
+
+
+def refresh_days(days, using='default'):
+    """Rebuild the rollups of a few individual days"""
+    days = sorted({day for day in days if day is not None})
+    if not days:
+        return
+    start = end = days[0]
+    for day in days[1:]:
+        if (day - end).days > MAX_GAP_DAYS:
+            rollup_range(start, end, using=using)
+            start = day
+        end = day
+    rollup_range(start, end, using=using)
+
+
+@jobs.task(priority=150)
+def refresh_job(days, using='default'):
+    refresh_days([date.fromisoformat(day) for day in days], using=using)
+
+
+def schedule(days, using='default'):
+    """Queue a rebuild of the rollups of ``days``; one queued job per day"""
+    for day in sorted({day for day in days if day is not None}):
+        jobs.enqueue(
+            refresh_job,
+            {'days': [day.isoformat()], 'using': using},
+            dedup_key='rollups:%s' % day.isoformat(),
+            using=using,
+        )
+
+
+def _filtered(category=None, author=None):
+    queryset = DailyStats.objects.order_by()
+    if category is not None:
+        queryset = queryset.filter(category=category)
+    if author is not None:
+        queryset = queryset.filter(author=author)
+    return queryset
+
+
+def daily_series(days, metrics=METRICS, category=None, author=None, today=None):
+    """
+    Per-day totals for the last ``days`` days (oldest first), read from the
+    rollup table. Returns ``{'dates': [...], metric: [...], ...}``.
+    """
+    today = today or timezone.localdate()
+    dates = [today - timedelta(days=i) for i in range(days - 1, -1, -1)]
+    rows = _filtered(category, author).filter(date__gte=dates[0], date__lte=today).values('date').annotate(
+        **{metric: Sum(metric) for metric in metrics}
+    )
+    by_date = {row['date']: row for row in rows}
+    series = {'dates': dates}
+    for metric in metrics:
+        series[metric] = [by_date.get(day, {}).get(metric) or 0 for day in dates]
+    return series
+
+
+def month_starts(today, months):
+    """First day of each of the last ``months`` calendar months, oldest first"""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(months):
+        starts.append(today.replace(year=year, month=month, day=1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    return list(reversed(starts))
+
+
+def monthly_series(months, metrics=METRICS, category=None, author=None, today=None):
+    """
+    Per-calendar-month totals for the last ``months`` months (oldest first),
+    grouped in SQL with TruncMonth over the rollup table.
+    """
+    today = today or timezone.localdate()
+    periods = month_starts(today, months)
+    rows = _filtered(category, author).filter(date__gte=periods[0], date__lte=today).annotate(
+        month=TruncMonth('date')
+    ).values('month').annotate(**{metric: Sum(metric) for metric in metrics})
+    by_month = {row['month']: row for row in rows}
+    series = {'periods': periods}
+    for metric in metrics:
+        series[metric] = [by_month.get(period, {}).get(metric) or 0 for period in periods]
+    return series
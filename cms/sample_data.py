@@ -0,0 +1,304 @@
+"""
+Synthetic content at production scale
+
+``generate()`` inserts any number of posts with generated HTML, tags,
+comments and related posts. Worker processes build the rows (content,
+``Post.populate_derived_fields``, comment counters) a few batches ahead
+while the calling process writes them with ``bulk_create``, one
+transaction per batch, bypassing save() and the per-object signals. What
+the receivers would maintain (category counters, rollups, the search
+index, content versions and the publishing job) is refreshed in bulk. The
+same seed always produces the same content, whatever the process count.
+"""
+import multiprocessing
+import random
+from collections import deque
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import F, Max, Min, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.text import slugify
+from taggit.models import Tag
+
+from . import counters, page_cache, related, rollups, scheduling, search, versions
+from .models import Category, Comment, Post, RelatedPost
+
+
+WORDS = (
+    'django', 'python', 'sqlite', 'query', 'index', 'cache', 'template', 'model', 'view', 'request',
+    'response', 'server', 'client', 'database', 'migration', 'schema', 'field', 'admin', 'user', 'session',
+    'deploy', 'release', 'feature', 'design', 'pattern', 'service', 'worker', 'queue', 'latency', 'memory',
+    'thread', 'process', 'network', 'storage', 'backup', 'replica', 'search', 'ranking', 'content', 'editor',
+    'image', 'upload', 'comment', 'category', 'archive', 'feed', 'security', 'token', 'session', 'cookie',
+    'browser', 'layout', 'style', 'script', 'module', 'package', 'testing', 'benchmark', 'profile', 'trace',
+    'garden', 'kitchen', 'travel', 'mountain', 'river', 'coffee', 'music', 'summer', 'winter', 'city',
+    'market', 'history', 'science', 'health', 'sport', 'camera', 'bicycle', 'library', 'museum', 'festival',
+    'simple', 'quick', 'modern', 'careful', 'better', 'faster', 'smaller', 'reliable', 'practical', 'complete',
+    'build', 'measure', 'improve', 'explain', 'compare', 'choose', 'avoid', 'learn', 'share', 'review',
+)
+
+CATEGORY_NAMES = (
+    'Technology', 'Web Development', 'Django', 'Python', 'News',
+    'Databases', 'Operations', 'Design', 'Travel', 'Science',
+)
+
+# Distinct tags, and tags per post
+TAG_COUNT = 200
+TAGS_PER_POST = 3
+
+# Share of drafts and of posts scheduled in the future; the rest are published
+DRAFT_RATIO = 0.05
+SCHEDULED_RATIO = 0.05
+
+# Days the publish dates of the generated posts are spread over
+DAYS_SPAN = 3 * 365
+
+COMMENT_APPROVED_RATIO = 0.8
+
+
+def _sentence(rng, words):
+    text = ' '.join(rng.choices(WORDS, k=words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def _paragraph(rng):
+    return ' '.join(_sentence(rng, rng.randint(6, 16)) for _ in range(rng.randint(3, 7)))
+
+
+def _content(rng):
+    parts = ['<h2>%s</h2>' % _sentence(rng, rng.randint(3, 6))]
+    for _ in range(rng.randint(3, 6)):
+        parts.append('<p>%s</p>' % _paragraph(rng))
+    if rng.random() < 0.3:
+        parts.append('<ul>%s</ul>' % ''.join('<li>%s</li>' % _sentence(rng, 4) for _ in range(3)))
+    return '\n'.join(parts)
+
+
+def _next_id(model, using):
+    return (model.objects.using(using).aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _ensure_users(count, using):
+    """Ids of ``count`` authors, creating the missing ``author<n>`` users"""
+    authors = User.objects.using(using).filter(username__startswith='author').order_by('pk')
+    existing = list(authors.values_list('pk', flat=True)[:count])
+    missing = count - len(existing)
+    if missing > 0:
+        # One unusable password hash shared by all, hashing is the slow part
+        password = make_password(None)
+        first = _next_id(User, using)
+        users = [
+            User(pk=pk, username='author%d' % pk, email='author%d@example.com' % pk, password=password, is_staff=True)
+            for pk in range(first, first + missing)
+        ]
+        User.objects.using(using).bulk_create(users, batch_size=500)
+        existing += [user.pk for user in users]
+    return existing
+
+
+def _ensure_categories(using):
+    categories = []
+    for name in CATEGORY_NAMES:
+        category, _ = Category.objects.using(using).get_or_create(name=name, defaults={'slug': slugify(name)})
+        categories.append(category.pk)
+    return categories
+
+
+def _ensure_tags(rng, using):
+    names = sorted({'%s-%s' % (rng.choice(WORDS), rng.choice(WORDS)) for _ in range(TAG_COUNT * 2)})[:TAG_COUNT]
+    tags = Tag.objects.using(using)
+    existing = set(tags.filter(name__in=names).values_list('name', flat=True))
+    tags.bulk_create(
+        [Tag(name=name, slug=slugify(name)) for name in names if name not in existing], ignore_conflicts=True
+    )
+    return list(tags.filter(name__in=names).order_by('name').values_list('pk', flat=True))
+
+
+def _make_post(rng, pk):
+    draw = rng.random()
+    if draw < DRAFT_RATIO:
+        status, publish_date = 'draft', _worker['now'] - timedelta(seconds=rng.randrange(DAYS_SPAN * 86400))
+    elif draw < DRAFT_RATIO + SCHEDULED_RATIO:
+        status, publish_date = 'scheduled', _worker['now'] + timedelta(seconds=rng.randrange(60, 30 * 86400))
+    else:
+        status, publish_date = 'published', _worker['now'] - timedelta(seconds=rng.randrange(DAYS_SPAN * 86400))
+    post = Post(
+        pk=pk,
+        title='%s %d' % (_sentence(rng, rng.randint(3, 8))[:-1], pk),
+        content=_content(rng),
+        author_id=rng.choice(_worker['author_ids']),
+        category_id=rng.choice(_worker['category_ids']),
+        status=status,
+        publish_date=publish_date,
+    )
+    post.populate_derived_fields()
+    return post
+
+
+def _make_comments(rng, post, count):
+    return [
+        Comment(
+            post_id=post.pk,
+            name='Reader %d' % rng.randrange(10000),
+            email='reader%d@example.com' % rng.randrange(10000),
+            content=_sentence(rng, rng.randint(5, 25)),
+            is_approved=rng.random() < COMMENT_APPROVED_RATIO,
+        )
+        for _ in range(count)
+    ]
+
+
+def _related_entries(posts, k):
+    """Each post's nearest neighbours of the same category in the batch"""
+    by_category = {}
+    for post in posts:
+        by_category.setdefault(post.category_id, []).append(post.pk)
+    entries = []
+    for post_ids in by_category.values():
+        for index, post_id in enumerate(post_ids):
+            neighbours = [post_ids[(index + offset) % len(post_ids)] for offset in range(1, k + 1)]
+            entries += [
+                RelatedPost(post_id=post_id, related_id=other, rank=rank, score=1.0 / (rank + 1))
+                for rank, other in enumerate(dict.fromkeys(neighbours)) if other != post_id
+            ]
+    return entries
+
+
+# What every batch is built from, set in each worker process by _init_worker()
+_worker = {}
+
+
+def _init_worker(context):
+    _worker.clear()
+    _worker.update(context)
+
+
+def _build_batch(task):
+    """
+    The rows of one batch, ready for bulk_create. Each batch has its own
+    random generator, so the content does not depend on the process count.
+    """
+    start, first_pk, count = task
+    rng = random.Random('%s:%d' % (_worker['seed'], start))
+    through = Post.tags.through
+    posts, comments, tagged = [], [], []
+    for pk in range(first_pk, first_pk + count):
+        post = _make_post(rng, pk)
+        if post.status == 'published':
+            post_comments = _make_comments(rng, post, _worker['comments_per_post'])
+            post.total_comment_count = len(post_comments)
+            post.approved_comment_count = sum(comment.is_approved for comment in post_comments)
+            comments += post_comments
+        tag_ids = _worker['tag_ids']
+        tagged += [
+            through(content_type_id=_worker['content_type_id'], object_id=pk, tag_id=tag_id)
+            for tag_id in rng.sample(tag_ids, min(TAGS_PER_POST, len(tag_ids)))
+        ]
+        posts.append(post)
+    return posts, comments, tagged, _related_entries(posts, _worker['top_k'])
+
+
+def _build_batches(context, tasks, processes):
+    """Yield the batches of ``tasks`` in order, built by ``processes`` worker processes"""
+    if processes <= 1:
+        _init_worker(context)
+        yield from map(_build_batch, tasks)
+        return
+    # Children must not share the parent's database connections
+    connections.close_all()
+    tasks = iter(tasks)
+    with multiprocessing.get_context('fork').Pool(processes, _init_worker, (context,)) as pool:
+        # A few batches ahead of the writer, not the whole dataset in memory
+        pending = deque(pool.apply_async(_build_batch, (task,)) for task in islice(tasks, processes * 2))
+        while pending:
+            batch = pending.popleft().get()
+            pending.extend(pool.apply_async(_build_batch, (task,)) for task in islice(tasks, 1))
+            yield batch
+
+
+def _write_batch(batch, using):
+    posts, comments, tagged, entries = batch
+    post_ids = [post.pk for post in posts]
+    with transaction.atomic(using=using):
+        Post.objects.using(using).bulk_create(posts)
+        Post.tags.through.objects.using(using).bulk_create(tagged)
+        Comment.objects.using(using).bulk_create(comments)
+        RelatedPost.objects.using(using).bulk_create(entries)
+        # created_at is always "now" on insert; date the rows like the posts
+        Post.objects.using(using).filter(pk__in=post_ids).exclude(status='scheduled').update(
+            created_at=F('publish_date')
+        )
+        Comment.objects.using(using).filter(post_id__gte=post_ids[0], post_id__lte=post_ids[-1]).update(
+            created_at=Subquery(Post.objects.filter(pk=OuterRef('post_id')).values('publish_date')[:1])
+        )
+        search.index_posts(post_ids, using=using)
+
+
+def generate(posts, comments_per_post=3, users=None, seed=0, batch_size=1000, processes=1, using='default',
+             progress=None):
+    """
+    Insert ``posts`` generated posts by ``users`` authors (one per 100 posts
+    by default) with ``comments_per_post`` comments on each published one.
+    Content is generated by ``processes`` processes while this one writes.
+    ``progress`` is called with the number of posts written after every
+    batch. Returns the counts of the rows created.
+    """
+    if users is None:
+        users = max(1, posts // 100)
+    author_ids = _ensure_users(users, using)
+    context = {
+        'seed': seed,
+        'now': timezone.now(),
+        'comments_per_post': comments_per_post,
+        'author_ids': author_ids,
+        'category_ids': _ensure_categories(using),
+        'tag_ids': _ensure_tags(random.Random(seed), using),
+        'content_type_id': ContentType.objects.db_manager(using).get_for_model(Post).pk,
+        'top_k': related.get_top_k(),
+    }
+    if connections[using].in_atomic_block:
+        # Forking closes the connection, which would abort the transaction
+        processes = 1
+    first_post = _next_id(Post, using)
+    tasks = [
+        (start, first_post + start, min(batch_size, posts - start))
+        for start in range(0, posts, batch_size)
+    ]
+    
+    created = {'posts': 0, 'comments': 0, 'tagged_items': 0}
+    for batch in _build_batches(context, tasks, processes):
+        _write_batch(batch, using)
+        created['posts'] += len(batch[0])
+        created['comments'] += len(batch[1])
+        created['tagged_items'] += len(batch[2])
+        if progress:
+            progress(created['posts'])
+    
+    if created['posts']:
+        _refresh_derived(first_post, using)
+    created['users'] = len(author_ids)
+    return created
+
+
+def _refresh_derived(first_post, using):
+    """What the post_save receivers would have kept current"""
+    counters.refresh_category_counters(using=using)
+    dates = Post.objects.using(using).filter(pk__gte=first_post).aggregate(
+        start=Min('publish_date'), end=Max('publish_date')
+    )
+    day = rollups.local_date(dates['start'])
+    end = rollups.local_date(dates['end'])
+    while day <= end:
+        chunk_end = min(day + timedelta(days=30), end)
+        rollups.rollup_range(day, chunk_end, using=using)
+        day = chunk_end + timedelta(days=1)
+    versions.bump('post', 'comment', 'category', 'tag', 'user', 'related', using=using)
+    page_cache.invalidate('post-list', 'post-tags', 'post-search', 'categories', using=using)
+    publish_date = scheduling.next_publish_date(using=using)
+    if publish_date:
+        scheduling.schedule(publish_date, using=using)
@@ -0,0 +1,56 @@
+"""
+Scheduled publishing
+
+A post saved as published with a future publish date is stored with the
+``scheduled`` status, so everything public filters on
+``status='published'`` alone: a stable predicate that caches and the
+``(status, publish_date)`` indexes serve, unlike a comparison with the
+current time. When the date comes, ``publish_due()`` flips the post with
+a signaling ``update()``, which refreshes counters, rollups, the search
+index, related posts and cached pages like any other status change.
+
+Each scheduled post queues a background job for its publish date, and
+``run_workers`` queues one for the next scheduled post when it starts, so
+posts scheduled without a job (by a migration, say) are not stranded. The
+``publish_scheduled`` command does the same work on demand or in a loop.
+One of the two must run for scheduled posts to ever go live.
+"""
+from django.db.models import Min
+from django.utils import timezone
+
+from . import jobs
+from .models import Post
+
+
+def publish_due(now=None, using='default'):
+    """Publish the scheduled posts whose date has come; returns how many"""
+    return Post.objects.using(using).filter(
+        status='scheduled', publish_date__lte=now or timezone.now()
+    ).update(status='published')
+
+
+def next_publish_date(using='default'):
+    """Publish date of the next scheduled post, or None"""
+    return Post.objects.using(using).filter(status='scheduled').aggregate(
+        next_publish=Min('publish_date')
+    )['next_publish']
+
+
+@jobs.task(priority=10)
+def publish_job(using='default'):
+    publish_due(using=using)
+    # Posts scheduled before their jobs existed (or whose job was lost)
+    next_publish = next_publish_date(using=using)
+    if next_publish is not None:
+        schedule(next_publish, using=using)
+
+
+def schedule(publish_date, using='default'):
+    """Queue a publishing run for ``publish_date``; one job per moment"""
+    jobs.enqueue(
+        publish_job,
+        {'using': using},
+        dedup_key='publish:%d' % publish_date.timestamp(),
+        delay=max((publish_date - timezone.now()).total_seconds(), 0),
+        using=using,
+    )
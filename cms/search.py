@@ -0,0 +1,220 @@
+"""
+Full-text search over posts backed by an SQLite FTS5 inverted index
+
+The index lives in its own virtual table (``cms_post_search``) whose rowid is
+the post id. It stores plain text only, so queries never touch the raw
+CKEditor HTML. On databases without FTS5 the helpers fall back to the
+previous ``icontains`` filtering so callers don't need to care.
+"""
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post
+
+
+INDEX_TABLE = 'cms_post_search'
+
+# bm25() column weights for (title, excerpt, body)
+COLUMN_WEIGHTS = (10.0, 4.0, 1.0)
+
+# Cap on the number of terms taken from a user query
+MAX_QUERY_TERMS = 8
+
+SNIPPET_TOKENS = 32
+
+# Control characters used as highlight markers so the snippet can be
+# escaped before the <mark> tags are put in
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+_availability = {}
+
+
+def is_available(using='default'):
+    """Return True when the FTS5 index table exists on the given database"""
+    if using not in _availability:
+        connection = connections[using]
+        available = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                available = INDEX_TABLE in connection.introspection.table_names(cursor)
+        _availability[using] = available
+    return _availability[using]
+
+
+def get_terms(query):
+    """Split a free-text query into lowercase search terms"""
+    return _TERM_RE.findall((query or '').lower())[:MAX_QUERY_TERMS]
+
+
+def build_match_expression(query):
+    """
+    Turn user input into a safe FTS5 MATCH expression. Every term is quoted
+    (so FTS5 operators typed by users are treated as text) and the last one
+    is matched as a prefix to support partially typed words.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return ''
+    quoted = ['"%s"' % term for term in terms]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _document(post):
+    return (post.title or '', post.excerpt or '', post.content_text)
+
+
+def index_post(post, using='default'):
+    """Add or refresh a single post in the index"""
+    if not is_available(using):
+        return
+    title, excerpt, body = _document(post)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {INDEX_TABLE} (rowid, title, excerpt, body) VALUES (%s, %s, %s, %s)',
+            [post.pk, title, excerpt, body]
+        )
+
+
+def index_posts(post_ids, using='default'):
+    """Refresh a batch of posts in the index with one read and one write"""
+    if not is_available(using):
+        return
+    post_ids = list(post_ids)
+    rows = [
+        (post.pk, *_document(post))
+        for post in Post.objects.using(using).filter(pk__in=post_ids).only('id', 'title', 'excerpt', 'content_text')
+    ]
+    with connections[using].cursor() as cursor:
+        placeholders = ', '.join(['%s'] * len(post_ids))
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+        if rows:
+            _insert_rows(cursor, rows)
+
+
+def remove_post(post_id, using='default'):
+    """Drop a post from the index"""
+    if not is_available(using):
+        return
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index(batch_size=500, using='default'):
+    """Re-index every post from scratch and return the number indexed"""
+    if not is_available(using):
+        return 0
+    posts = Post.objects.using(using).only('id', 'title', 'excerpt', 'content_text').order_by()
+    indexed = 0
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+        batch = []
+        for post in posts.iterator(chunk_size=batch_size):
+            batch.append((post.pk, *_document(post)))
+            if len(batch) >= batch_size:
+                _insert_rows(cursor, batch)
+                indexed += len(batch)
+                batch = []
+        if batch:
+            _insert_rows(cursor, batch)
+            indexed += len(batch)
+        cursor.execute(f"INSERT INTO {INDEX_TABLE} ({INDEX_TABLE}) VALUES ('optimize')")
+    return indexed
+
+
+def _insert_rows(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO {INDEX_TABLE} (rowid, title, excerpt, body) VALUES (%s, %s, %s, %s)',
+        rows
+    )
+
+
+def search_posts(queryset, query, rank=True):
+    """
+    Restrict a Post queryset to posts matching ``query``.
+
+    With ``rank`` the queryset is annotated with ``search_rank`` (bm25, lower
+    is better) and ordered by it, most relevant first.
+    """
+    using = queryset.db
+    match = build_match_expression(query)
+    if not match:
+        return queryset.none()
+
+    if not is_available(using):
+        for term in get_terms(query):
+            queryset = queryset.filter(
+                Q(title__icontains=term) |
+                Q(content_text__icontains=term) |
+                Q(excerpt__icontains=term)
+            )
+        return queryset
+
+    queryset = queryset.filter(
+        pk__in=RawSQL(f'SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s', (match,))
+    )
+    if rank:
+        weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+        queryset = queryset.annotate(
+            search_rank=RawSQL(
+                f'SELECT bm25({INDEX_TABLE}, {weights}) FROM {INDEX_TABLE} '
+                f'WHERE {INDEX_TABLE} MATCH %s AND rowid = "{Post._meta.db_table}"."id"',
+                (match,)
+            )
+        ).order_by('search_rank', '-publish_date', '-id')
+    return queryset
+
+
+def highlight(posts, query):
+    """
+    Attach a ``search_snippet`` (safe HTML with matches wrapped in <mark>) to
+    each post of an already-limited result page. Runs at most one query.
+    """
+    posts = list(posts)
+    if not posts:
+        return posts
+    using = posts[0]._state.db or 'default'
+    match = build_match_expression(query)
+    snippets = {}
+
+    if match and is_available(using):
+        placeholders = ', '.join(['%s'] * len(posts))
+        sql = (
+            f"SELECT rowid, snippet({INDEX_TABLE}, -1, %s, %s, '…', {SNIPPET_TOKENS}) "
+            f'FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s AND rowid IN ({placeholders})'
+        )
+        try:
+            with connections[using].cursor() as cursor:
+                cursor.execute(sql, [_MARK_START, _MARK_END, match] + [post.pk for post in posts])
+                snippets = dict(cursor.fetchall())
+        except OperationalError:
+            snippets = {}
+
+    terms = get_terms(query)
+    for post in posts:
+        snippet = snippets.get(post.pk)
+        if snippet is None:
+            snippet = _mark_terms(post.excerpt or '', terms)
+        post.search_snippet = _render_snippet(snippet)
+    return posts
+
+
+def _mark_terms(text, terms):
+    if not terms:
+        return text
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda m: f'{_MARK_START}{m.group(0)}{_MARK_END}', text)
+
+
+def _render_snippet(snippet):
+    html = escape(snippet).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>')
+    return mark_safe(html)
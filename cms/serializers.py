@@ -1,8 +1,108 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from django.core.exceptions import FieldDoesNotExist
+from . import images
 from .models import Category, Post, Page, Comment, SiteSettings
 
 
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets for model serializers. ``fields`` limits the output to
+    the named fields and ``include`` expands the relations listed in
+    ``expandable_fields`` (name -> factory of the nested field); views pass
+    them from ``?fields=`` and ``?include=``. Relations that are not
+    included are rendered as ids or left out, and ``get_related_lookups()``
+    tells the view which joins and prefetches the output really needs.
+    """
+    expandable_fields = {}
+    default_include = ()
+    # Prefetch lookups needed by method fields, by field name
+    prefetch_fields = {}
+    
+    def __init__(self, *args, fields=None, include=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.only_fields = None if fields is None else set(fields)
+        self.include = set(self.default_include if include is None else include)
+        unknown = self.include - set(self.expandable_fields)
+        if unknown:
+            raise serializers.ValidationError({'include': ['Unknown relation: %s' % ', '.join(sorted(unknown))]})
+    
+    def get_fields(self):
+        fields = super().get_fields()
+        for name, factory in self.expandable_fields.items():
+            if name in self.include:
+                fields[name] = factory()
+            elif name not in self.Meta.fields:
+                fields.pop(name, None)
+        if self.only_fields is not None:
+            unknown = self.only_fields - set(fields)
+            if unknown:
+                raise serializers.ValidationError({'fields': ['Unknown field: %s' % ', '.join(sorted(unknown))]})
+            fields = {name: field for name, field in fields.items() if name in self.only_fields}
+        return fields
+    
+    def get_related_lookups(self):
+        """``(select_related, prefetch_related)`` lookups the output fields need"""
+        opts = self.Meta.model._meta
+        select, prefetch = set(), set()
+        for name, field in self.fields.items():
+            if name in self.prefetch_fields:
+                prefetch.add(self.prefetch_fields[name])
+                continue
+            if field.source == '*':
+                continue
+            head = field.source.split('.')[0]
+            try:
+                model_field = opts.get_field(head)
+            except FieldDoesNotExist:
+                continue
+            if not model_field.is_relation:
+                continue
+            if model_field.many_to_one or model_field.one_to_one:
+                # A bare foreign key renders from the *_id column
+                if '.' in field.source or isinstance(field, serializers.BaseSerializer):
+                    select.add(head)
+            else:
+                prefetch.add(head)
+        return sorted(select), sorted(prefetch)
+
+
+class ImageDerivativesField(serializers.Field):
+    """
+    Read-only responsive renditions of an image field: ``srcset`` strings
+    by format and the list of renditions, or null until they are ready.
+    """
+    
+    def __init__(self, image_field, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        self.image_field = image_field
+        super().__init__(**kwargs)
+    
+    def to_representation(self, instance):
+        renditions = images.get_derivatives(instance, self.image_field)
+        if not renditions:
+            return None
+        storage = getattr(instance, self.image_field).storage
+        request = self.context.get('request')
+        
+        def url(name):
+            path = storage.url(name)
+            return request.build_absolute_uri(path) if request is not None else path
+        
+        items = [
+            {'url': url(rendition['name']), 'width': rendition['width'],
+             'height': rendition['height'], 'format': rendition['format']}
+            for rendition in renditions
+        ]
+        srcset = {}
+        for item in items:
+            srcset.setdefault(item['format'], []).append('%s %sw' % (item['url'], item['width']))
+        return {
+            'srcset': {image_format: ', '.join(entries) for image_format, entries in srcset.items()},
+            'renditions': items,
+        }
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for User model"""
     class Meta:
@@ -11,76 +111,97 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_joined']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for Category model"""
-    post_count = serializers.SerializerMethodField()
+    post_count = serializers.IntegerField(source='published_post_count', read_only=True)
     
     class Meta:
         model = Category
         fields = ['id', 'name', 'slug', 'description', 'created_at', 'post_count']
         read_only_fields = ['id', 'created_at', 'post_count']
-    
-    def get_post_count(self, obj):
-        return obj.posts.filter(status='published').count()
 
 
-class CommentSerializer(serializers.ModelSerializer):
-    """Serializer for Comment model"""
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Serializer for Comment model; ``include=post`` nests a post summary"""
     post_title = serializers.CharField(source='post.title', read_only=True)
     
+    expandable_fields = {
+        'post': lambda: PostListSerializer(read_only=True, fields=['id', 'title', 'slug', 'publish_date']),
+    }
+    
     class Meta:
         model = Comment
         fields = ['id', 'post', 'post_title', 'name', 'email', 'content', 'is_approved', 'created_at']
         read_only_fields = ['id', 'created_at', 'post_title']
 
 
-class PostListSerializer(serializers.ModelSerializer):
-    """Serializer for Post list view (lighter version)"""
+class PostListSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Serializer for Post list view (lighter version). ``include`` can expand
+    ``author`` and ``category`` into objects and add ``comments``.
+    """
     author = serializers.CharField(source='author.get_full_name', read_only=True)
     author_username = serializers.CharField(source='author.username', read_only=True)
     category_name = serializers.CharField(source='category.name', read_only=True)
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(source='approved_comment_count', read_only=True)
     tags = serializers.SerializerMethodField()
+    search_snippet = serializers.SerializerMethodField()
+    featured_image_derivatives = ImageDerivativesField('featured_image')
+    
+    expandable_fields = {
+        'author': lambda: UserSerializer(read_only=True),
+        'category': lambda: CategorySerializer(read_only=True),
+        'comments': lambda: CommentSerializer(many=True, read_only=True),
+    }
+    prefetch_fields = {'tags': 'tags'}
     
     class Meta:
         model = Post
         fields = [
             'id', 'title', 'slug', 'excerpt', 'author', 'author_username', 
             'category', 'category_name', 'status', 'featured_image', 
-            'publish_date', 'created_at', 'updated_at', 'comment_count', 'tags'
+            'featured_image_derivatives', 'publish_date', 'created_at', 'updated_at',
+            'comment_count', 'word_count', 'reading_time', 'tags', 'search_snippet'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'comment_count', 'tags']
-    
-    def get_comment_count(self, obj):
-        return obj.comments.filter(is_approved=True).count()
+        read_only_fields = ['id', 'created_at', 'updated_at', 'comment_count', 'tags', 'search_snippet']
     
     def get_tags(self, obj):
         return [tag.name for tag in obj.tags.all()]
+    
+    def get_search_snippet(self, obj):
+        # Only set on posts returned by a full-text search
+        return getattr(obj, 'search_snippet', None)
 
 
-class PostDetailSerializer(serializers.ModelSerializer):
-    """Serializer for Post detail view (full version)"""
-    author = UserSerializer(read_only=True)
-    category = CategorySerializer(read_only=True)
-    comments = CommentSerializer(many=True, read_only=True)
+class PostDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """
+    Serializer for Post detail view (full version). Author, category and
+    comments are nested unless ``include`` names a subset of them; the
+    comments are those the view prefetched (approved only for anonymous
+    users).
+    """
     tags = serializers.SerializerMethodField()
-    approved_comments = serializers.SerializerMethodField()
+    featured_image_derivatives = ImageDerivativesField('featured_image')
+    
+    expandable_fields = {
+        'author': lambda: UserSerializer(read_only=True),
+        'category': lambda: CategorySerializer(read_only=True),
+        'comments': lambda: CommentSerializer(many=True, read_only=True),
+    }
+    default_include = ('author', 'category', 'comments')
+    prefetch_fields = {'tags': 'tags'}
     
     class Meta:
         model = Post
         fields = [
             'id', 'title', 'slug', 'content', 'excerpt', 'author', 'category', 
-            'status', 'featured_image', 'meta_description', 'publish_date', 
-            'created_at', 'updated_at', 'tags', 'comments', 'approved_comments'
+            'status', 'featured_image', 'featured_image_derivatives', 'meta_description',
+            'publish_date', 'created_at', 'updated_at', 'word_count', 'reading_time', 'tags'
         ]
-        read_only_fields = ['id', 'created_at', 'updated_at', 'comments', 'approved_comments']
+        read_only_fields = ['id', 'created_at', 'updated_at']
     
     def get_tags(self, obj):
         return [tag.name for tag in obj.tags.all()]
-    
-    def get_approved_comments(self, obj):
-        approved_comments = obj.comments.filter(is_approved=True).order_by('-created_at')
-        return CommentSerializer(approved_comments, many=True).data
 
 
 class PostCreateUpdateSerializer(serializers.ModelSerializer):
@@ -102,9 +223,8 @@ class PostCreateUpdateSerializer(serializers.ModelSerializer):
         tags_data = validated_data.pop('tags', [])
         post = Post.objects.create(**validated_data)
         
-        # Add tags
-        for tag_name in tags_data:
-            post.tags.add(tag_name)
+        if tags_data:
+            post.tags.add(*tags_data)
         
         return post
     
@@ -116,15 +236,52 @@ class PostCreateUpdateSerializer(serializers.ModelSerializer):
             setattr(instance, attr, value)
         instance.save()
         
-        # Update tags if provided
+        # Update tags if provided; set() only writes the difference
         if tags_data is not None:
-            instance.tags.clear()
-            for tag_name in tags_data:
-                instance.tags.add(tag_name)
+            instance.tags.set(tags_data)
         
         return instance
 
 
+class PreloadedCategoryField(serializers.PrimaryKeyRelatedField):
+    """
+    Category field resolving ids from ``context['categories']`` (pk ->
+    Category) when given, so validating a batch doesn't query per item
+    """
+    
+    def to_internal_value(self, data):
+        categories = self.context.get('categories')
+        if categories is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in categories:
+            self.fail('does_not_exist', pk_value=data)
+        return categories[pk]
+
+
+class PostBulkItemSerializer(PostCreateUpdateSerializer):
+    """One item of a bulk write: updates the post given by ``id``, else creates one"""
+    id = serializers.IntegerField(required=False)
+    category = PreloadedCategoryField(queryset=Category.objects.all(), required=False, allow_null=True)
+    
+    class Meta(PostCreateUpdateSerializer.Meta):
+        fields = [
+            'id', 'title', 'content', 'excerpt', 'category', 'status',
+            'meta_description', 'publish_date', 'tags'
+        ]
+
+
+class CommentModerationSerializer(serializers.Serializer):
+    """Body of ``/api/comments/bulk_moderate/``"""
+    action = serializers.ChoiceField(choices=['approve', 'reject', 'delete'])
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+
 class PageSerializer(serializers.ModelSerializer):
     """Serializer for Page model"""
     class Meta:
@@ -135,10 +292,12 @@ class PageSerializer(serializers.ModelSerializer):
 
 class SiteSettingsSerializer(serializers.ModelSerializer):
     """Serializer for SiteSettings model"""
+    logo_derivatives = ImageDerivativesField('logo')
+    
     class Meta:
         model = SiteSettings
         fields = [
-            'site_title', 'site_description', 'contact_email', 'logo', 'favicon',
+            'site_title', 'site_description', 'contact_email', 'logo', 'logo_derivatives', 'favicon',
             'footer_text', 'social_facebook', 'social_twitter', 'social_instagram', 
             'social_linkedin'
         ]
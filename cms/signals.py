@@ -0,0 +1,25 @@
+"""
+Custom signals sent by the cms app
+"""
+from django.dispatch import Signal
+
+
+# Sent after QuerySet.update() changed tracked fields on a set of rows, and
+# after bulk writes that bypass save() (``fields`` then lists every field
+# written, ``tags`` included when tags were set).
+# Arguments: sender (model class), pks, fields, using
+post_bulk_update = Signal()
+
+# Sent once the responsive derivatives of an uploaded image are stored.
+# Arguments: sender (model class), pk, field (image field name), using
+image_derivatives_ready = Signal()
+
+# Sent after the stored related posts of some posts changed.
+# Arguments: sender (Post), pks, using
+related_posts_changed = Signal()
+
+# Sent after QuerySet.bulk_delete() removed a set of rows with one DELETE,
+# instead of post_delete for each. ``instances`` are the deleted rows with
+# the fields the receivers need (pk, plus those passed to bulk_delete).
+# Arguments: sender (model class), instances, using
+post_bulk_delete = Signal()
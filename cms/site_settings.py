@@ -0,0 +1,65 @@
+"""
+Cached access to the SiteSettings singleton
+
+Settings are read on every public page, so they are kept in a small
+process-local cache backed by the shared Django cache. Saving or deleting
+SiteSettings clears both once the transaction commits, so a request
+reading the old row in the meantime can't cache it again; other processes
+pick the change up once their local copy expires
+(``CMS_SITE_SETTINGS_LOCAL_TTL`` seconds). The shared entry expires after
+``CMS_SITE_SETTINGS_CACHE_TIMEOUT`` seconds, bounding how long a copy
+missed by an invalidation can live.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import SiteSettings
+
+
+CACHE_KEY = 'cms:site-settings'
+
+_local = threading.local()
+_local_generation = 0
+
+
+def _local_ttl():
+    return getattr(settings, 'CMS_SITE_SETTINGS_LOCAL_TTL', 5)
+
+
+def _shared_timeout():
+    return getattr(settings, 'CMS_SITE_SETTINGS_CACHE_TIMEOUT', 300)
+
+
+def get_site_settings():
+    """Return the SiteSettings instance (or None when none exists)"""
+    now = time.monotonic()
+    entry = getattr(_local, 'entry', None)
+    if entry is not None and entry['generation'] == _local_generation and entry['expires'] > now:
+        return entry['value']
+
+    shared = cache.get(CACHE_KEY)
+    if shared is None:
+        shared = {'value': SiteSettings.objects.first()}
+        cache.set(CACHE_KEY, shared, _shared_timeout())
+
+    _local.entry = {
+        'value': shared['value'],
+        'expires': now + _local_ttl(),
+        'generation': _local_generation,
+    }
+    return shared['value']
+
+
+def invalidate_site_settings(using='default'):
+    """Clear the cached settings once the current transaction commits"""
+    transaction.on_commit(_clear, using=using)
+
+
+def _clear():
+    global _local_generation
+    _local_generation += 1
+    cache.delete(CACHE_KEY)
@@ -0,0 +1,68 @@
+"""
+SQLite production profile
+
+Every new SQLite connection gets the ``CMS_SQLITE_PRAGMAS``: write-ahead
+logging, so readers never block the writer nor the writer the readers,
+``synchronous=NORMAL`` (durable at checkpoints, safe with WAL), a memory
+map and a larger page cache for reads, and a busy timeout so concurrent
+writers wait their turn instead of failing with "database is locked".
+Connections are kept between requests with ``CONN_MAX_AGE`` and checked
+with ``CONN_HEALTH_CHECKS`` in settings.DATABASES.
+
+WAL files only shrink at checkpoints and the query planner statistics go
+stale, so ``manage.py optimize_database`` runs ``PRAGMA optimize`` and a
+checkpoint; run it periodically.
+"""
+import re
+
+from django.conf import settings
+from django.db import connections
+
+
+CHECKPOINT_MODES = ('PASSIVE', 'FULL', 'RESTART', 'TRUNCATE')
+
+# Pragma names and values are interpolated into the statement
+_NAME_RE = re.compile(r'^[a-z_]+$')
+_VALUE_RE = re.compile(r'^[\w-]+$')
+
+
+def get_pragmas():
+    """``{pragma: value}`` set on new connections, in order; empty to keep SQLite's defaults"""
+    return dict(getattr(settings, 'CMS_SQLITE_PRAGMAS', None) or {})
+
+
+def apply_pragmas(connection, pragmas=None):
+    """Set ``pragmas`` (CMS_SQLITE_PRAGMAS by default) on a new SQLite connection"""
+    if pragmas is None:
+        pragmas = get_pragmas()
+    for name, value in pragmas.items():
+        if not _NAME_RE.match(name) or not _VALUE_RE.match(str(value)):
+            raise ValueError('Invalid SQLite pragma %s = %r' % (name, value))
+        # On the DB-API connection, so query logs and budgets do not count them
+        connection.connection.execute('PRAGMA %s = %s' % (name, value))
+
+
+def get_pragma(name, using='default'):
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA %s' % name)
+        return cursor.fetchone()[0]
+
+
+def optimize(using='default'):
+    """Let SQLite refresh the query planner statistics that need it"""
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA optimize')
+
+
+def checkpoint(using='default', mode='TRUNCATE'):
+    """
+    Copy the write-ahead log back into the database file; returns
+    ``(busy, log_pages, checkpointed_pages)``. Busy means readers kept part
+    of the log in use; ``log_pages`` is -1 when the database is not in WAL
+    mode.
+    """
+    if mode not in CHECKPOINT_MODES:
+        raise ValueError('Unknown checkpoint mode %r' % mode)
+    with connections[using].cursor() as cursor:
+        cursor.execute('PRAGMA wal_checkpoint(%s)' % mode)
+        return tuple(cursor.fetchone())
@@ -0,0 +1,132 @@
+"""
+Dashboard statistics shared by the site dashboard, the admin index,
+the admin dashboard view and the dashboard API
+
+All counters come from a handful of conditional aggregation queries and the
+activity series from the ``DailyStats`` rollups, and the result is cached for
+a short time so busy admin pages don't recompute it on every load. Writes do
+not clear it (on a busy site every comment would), so the figures lag by at
+most ``get_cache_timeout()`` seconds.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import Count, Q, Value
+from django.utils import timezone
+
+from . import rollups
+from .models import Category, Comment, Page, Post
+
+
+CACHE_KEY = 'cms:dashboard-stats'
+
+WEEKLY_DAYS = 7
+MONTHLY_MONTHS = 6
+
+
+def get_cache_timeout():
+    return getattr(settings, 'CMS_DASHBOARD_STATS_TTL', 60)
+
+
+def get_dashboard_stats(use_cache=True):
+    """
+    Return the dashboard counters, rates and weekly/monthly series as a
+    plain dict. Cached for ``CMS_DASHBOARD_STATS_TTL`` seconds.
+    """
+    if use_cache:
+        stats = cache.get(CACHE_KEY)
+        if stats is not None:
+            return stats
+    stats = compute_dashboard_stats()
+    cache.set(CACHE_KEY, stats, get_cache_timeout())
+    return stats
+
+
+def compute_dashboard_stats(now=None):
+    now = timezone.localtime(now or timezone.now())
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    stats = Post.objects.order_by().aggregate(
+        total_posts=Count('pk'),
+        published_posts=Count('pk', filter=Q(status='published')),
+        draft_posts=Count('pk', filter=Q(status='draft')),
+        scheduled_posts=Count('pk', filter=Q(status='scheduled')),
+        posts_this_month=Count('pk', filter=Q(created_at__gte=month_start)),
+    )
+    stats.update(Comment.objects.order_by().aggregate(
+        total_comments=Count('pk'),
+        approved_comments=Count('pk', filter=Q(is_approved=True)),
+        pending_comments=Count('pk', filter=Q(is_approved=False)),
+        comments_this_month=Count('pk', filter=Q(created_at__gte=month_start)),
+    ))
+    stats.update(_table_counts(active_since=now - timedelta(days=30)))
+    stats.update(_activity_series(now))
+
+    total_posts = stats['total_posts']
+    total_comments = stats['total_comments']
+    stats['engagement_rate'] = round(total_comments / total_posts * 100 if total_posts else 0, 1)
+    stats['approved_comments_percentage'] = round(
+        stats['approved_comments'] / total_comments * 100 if total_comments else 0, 1
+    )
+    stats['pending_comments_percentage'] = round(
+        stats['pending_comments'] / total_comments * 100 if total_comments else 0, 1
+    )
+    stats['approval_rate'] = stats['approved_comments_percentage']
+
+    stats['top_categories'] = list(Category.objects.order_by('-published_post_count', 'name')[:5])
+    stats['top_authors'] = list(
+        User.objects.annotate(post_count=Count('posts')).filter(post_count__gt=0).order_by('-post_count')[:5]
+    )
+    return stats
+
+
+def _table_counts(active_since):
+    """Row counts of the small tables, fetched as one compound SELECT"""
+    def count(queryset, name):
+        return queryset.order_by().values(stat=Value(name)).annotate(count=Count('pk')).values_list('stat', 'count')
+
+    queries = [
+        count(Category.objects.all(), 'total_categories'),
+        count(Page.objects.all(), 'total_pages'),
+        count(User.objects.all(), 'total_users'),
+        count(User.objects.filter(last_login__gte=active_since), 'active_users'),
+    ]
+    counts = dict.fromkeys(['total_categories', 'total_pages', 'total_users', 'active_users'], 0)
+    counts.update(queries[0].union(*queries[1:], all=True))
+    return counts
+
+
+def _activity_series(now):
+    """Posts created per day (last 7 days) and per calendar month (last 6)"""
+    today = now.date()
+    weekly = rollups.daily_series(WEEKLY_DAYS, metrics=('posts_created',), today=today)
+    monthly = rollups.monthly_series(MONTHLY_MONTHS, metrics=('posts_created',), today=today)
+
+    return {
+        'weekly_labels': [day.strftime('%a') for day in weekly['dates']],
+        'weekly_data': weekly['posts_created'],
+        'monthly_periods': monthly['periods'],
+        'monthly_labels': [month_start.strftime('%b') for month_start in monthly['periods']],
+        'monthly_data': monthly['posts_created'],
+    }
+
+
+def get_category_distribution():
+    """Number of posts (any status) per category, largest first"""
+    return list(
+        Category.objects.annotate(post_count=Count('posts')).values('name', 'post_count').order_by('-post_count')
+    )
+
+
+def get_status_distribution(stats=None):
+    stats = stats or get_dashboard_stats()
+    distribution = [
+        {'status': 'published', 'count': stats['published_posts']},
+        {'status': 'draft', 'count': stats['draft_posts']},
+        {'status': 'scheduled', 'count': stats['scheduled_posts']},
+    ]
+    return sorted(
+        [row for row in distribution if row['count']], key=lambda row: row['count'], reverse=True
+    )
@@ -0,0 +1,57 @@
+"""
+Template tags rendering uploaded images with their responsive derivatives
+
+    {% load cms_images %}
+    {% responsive_image post "featured_image" sizes="(min-width: 768px) 50vw, 100vw" alt=post.title class="card-img-top" %}
+"""
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from .. import images
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(instance, field_name, sizes='100vw', **attrs):
+    """
+    A ``<picture>`` with a WebP source and a fallback ``<img srcset>`` built
+    from the derivatives of ``instance.<field_name>``; a plain ``<img>`` of
+    the original until they are ready. Extra keyword arguments become
+    attributes of the ``<img>`` (passing ``width`` or ``height`` replaces
+    the intrinsic size).
+    """
+    image = getattr(instance, field_name)
+    if not image:
+        return ''
+    renditions = images.get_derivatives(instance, field_name)
+    attrs.setdefault('loading', 'lazy')
+    if not renditions:
+        return format_html('<img src="{}"{}>', image.url, flatatt(attrs))
+    
+    formats = list(dict.fromkeys(rendition['format'] for rendition in renditions))
+    fallback = formats[-1]
+    largest = [rendition for rendition in renditions if rendition['format'] == fallback][-1]
+    sources = format_html_join('', '<source type="{}" srcset="{}" sizes="{}">', (
+        (images.MIME_TYPES[image_format], images.srcset(renditions, image.storage, image_format), sizes)
+        for image_format in formats[:-1]
+    ))
+    img_attrs = {
+        'src': image.storage.url(largest['name']),
+        'srcset': images.srcset(renditions, image.storage, fallback),
+        'sizes': sizes,
+    }
+    if 'width' not in attrs and 'height' not in attrs:
+        # Intrinsic size, so the browser can reserve the space
+        img_attrs.update(width=largest['width'], height=largest['height'])
+    img_attrs.update(attrs)
+    return format_html('<picture>{}<img{}></picture>', sources, flatatt(img_attrs))
+
+
+@register.simple_tag
+def image_srcset(instance, field_name, image_format='webp'):
+    """The ``srcset`` value of one format of an image's derivatives ('' when not ready)"""
+    image = getattr(instance, field_name)
+    return images.srcset(images.get_derivatives(instance, field_name), image.storage, image_format)
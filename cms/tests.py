@@ -1,3 +1,1497 @@
-from django.test import TestCase
+import importlib
+import io
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, router, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    benchmark, bulk, comment_intake, counters, images, jobs, page_cache, pagination, querybudget, related,
+    replicas, rollups, sample_data, scheduling, search, signals, site_settings, sqlite, stats, versions, views,
+)
+from .admin_site import custom_admin_site
+from .models import Category, Comment, Job, Page, Post, RelatedPost, RelatedTerm, SiteSettings, TermFrequency
+from .text import html_to_text
+
+
+# Tables whose queries must be served by an index
+HOT_TABLES = ('cms_post', 'cms_comment', 'cms_relatedpost', 'taggit_taggeditem')
+
+# "SCAN cms_post" without "USING ... INDEX" reads the whole table
+_FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+
+def create_content():
+    """A small site: two categories, published/draft/scheduled posts, tags and comments"""
+    author = User.objects.create_user('author', 'author@example.com', 'password', is_staff=True)
+    categories = [Category.objects.create(name=name) for name in ('News', 'Guides')]
+    now = timezone.now()
+    posts = []
+    for number in range(12):
+        post = Post.objects.create(
+            title=f'Post {number}',
+            content=f'<p>Body of post {number} about django and sqlite.</p>',
+            author=author,
+            category=categories[number % 2],
+            status='draft' if number % 5 == 4 else 'published',
+            publish_date=now - timedelta(days=number) if number else now + timedelta(days=1),
+        )
+        post.tags.add('django', f'tag{number % 3}')
+        posts.append(post)
+    for post in posts:
+        Comment.objects.bulk_create([
+            Comment(post=post, name='Reader', email='reader@example.com', content='Nice', is_approved=approved)
+            for approved in (True, True, False)
+        ])
+    return author, categories, posts
+
+
+@override_settings(CMS_PAGE_CACHE_TIMEOUT=0, CMS_JOBS_EAGER=True)
+class CMSTestCase(TestCase):
+    """Page cache off, jobs run on commit and empty caches for each test"""
+    
+    def setUp(self):
+        # The cache, and each process's copy of the site settings, outlive the test database
+        cache.clear()
+        site_settings._clear()
+
+
+class SiteTestCase(CMSTestCase):
+    """The create_content() site; ``post`` is a published post"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.categories, cls.posts = create_content()
+        cls.post = Post.objects.filter(status='published').first()
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTests(SiteTestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on every query the hot pages and endpoints issue
+    against the large tables, and fails on full table scans and on sorts
+    through a temporary B-tree.
+    """
+    
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+    
+    def plan_problems(self, sql):
+        problems = []
+        for detail in self.explain(sql):
+            match = _FULL_SCAN_RE.match(detail)
+            if match and match.group(1) in HOT_TABLES:
+                problems.append(detail)
+            elif 'USE TEMP B-TREE FOR ORDER BY' in detail and 'GROUP BY' not in sql:
+                # Rankings by an aggregate can't come from an index
+                problems.append(detail)
+        return problems
+    
+    def assertIndexedQueries(self, url, login=False):
+        if login:
+            self.client.force_login(self.author)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        failures = []
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT') or not any(table in sql for table in HOT_TABLES):
+                continue
+            problems = self.plan_problems(sql)
+            if problems:
+                failures.append('%s\n    -> %s' % (sql, '; '.join(problems)))
+        if failures:
+            self.fail('Unindexed queries for %s:\n%s' % (url, '\n'.join(failures)))
+    
+    def test_post_list(self):
+        self.assertIndexedQueries(reverse('cms:post_list'))
+    
+    def test_post_list_next_page(self):
+        response = self.client.get(reverse('cms:post_list'))
+        self.assertIndexedQueries(response.context['page_obj'].next_url)
+    
+    def test_post_detail(self):
+        self.assertIndexedQueries(reverse('cms:post_detail', args=[self.post.slug]))
+    
+    def test_category(self):
+        self.assertIndexedQueries(reverse('cms:category_detail', args=[self.categories[0].slug]))
+    
+    def test_tag(self):
+        self.assertIndexedQueries(reverse('cms:post_list') + '?tag=tag1')
+    
+    def test_dashboard(self):
+        self.assertIndexedQueries(reverse('cms:dashboard'), login=True)
+    
+    def test_api_post_list(self):
+        self.assertIndexedQueries('/api/posts/')
+    
+    def test_api_posts_by_author(self):
+        self.assertIndexedQueries('/api/posts/?author=%d' % self.author.pk)
+    
+    def test_api_post_detail(self):
+        self.assertIndexedQueries('/api/posts/%s/' % self.post.slug)
+    
+    def test_api_post_comments(self):
+        self.assertIndexedQueries('/api/comments/?post=%d' % self.post.pk)
+    
+    def test_api_pending_comments(self):
+        self.assertIndexedQueries('/api/comments/?post=%d&is_approved=false' % self.post.pk, login=True)
+    
+    def test_plan_check_catches_full_scans(self):
+        sql = str(Post.objects.filter(content_text__contains='django').order_by('word_count').query)
+        self.assertTrue(self.plan_problems(sql.replace('%django%', "'%django%'")))
+
+
+# Most queries each URL may take, with the site from create_content(). Every
+# named URL of cms.urls and cms.api_urls needs an entry. Values are
+# (method, login, budget); URL arguments come from QueryBudgetTests.url_kwargs.
+URL_BUDGETS = {
+    'cms:post_list': ('get', False, 4),
+    'cms:post_detail': ('get', False, 7),
+    'cms:page_detail': ('get', False, 3),
+    'cms:category_detail': ('get', False, 4),
+    'cms:search': ('get', False, 4),
+    'cms:add_comment': ('post', False, 6),
+    'cms:dashboard': ('get', True, 11),
+    'cms:create_post': ('get', True, 3),
+    'cms:edit_post': ('get', True, 5),
+    'cms:create_page': ('get', True, 2),
+    'api:api-root': ('get', False, 0),
+    'api:category-list': ('get', False, 3),
+    'api:category-detail': ('get', False, 2),
+    'api:category-posts': ('get', False, 3),
+    'api:post-list': ('get', False, 3),
+    'api:post-bulk': ('post', True, 14),
+    'api:post-export': ('get', False, 2),
+    'api:post-featured': ('get', False, 1),
+    'api:post-published': ('get', False, 3),
+    'api:post-detail': ('get', False, 5),
+    'api:post-add-comment': ('post', True, 7),
+    'api:post-related': ('get', False, 4),
+    'api:page-list': ('get', False, 3),
+    'api:page-detail': ('get', False, 2),
+    'api:comment-list': ('get', False, 1),
+    'api:comment-bulk-moderate': ('post', True, 11),
+    'api:comment-export': ('get', False, 1),
+    'api:comment-detail': ('get', False, 1),
+    'api:comment-approve': ('post', True, 7),
+    'api:comment-reject': ('post', True, 12),
+    'api:user-list': ('get', True, 4),
+    'api:user-detail': ('get', True, 3),
+    'api:user-posts': ('get', True, 5),
+    'api:sitesettings-list': ('get', False, 2),
+    'api:sitesettings-detail': ('get', False, 1),
+    'api:dashboard-list': ('get', True, 5),
+    'api:dashboard-analytics': ('get', True, 5),
+}
+
+# Same query shape allowed this many times per request
+REPEAT_LIMIT = 2
+
+
+@override_settings(CMS_COMMENT_SPOOL_DIR=None)
+class QueryBudgetTests(SiteTestCase):
+    """
+    Holds every URL to its query budget and fails on query shapes repeated
+    more than REPEAT_LIMIT times (N+1 queries), naming those run while
+    rendering templates or serializers.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.page = Page.objects.create(title='About', content='<p>About us</p>', is_published=True)
+        cls.settings_object = SiteSettings.objects.first() or SiteSettings.objects.create(site_title='Test site')
+        cls.comment = Comment.objects.filter(is_approved=True).first()
+    
+    def url_kwargs(self, name):
+        if name in ('cms:post_detail', 'cms:add_comment', 'cms:edit_post', 'api:post-detail',
+                    'api:post-add-comment', 'api:post-related'):
+            return {'slug': self.post.slug}
+        if name in ('cms:category_detail', 'api:category-detail', 'api:category-posts'):
+            return {'slug': self.categories[0].slug}
+        if name in ('cms:page_detail', 'api:page-detail'):
+            return {'slug': self.page.slug}
+        if name in ('api:comment-detail', 'api:comment-approve', 'api:comment-reject'):
+            return {'pk': self.comment.pk}
+        if name in ('api:user-detail', 'api:user-posts'):
+            return {'pk': self.author.pk}
+        if name == 'api:sitesettings-detail':
+            return {'pk': self.settings_object.pk}
+        return {}
+    
+    def request_data(self, name):
+        if name in ('cms:add_comment', 'api:post-add-comment'):
+            return {'name': 'Reader', 'email': 'reader@example.com', 'content': 'Thanks'}
+        if name == 'cms:search':
+            return {'q': 'django'}
+        if name == 'api:comment-bulk-moderate':
+            return {'action': 'approve', 'ids': list(Comment.objects.values_list('pk', flat=True))}
+        if name == 'api:post-bulk':
+            return [{'id': post.pk, 'title': post.title + ' (updated)'} for post in self.posts[:5]]
+        return None
+    
+    def test_every_url_has_a_budget(self):
+        from . import api_urls, urls
+        names = {'cms:%s' % pattern.name for pattern in urls.urlpatterns}
+        names |= {'api:%s' % pattern.name for pattern in api_urls.router.urls if pattern.name}
+        self.assertEqual(names - set(URL_BUDGETS), set())
+    
+    def test_url_budgets(self):
+        for name, (method, login, budget) in URL_BUDGETS.items():
+            with self.subTest(name):
+                self.client.logout()
+                if login:
+                    self.client.force_login(self.author)
+                url = reverse(name, kwargs=self.url_kwargs(name))
+                data = self.request_data(name)
+                if method == 'get':
+                    call = lambda: self.client.get(url, data)
+                elif isinstance(data, list) or name.startswith('api:'):
+                    call = lambda: self.client.post(url, json.dumps(data), content_type='application/json')
+                else:
+                    call = lambda: self.client.post(url, data)
+                with querybudget.QueryRecorder(phases=True) as recorder:
+                    response = call()
+                    if response.streaming:
+                        b''.join(response.streaming_content)
+                self.assertLess(response.status_code, 400, name)
+                found = querybudget.problems(recorder, budget=budget, repeat_limit=REPEAT_LIMIT)
+                if found:
+                    self.fail('%s (%s): %s' % (name, querybudget.describe(recorder), '\n  '.join(found)))
+    
+    def test_recorder_flags_template_queries(self):
+        from django.template import Context, Template
+        template = Template('{% for post in posts %}{{ post.author.username }}{% endfor %}')
+        with querybudget.QueryRecorder(phases=True) as recorder:
+            template.render(Context({'posts': Post.objects.all()}))
+        self.assertEqual(recorder.lazy()['template'], recorder.count)
+        self.assertTrue(recorder.repeated(REPEAT_LIMIT))
+    
+    def test_recorder_skips_phases_outside_debug(self):
+        from django.template import Context, Template
+        template = Template('{% for post in posts %}{{ post.author.username }}{% endfor %}')
+        with mock.patch.object(querybudget, '_current_phase') as current_phase:
+            with querybudget.QueryRecorder() as recorder:
+                template.render(Context({'posts': Post.objects.all()}))
+        current_phase.assert_not_called()
+        self.assertFalse(recorder.lazy())
+        self.assertTrue(recorder.repeated(REPEAT_LIMIT))
+        self.assertTrue(querybudget.problems(recorder, budget=1, repeat_limit=REPEAT_LIMIT))
+
+
+@override_settings(CMS_JOBS_EAGER=True)
+class BenchmarkTests(TestCase):
+    """Runs the benchmark once over a tiny generated dataset"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.created = sample_data.generate(40, comments_per_post=2, seed=1)
+    
+    def test_generated_dataset(self):
+        self.assertEqual(self.created['posts'], Post.objects.count())
+        self.assertEqual(self.created['comments'], Comment.objects.count())
+        post = Post.objects.filter(status='published', approved_comment_count__gt=0).first()
+        self.assertEqual(post.approved_comment_count, post.comments.filter(is_approved=True).count())
+        self.assertEqual(post.tags.count(), sample_data.TAGS_PER_POST)
+        self.assertTrue(post.word_count)
+        self.assertTrue(search.search_posts(Post.objects.all(), post.title.split()[0]).exists())
+    
+    def test_every_url_is_benchmarked(self):
+        from . import api_urls, urls
+        names = {'cms:%s' % pattern.name for pattern in urls.urlpatterns}
+        names |= {'api:%s' % pattern.name for pattern in api_urls.router.urls if pattern.name}
+        self.assertEqual(names - set(benchmark.ENDPOINTS), set())
+    
+    def test_run(self):
+        comments = Comment.objects.count()
+        results = benchmark.run(repeat=2, warmup=0)
+        self.assertEqual(set(results), set(benchmark.ENDPOINTS))
+        for name, result in results.items():
+            self.assertLess(result['status'], 400, name)
+            self.assertLessEqual(result['latency_ms']['p50'], result['latency_ms']['max'])
+        # Writes were rolled back
+        self.assertEqual(Comment.objects.count(), comments)
+    
+    def test_compare(self):
+        before = {'queries': 3, 'latency_ms': {'p50': 10.0, 'p90': 12.0}, 'peak_memory_kb': 100.0}
+        noise = {'queries': 3, 'latency_ms': {'p50': 10.5, 'p90': 12.5}, 'peak_memory_kb': 120.0}
+        slower = {'queries': 4, 'latency_ms': {'p50': 20.0, 'p90': 12.0}, 'peak_memory_kb': 100.0}
+        self.assertEqual(benchmark.compare({'a': noise}, {'a': before}), [])
+        self.assertEqual(len(benchmark.compare({'a': slower}, {'a': before})), 2)
+        self.assertEqual(benchmark.compare({'b': slower}, {'a': before}), [])
+
+
+@replicas.replica_reads
+def replica_view(request):
+    return HttpResponse()
+
+
+def primary_view(request):
+    return HttpResponse()
+
+
+@replicas.replica_reads
+def writing_view(request):
+    versions.bump('post')
+    return HttpResponse()
+
+
+@jobs.task(max_attempts=2)
+def flaky_job(fail):
+    if fail:
+        raise RuntimeError('Job failed on purpose')
+
+
+@override_settings(CMS_READ_REPLICAS=('replica',), CMS_REPLICA_MAX_LAG=10)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Where ReplicaMiddleware and ReplicaRouter send a request's queries"""
+    
+    def setUp(self):
+        self.factory = RequestFactory()
+    
+    def route(self, request, view):
+        """Run ``view`` through the middleware; returns the response and where it read last"""
+        seen = {}
+        
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            response = view(request)
+            seen['db'] = Post.objects.all().db
+            return response
+        
+        middleware = replicas.ReplicaMiddleware(get_response)
+        return middleware(request), seen['db']
+    
+    def test_public_reads_go_to_the_replica(self):
+        response, db = self.route(self.factory.get('/'), replica_view)
+        self.assertEqual(db, 'replica')
+        self.assertNotIn(replicas.STICKY_COOKIE, response.cookies)
+        self.assertEqual(Post.objects.all().db, 'default')
+    
+    def test_unmarked_views_read_from_the_primary(self):
+        self.assertEqual(self.route(self.factory.get('/'), primary_view)[1], 'default')
+    
+    def test_transactions_and_primary_models_read_from_the_primary(self):
+        token = replicas._replica.set('replica')
+        self.addCleanup(replicas._replica.reset, token)
+        self.assertEqual(Job.objects.all().db, 'default')
+        with transaction.atomic():
+            self.assertEqual(Post.objects.all().db, 'default')
+    
+    def test_writes_stick_to_the_primary(self):
+        response, db = self.route(self.factory.post('/'), replica_view)
+        self.assertEqual(db, 'default')
+        sticky = self.factory.get('/')
+        sticky.COOKIES[replicas.STICKY_COOKIE] = response.cookies[replicas.STICKY_COOKIE].value
+        self.assertEqual(self.route(sticky, replica_view)[1], 'default')
+    
+    def test_reads_after_a_write_in_the_same_request(self):
+        response, db = self.route(self.factory.get('/'), writing_view)
+        self.assertEqual(db, 'default')
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+    
+    async def test_async_requests(self):
+        """Under ASGI the choice reaches the ORM's threads, and so do the writes seen there"""
+        seen = []
+        
+        async def get_response(request):
+            await sync_to_async(middleware.process_view)(request, request.view, (), {})
+            if request.view is writing_view:
+                await sync_to_async(versions.bump)('post')
+            seen.append(await sync_to_async(router.db_for_read)(Post))
+            return HttpResponse()
+        
+        middleware = replicas.ReplicaMiddleware(get_response)
+        for view in (replica_view, writing_view):
+            request = self.factory.get('/')
+            request.view = view
+            response = await middleware(request)
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertIn(replicas.STICKY_COOKIE, response.cookies)
+    
+    def test_lagging_replica_is_skipped(self):
+        settings_dict = connections['replica'].settings_dict
+        self.addCleanup(settings_dict.__setitem__, 'NAME', settings_dict['NAME'])
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict['NAME'] = os.path.join(directory, 'replica.sqlite3')
+            self.assertIsNone(replicas.choose_replica())
+            sqlite3.connect(settings_dict['NAME']).close()
+            self.assertEqual(replicas.choose_replica(), 'replica')
+            os.utime(settings_dict['NAME'], (0, time.time() - 60))
+            self.assertIsNone(replicas.choose_replica())
+    
+    @override_settings(CMS_PAGE_CACHE_TIMEOUT=600)
+    def test_pages_from_replicas_expire_with_the_lag(self):
+        timeouts = []
+        for replica in (None, 'replica'):
+            request = self.factory.get('/')
+            request.replica = replica
+            with mock.patch.object(page_cache.cache, 'set') as cache_set:
+                page_cache.store_response(request, HttpResponse('page'), {'settings'})
+            timeouts.append(cache_set.call_args.args[2])
+        self.assertEqual(timeouts, [600, 10])
+
+
+class SQLiteProfileTests(TransactionTestCase):
+    """The production pragmas and the maintenance command (outside a transaction, as it runs)"""
+    
+    def test_new_connections_get_the_pragmas(self):
+        # In-memory test databases have no journal file, nor a memory map
+        self.assertEqual(sqlite.get_pragma('busy_timeout'), settings.CMS_SQLITE_PRAGMAS['busy_timeout'])
+        self.assertEqual(sqlite.get_pragma('cache_size'), settings.CMS_SQLITE_PRAGMAS['cache_size'])
+        self.assertEqual(sqlite.get_pragma('synchronous'), 1)  # NORMAL
+        with tempfile.TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'profile.sqlite3'))
+            file_connection = connections['default'].__class__(settings_dict, alias='profile')
+            try:
+                with file_connection.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+            finally:
+                file_connection.close()
+    
+    def test_pragmas_are_validated(self):
+        with self.assertRaises(ValueError):
+            sqlite.apply_pragmas(connection, {'cache_size': '1; DROP TABLE cms_post'})
+    
+    def test_optimize_database(self):
+        out = io.StringIO()
+        call_command('optimize_database', stdout=out)
+        self.assertIn('Optimized default', out.getvalue())
+
+
+class AsyncViewTests(SiteTestCase):
+    """The public pages through the async request path, as served over ASGI"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.post = Post.objects.filter(status='published').select_related('category').first()
+        cls.page = Page.objects.create(title='About', content='<p>About us</p>', is_published=True)
+    
+    async def test_public_pages(self):
+        urls = [
+            reverse('cms:post_list'),
+            reverse('cms:post_detail', kwargs={'slug': self.post.slug}),
+            reverse('cms:category_detail', kwargs={'slug': self.post.category.slug}),
+            reverse('cms:page_detail', kwargs={'slug': self.page.slug}),
+            reverse('cms:search') + '?q=django',
+        ]
+        for url in urls:
+            with self.subTest(url):
+                response = await self.async_client.get(url)
+                self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            await self.async_client.get(reverse('cms:post_detail', kwargs={'slug': self.post.slug})), self.post.title
+        )
+        missing = await self.async_client.get(reverse('cms:post_detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(missing.status_code, 404)
+    
+    async def test_conditional_requests(self):
+        url = reverse('cms:post_detail', kwargs={'slug': self.post.slug})
+        response = await self.async_client.get(url)
+        self.assertTrue(response.has_header('Last-Modified'))
+        cached = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+    
+    @override_settings(CMS_PAGE_CACHE_TIMEOUT=600)
+    async def test_page_cache(self):
+        url = reverse('cms:post_list')
+        self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'MISS')
+        self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'HIT')
+    
+    @override_settings(CMS_QUERY_BUDGET=1)
+    async def test_query_budget(self):
+        with self.assertLogs('cms.querybudget', 'WARNING'):
+            await self.async_client.get(reverse('cms:post_detail', kwargs={'slug': self.post.slug}))
+
+
+class SchedulingTests(CMSTestCase):
+    """Posts published with a future date wait as scheduled"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+    
+    def create_post(self, publish_date):
+        return Post.objects.create(
+            title='Soon', content='<p>Soon</p>', author=self.author, status='published', publish_date=publish_date
+        )
+    
+    def test_eager_mode_skips_delayed_publishing(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            post = self.create_post(timezone.now() + timedelta(hours=1))
+        self.assertLess(len(callbacks), 20)
+        post.refresh_from_db()
+        self.assertEqual(post.status, 'scheduled')
+        self.assertFalse(Job.objects.exists())
+    
+    def test_publish_due(self):
+        post = self.create_post(timezone.now() + timedelta(hours=1))
+        self.assertEqual(scheduling.publish_due(), 0)
+        self.assertEqual(scheduling.next_publish_date(), post.publish_date)
+        self.assertEqual(scheduling.publish_due(now=post.publish_date), 1)
+        post.refresh_from_db()
+        self.assertEqual(post.status, 'published')
+        self.assertIsNone(scheduling.next_publish_date())
+    
+    def test_migrated_posts_are_scheduled_by_the_workers(self):
+        migration = importlib.import_module('cms.migrations.0011_scheduled_status')
+        # Historical models: no signals recount the categories
+        apps = MigrationLoader(connection).project_state(('cms', '0011_scheduled_status')).apps
+        category = Category.objects.create(name='News')
+        publish_date = timezone.now() + timedelta(hours=1)
+        post = self.create_post(timezone.now())
+        # A published future post, as stored before scheduling existed
+        Post.objects.filter(pk=post.pk).update(category=category, publish_date=publish_date)
+        Category.objects.filter(pk=category.pk).update(published_post_count=1)
+        
+        migration.schedule_future_posts(apps, mock.Mock(connection=connection))
+        post.refresh_from_db()
+        category.refresh_from_db()
+        self.assertEqual((post.status, category.published_post_count), ('scheduled', 0))
+        
+        with override_settings(CMS_JOBS_EAGER=False), \
+                mock.patch('cms.management.commands.run_workers.run_worker') as run_worker:
+            call_command('run_workers', '--burst')
+            call_command('run_workers', '--burst')
+        self.assertEqual(run_worker.call_count, 2)
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status), ('cms.scheduling.publish_job', 'queued'))
+        self.assertAlmostEqual(job.run_at.timestamp(), publish_date.timestamp(), delta=1)
+    
+    @override_settings(CMS_PAGE_CACHE_TIMEOUT=600)
+    def test_page_cache_follows_schedule(self):
+        view = views.PostListView()
+        with mock.patch.object(page_cache, 'is_shared', return_value=False):
+            self.assertEqual(view.get_page_cache_timeout(), 600)
+            self.create_post(timezone.now() + timedelta(minutes=1))
+            self.assertLessEqual(view.get_page_cache_timeout(), 61)
+            self.assertEqual(views.PageDetailView().get_page_cache_timeout(), 600)
+        # Invalidations from the workers reach every process
+        self.assertEqual(view.get_page_cache_timeout(), 600)
+
+
+class BulkTests(SiteTestCase):
+    """Bulk writes of posts and comments"""
+    
+    def test_publish_date_updates_status(self):
+        post = Post.objects.filter(status='published').first()
+        updates = []
+        
+        def receiver(sender, pks, fields, **kwargs):
+            updates.append(set(fields))
+        
+        signals.post_bulk_update.connect(receiver, sender=Post)
+        self.addCleanup(signals.post_bulk_update.disconnect, receiver, sender=Post)
+        future = timezone.now() + timedelta(days=3)
+        results = bulk.bulk_save_posts([{'id': post.pk, 'publish_date': future.isoformat()}], self.author)
+        self.assertEqual(results[0]['status'], 'updated')
+        post.refresh_from_db()
+        self.assertEqual(post.status, 'scheduled')
+        self.assertIn('status', updates[-1])
+        
+        bulk.bulk_save_posts([{'id': post.pk, 'publish_date': timezone.now().isoformat()}], self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.status, 'published')
+    
+    def test_per_item_errors(self):
+        category = self.categories[0]
+        items = [
+            {'title': 'Fresh post', 'content': '<p>New</p>', 'category': category.pk, 'tags': ['bulk']},
+            {'content': '<p>No title</p>'},
+            {'id': 999999, 'title': 'Missing'},
+            'not an object',
+            {'title': 'Fresh post', 'content': '<p>Same slug</p>'},
+            {'id': self.posts[0].pk, 'title': 'Renamed', 'tags': ['bulk', 'django']},
+        ]
+        results = bulk.bulk_save_posts(items, self.author)
+        self.assertEqual(
+            [result['status'] for result in results], ['created', 'error', 'error', 'error', 'error', 'updated']
+        )
+        self.assertEqual([result['index'] for result in results], list(range(len(items))))
+        self.assertIn('title', results[1]['errors'])
+        self.assertIn('id', results[2]['errors'])
+        self.assertIn('title', results[4]['errors'])
+        created = Post.objects.get(pk=results[0]['id'])
+        self.assertEqual((created.author, created.category, created.slug), (self.author, category, 'fresh-post'))
+        self.assertEqual(sorted(created.tags.names()), ['bulk'])
+        renamed = Post.objects.get(pk=self.posts[0].pk)
+        self.assertEqual(renamed.title, 'Renamed')
+        self.assertEqual(sorted(renamed.tags.names()), ['bulk', 'django'])
+    
+    def test_failed_batch_is_rolled_back(self):
+        set_tags = bulk.set_tags
+        
+        def fail_second_batch(tags_by_post, using='default'):
+            if 'second' in set().union(*tags_by_post.values()):
+                raise DatabaseError('disk I/O error')
+            set_tags(tags_by_post, using=using)
+        
+        items = [
+            {'title': 'First A', 'content': '<p>A</p>', 'tags': ['first']},
+            {'id': self.posts[0].pk, 'title': 'First B'},
+            {'title': 'Second A', 'content': '<p>A</p>', 'tags': ['second']},
+            {'id': self.posts[1].pk, 'title': 'Second B'},
+        ]
+        with mock.patch.object(bulk, 'set_tags', fail_second_batch):
+            results = bulk.bulk_save_posts(items, self.author, batch_size=2)
+        self.assertEqual([result['status'] for result in results], ['created', 'updated', 'error', 'error'])
+        self.assertIn('disk I/O error', results[2]['errors']['non_field_errors'][0])
+        self.assertTrue(Post.objects.filter(title='First A').exists())
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).title, 'First B')
+        self.assertFalse(Post.objects.filter(title='Second A').exists())
+        self.assertEqual(Post.objects.get(pk=self.posts[1].pk).title, self.posts[1].title)
+    
+    def test_api(self):
+        url = reverse('api:post-bulk')
+        self.client.force_login(self.author)
+        items = [{'title': 'Via API', 'content': '<p>x</p>'}, {}]
+        response = self.client.post(url, json.dumps(items), content_type='application/json')
+        self.assertEqual((response.json()['created'], response.json()['errors']), (1, 1))
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created', 'error'])
+        with override_settings(CMS_BULK_MAX_ITEMS=1):
+            response = self.client.post(url, json.dumps([{}, {}]), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+    
+    def test_bulk_moderate(self):
+        url = reverse('api:comment-bulk-moderate')
+        self.client.force_login(self.author)
+        sent = []
+        for signal in (signals.post_bulk_update, signals.post_bulk_delete):
+            receiver = lambda sender, signal=signal, **kwargs: sent.append(signal)
+            signal.connect(receiver, sender=Comment, weak=False)
+            self.addCleanup(signal.disconnect, receiver, sender=Comment)
+        
+        def moderate(action, ids=None, **filters):
+            body = {'action': action} if ids is None else {'action': action, 'ids': ids}
+            path = url + ('?' + '&'.join('%s=%s' % item for item in filters.items()) if filters else '')
+            response = self.client.post(path, json.dumps(body), content_type='application/json')
+            return response.status_code, response.json().get('count')
+        
+        post = self.posts[0]
+        self.assertEqual(moderate('approve', post=post.pk), (200, 1))
+        self.assertEqual(moderate('approve', post=post.pk), (200, 0))
+        self.assertEqual(sent, [signals.post_bulk_update])
+        post.refresh_from_db()
+        self.assertEqual(post.approved_comment_count, 3)
+        
+        ids = list(Comment.objects.filter(post__in=self.posts[1:4]).values_list('pk', flat=True))
+        sent.clear()
+        self.assertEqual(moderate('reject', ids), (200, 6))
+        self.assertEqual(moderate('delete', ids), (200, 9))
+        self.assertEqual(sent, [signals.post_bulk_update, signals.post_bulk_delete])
+        self.assertFalse(Comment.objects.filter(pk__in=ids).exists())
+        self.assertEqual(Post.objects.get(pk=self.posts[1].pk).total_comment_count, 0)
+        
+        self.assertEqual(moderate('approve')[0], 400)
+        self.assertEqual(moderate('publish', ids)[0], 400)
+
+
+@override_settings(CMS_COMMENT_SPOOL_DIR=None, CMS_COMMENT_RATE_PER_IP=(2, 60))
+class CommentIntakeTests(SiteTestCase):
+    """Comment submission: rate limits and the spool"""
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.author)
+    
+    def comment(self, **data):
+        comment = {'name': 'Reader', 'email': 'reader@example.com', 'content': 'Hello'}
+        comment.update(data)
+        return self.client.post(reverse('api:post-add-comment', kwargs={'slug': self.post.slug}), comment)
+    
+    def test_rate_limit(self):
+        self.assertEqual(self.comment().status_code, 202)
+        self.assertEqual(self.comment().status_code, 202)
+        response = self.comment()
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(response.has_header('Retry-After'))
+        self.assertEqual(self.post.comments.filter(content='Hello').count(), 2)
+    
+    def test_invalid_comments_do_not_count(self):
+        for _ in range(3):
+            self.assertEqual(self.comment(email='not an email').status_code, 400)
+        self.assertEqual(self.comment().status_code, 202)
+        
+        url = reverse('cms:add_comment', kwargs={'slug': self.post.slug})
+        self.client.post(url, {'name': 'Reader', 'email': 'not an email', 'content': 'Hi'})
+        self.client.post(url, {'name': 'Reader', 'email': 'reader@example.com', 'content': 'Hi'})
+        self.assertTrue(self.post.comments.filter(content='Hi').exists())
+    
+    def test_spool_and_flush(self):
+        spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool_dir)
+        with override_settings(CMS_COMMENT_SPOOL_DIR=spool_dir):
+            self.assertEqual(self.comment(content='Spooled').status_code, 202)
+            comment_intake.submit(self.posts[2], 'Reader', 'reader@example.com', 'Orphan')
+            self.assertFalse(Comment.objects.filter(content='Spooled').exists())
+            self.assertEqual(len(comment_intake.pending()), 2)
+            with open(os.path.join(spool_dir, '0-broken' + comment_intake.SUFFIX), 'w') as spool_file:
+                spool_file.write('{not json')
+            self.posts[2].delete()
+            
+            # Another writer holds the lock
+            with comment_intake._writer_lock(spool_dir):
+                self.assertEqual(comment_intake.flush(), 0)
+            with self.assertLogs('cms.comment_intake', 'WARNING'):
+                self.assertEqual(comment_intake.flush(), 1)
+            self.assertEqual(comment_intake.pending(), [])
+        comment = Comment.objects.get(content='Spooled')
+        self.assertEqual((comment.post, comment.is_approved), (self.post, False))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.total_comment_count, self.post.comments.count())
+    
+    def spool(self, name, content):
+        with open(os.path.join(self.spool_dir, name), 'w') as spool_file:
+            spool_file.write(content)
+    
+    def use_spool(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        override = override_settings(CMS_COMMENT_SPOOL_DIR=self.spool_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+    
+    def test_malformed_records_are_set_aside(self):
+        self.use_spool()
+        record = {'post_id': self.post.pk, 'name': 'Reader', 'email': 'reader@example.com', 'content': 'Valid'}
+        for number, broken in enumerate(([1, 2], {'post_id': self.post.pk}, dict(record, post_id='1'),
+                                         dict(record, content=None))):
+            self.spool('%d-broken.json' % number, json.dumps(broken))
+        self.spool('9-valid.json', json.dumps(record))
+        with self.assertLogs('cms.comment_intake', 'WARNING') as logs:
+            self.assertEqual(comment_intake.flush(), 1)
+        self.assertEqual(len(logs.records), 4)
+        self.assertEqual(comment_intake.pending(), [])
+        self.assertEqual(len(comment_intake.pending(comment_intake.REJECTED_SUFFIX)), 4)
+        self.assertTrue(Comment.objects.filter(content='Valid').exists())
+        self.assertEqual(comment_intake.flush(), 0)
+    
+    def test_crashed_writer(self):
+        self.use_spool()
+        comment_intake.submit(self.post, 'Reader', 'reader@example.com', 'First')
+        comment_intake.submit(self.post, 'Reader', 'reader@example.com', 'Second')
+        # Dies inside the transaction: the batch stays claimed
+        with mock.patch.object(signals.post_bulk_update, 'send', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                comment_intake.flush()
+        self.assertEqual(comment_intake.pending(), [])
+        self.assertEqual(len(comment_intake.pending(comment_intake.CLAIMED_SUFFIX)), 2)
+        self.assertFalse(Comment.objects.filter(content__in=['First', 'Second']).exists())
+        
+        # Dies after committing "First" only: it is not written twice
+        Comment.objects.create(post=self.post, name='Reader', email='reader@example.com', content='First')
+        self.assertEqual(comment_intake.flush(), 1)
+        self.assertEqual(Comment.objects.filter(content='First').count(), 1)
+        self.assertEqual(Comment.objects.filter(content='Second').count(), 1)
+        self.assertEqual(comment_intake.pending(comment_intake.CLAIMED_SUFFIX), [])
+
+
+class DashboardTests(SiteTestCase):
+    """Dashboard statistics and analytics read from the rollups"""
+    
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.author)
+    
+    def test_analytics_filters(self):
+        url = reverse('api:dashboard-analytics')
+        response = self.client.get(url, {'category': self.categories[0].pk, 'author': self.author.pk, 'days': 7})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['daily_activity']['labels']), 7)
+        for params in ({'category': 'abc'}, {'author': 'abc'}, {'months': 'abc'}):
+            with self.subTest(params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+    
+    def test_rollups_follow_writes(self):
+        post = self.posts[1]
+        today = rollups.local_date(timezone.now())
+        received = lambda: rollups.daily_series(1)['comments_received'][0]
+        before = received()
+        with override_settings(CMS_JOBS_EAGER=False), self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=post, name='Reader', email='reader@example.com', content='Later')
+        # Left to a job
+        self.assertEqual(received(), before)
+        job = Job.objects.get(name='cms.rollups.refresh_job')
+        self.assertEqual(job.kwargs['days'], [today.isoformat()])
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            Comment.objects.create(post=post, name='Reader', email='reader@example.com', content='Now')
+        # Every comment of the fixtures was received today
+        self.assertEqual(received(), Comment.objects.count())
+    
+    def test_stats_are_cached(self):
+        stats.get_dashboard_stats()
+        Post.objects.create(title='Fresh', content='<p>Fresh</p>', author=self.author)
+        # Writes don't clear the cache: the figures may lag by CMS_DASHBOARD_STATS_TTL
+        with self.assertNumQueries(0):
+            cached = stats.get_dashboard_stats()
+        self.assertEqual(cached['total_posts'], len(self.posts))
+        self.assertEqual(stats.get_dashboard_stats(use_cache=False)['total_posts'], len(self.posts) + 1)
+    
+    def test_admin_index_top_authors(self):
+        for number in range(5):
+            writer = User.objects.create_user('writer%d' % number)
+            Post.objects.create(title='By writer %d' % number, content='<p>Text</p>', author=writer)
+        request = RequestFactory().get('/admin/')
+        request.user = self.author
+        response = custom_admin_site.index(request)
+        self.assertEqual(len(response.context_data['top_authors']), 4)
+        self.assertEqual(len(stats.get_dashboard_stats()['top_authors']), 5)
+    
+    @override_settings(CMS_JOBS_EAGER=False)
+    def test_multi_day_writes_share_jobs(self):
+        today = timezone.now()
+        for days_ago, post in enumerate(self.posts[:3]):
+            post.comments.update(created_at=today - timedelta(days=days_ago))
+        Job.objects.all().delete()
+        # Two moderation batches over overlapping days
+        Comment.objects.filter(post__in=self.posts[:2]).approve()
+        Comment.objects.filter(post__in=self.posts[1:3]).reject()
+        days = sorted(Job.objects.filter(name='cms.rollups.refresh_job').values_list('dedup_key', flat=True))
+        self.assertEqual(days, sorted('rollups:%s' % rollups.local_date(today - timedelta(days=days_ago)).isoformat()
+                                      for days_ago in range(3)))
+
+
+class ExportTests(SiteTestCase):
+    """Streaming NDJSON/CSV exports"""
+    
+    def export(self, name, **params):
+        response = self.client.get(reverse(name), params)
+        if response.status_code != 200:
+            return response.status_code, None
+        return 200, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+    
+    def test_comment_filters(self):
+        self.client.force_login(self.author)
+        category = self.categories[0]
+        status_code, rows = self.export('api:comment-export', category=category.pk)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(rows), Comment.objects.filter(post__category=category).count())
+        for params in ({'category': 'abc'}, {'author': 'abc'}, {'post': 'abc'}, {'created_since': 'abc'}):
+            with self.subTest(params):
+                self.assertEqual(self.export('api:comment-export', **params)[0], 400)
+    
+    def test_post_filters(self):
+        status_code, rows = self.export('api:post-export', author=self.author.pk)
+        self.assertEqual(status_code, 200)
+        self.assertEqual(len(rows), Post.objects.filter(status='published').count())
+        for params in ({'category': 'abc'}, {'updated_since': 'abc'}):
+            with self.subTest(params):
+                self.assertEqual(self.export('api:post-export', **params)[0], 400)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'The full-text index needs SQLite FTS5')
+class SearchTests(CMSTestCase):
+    """Full-text search: ranking, snippets and index upkeep"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.in_title = cls.create_post('Caching with SQLite', '<p>Notes on pages.</p>')
+        cls.in_body = cls.create_post('Deployment notes', '<p>We put a <b>cache</b> before sqlite.</p>')
+        cls.unrelated = cls.create_post('Gardening', '<p>Tomatoes and beans.</p>')
+    
+    @classmethod
+    def create_post(cls, title, content):
+        return Post.objects.create(title=title, content=content, author=cls.author, status='published')
+    
+    def search(self, query):
+        return list(search.search_posts(Post.objects.all(), query))
+    
+    def test_ranking(self):
+        # Title matches weigh more than body matches; "cach" is matched as a prefix
+        self.assertEqual(self.search('sqlite cach'), [self.in_title, self.in_body])
+        self.assertEqual(self.search('tomatoes'), [self.unrelated])
+        self.assertEqual(self.search(''), [])
+        # FTS5 syntax typed by users is plain text
+        self.assertEqual(self.search('sqlite OR "gardening'), [])
+    
+    def test_snippets(self):
+        post, = search.highlight(Post.objects.filter(pk=self.in_body.pk), 'cache')
+        self.assertIn('<mark>cache</mark>', post.search_snippet)
+        self.assertNotIn('<b>', post.search_snippet)
+    
+    def test_index_follows_writes(self):
+        self.in_body.content = '<p>Now about compost.</p>'
+        self.in_body.excerpt = ''
+        self.in_body.save()
+        self.assertEqual(self.search('compost'), [self.in_body])
+        self.assertEqual(self.search('cache'), [self.in_title])
+        
+        # Bulk writers announce the fields they changed, see cms.bulk
+        Post.objects.filter(pk=self.unrelated.pk).update(title='Orchards')
+        self.assertEqual(self.search('orchards'), [])
+        signals.post_bulk_update.send(sender=Post, pks=[self.unrelated.pk], fields={'title'}, using='default')
+        self.assertEqual(self.search('orchards'), [self.unrelated])
+        
+        self.in_title.delete()
+        self.assertEqual(self.search('sqlite'), [])
+        self.assertEqual(search.rebuild_index(), 2)
+
+
+class CounterTests(SiteTestCase):
+    """Denormalized comment and post counters after bulk writes"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.post = cls.posts[1]
+        # The fixtures' comments were bulk created
+        counters.refresh_post_counters()
+    
+    def assertCountersExact(self):
+        for post in Post.objects.all():
+            self.assertEqual(post.approved_comment_count, post.comments.filter(is_approved=True).count(), post)
+            self.assertEqual(post.total_comment_count, post.comments.count(), post)
+        for category in Category.objects.all():
+            self.assertEqual(
+                category.published_post_count, category.posts.filter(status='published').count(), category
+            )
+    
+    def test_comment_bulk_update_and_delete(self):
+        self.assertCountersExact()
+        self.assertEqual(self.post.comments.approve(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.approved_comment_count, 3)
+        Comment.objects.filter(post__in=self.posts[:3]).reject()
+        self.assertCountersExact()
+        # Moving comments updates both posts
+        Comment.objects.filter(post=self.posts[2]).update(post=self.posts[3])
+        self.assertCountersExact()
+        self.assertEqual(Comment.objects.filter(post__in=self.posts[3:6]).bulk_delete(), 12)
+        self.assertCountersExact()
+    
+    def test_post_bulk_update(self):
+        Post.objects.filter(pk__in=[post.pk for post in self.posts[:4]]).update(status='draft')
+        self.assertCountersExact()
+        Post.objects.filter(category=self.categories[0]).update(category=self.categories[1])
+        self.assertCountersExact()
+        self.assertEqual(Category.objects.get(pk=self.categories[0].pk).published_post_count, 0)
+
+
+class PaginationTests(SiteTestCase):
+    """Keyset pagination cursors"""
+    
+    def test_cursor_round_trip(self):
+        now = timezone.now()
+        values = [now, 12]
+        cursor = pagination.encode_cursor(values, reverse=True)
+        self.assertEqual(pagination.decode_cursor(cursor), ([now.isoformat(), 12], True))
+        self.assertNotIn('=', cursor)
+    
+    def test_walk_forward_and_back(self):
+        queryset = Post.objects.filter(status='published').order_by('-publish_date', '-id')
+        expected = list(queryset)
+        paginator = pagination.KeysetPaginator(queryset, 3)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_cursor))
+        self.assertEqual([post for page in pages for post in page], expected)
+        self.assertFalse(pages[0].has_previous())
+        
+        back = paginator.get_page(pages[-1].previous_cursor)
+        self.assertEqual(list(back), list(pages[-2]))
+    
+    def test_tampered_cursors(self):
+        paginator = pagination.KeysetPaginator(Post.objects.order_by('-publish_date', '-id'), 3)
+        for cursor in ('not a cursor', 'e30', pagination.encode_cursor([1]),
+                       pagination.encode_cursor(['abc', 5]), pagination.encode_cursor([{'a': 1}, 5]),
+                       pagination.encode_cursor([None, 5]), pagination.encode_cursor([timezone.now(), 'x'])):
+            with self.subTest(cursor):
+                with self.assertRaises(pagination.InvalidCursor):
+                    paginator.get_page(cursor)
+        self.assertEqual(self.client.get(reverse('cms:post_list'), {'cursor': 'e30'}).status_code, 404)
+        tampered = pagination.encode_cursor(['abc', 5])
+        self.assertEqual(self.client.get(reverse('api:post-list'), {'cursor': tampered}).status_code, 404)
+        self.assertEqual(self.client.get(reverse('cms:post_list'), {'cursor': tampered}).status_code, 404)
+
+
+class ConditionalRequestTests(SiteTestCase):
+    """ETag/Last-Modified validators and the content versions behind them"""
+    
+    def assertRevalidates(self, url, change):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+    
+    def test_writes_bump_versions(self):
+        before = versions.get_versions(['post', 'comment', 'category', 'tag'])
+        self.post.title = 'Changed'
+        self.post.save()
+        Comment.objects.filter(post=self.post).approve()
+        self.post.tags.add('new-tag')
+        after = versions.get_versions(['post', 'comment', 'category', 'tag'])
+        for name in ('post', 'comment', 'tag'):
+            self.assertGreater(after[name][0], before[name][0], name)
+        # Untouched tables keep their version
+        self.assertEqual(after['category'], before['category'])
+    
+    def test_api_list(self):
+        unpublish = lambda: Post.objects.filter(pk=self.post.pk).update(status='draft')
+        self.assertRevalidates(reverse('api:post-list'), unpublish)
+    
+    def test_api_detail(self):
+        url = reverse('api:post-detail', kwargs={'slug': self.post.slug})
+        self.assertRevalidates(url, lambda: self.post.tags.add('new-tag'))
+    
+    def test_html_detail(self):
+        url = reverse('cms:post_detail', kwargs={'slug': self.post.slug})
+        self.assertRevalidates(url, lambda: Comment.objects.filter(post=self.post).approve())
+    
+    def test_html_variants(self):
+        url = reverse('cms:post_detail', kwargs={'slug': self.post.slug})
+        etag = self.client.get(url)['ETag']
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(CMS_JOBS_EAGER=False, CMS_JOBS_RETRY_DELAY=10)
+class JobTests(TestCase):
+    """The database job queue: deduplication, retries and abandoned jobs"""
+    
+    def setUp(self):
+        self.worker = jobs.Worker(name='test-worker')
+    
+    def test_dedup(self):
+        jobs.enqueue(flaky_job, {'fail': False}, dedup_key='flaky')
+        jobs.enqueue('cms.tests.flaky_job', {'fail': False}, dedup_key='flaky')
+        self.assertEqual(Job.objects.count(), 1)
+        # Once running, the work may be queued again
+        job = self.worker.claim()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('running', 1, 'test-worker'))
+        jobs.enqueue(flaky_job, {'fail': False}, dedup_key='flaky')
+        self.assertEqual(Job.objects.filter(status='queued').count(), 1)
+        self.worker.execute(job)
+        self.assertEqual(Job.objects.get(pk=job.pk).status, 'done')
+    
+    def test_retry_with_backoff(self):
+        jobs.enqueue(flaky_job, {'fail': True})
+        job = self.worker.claim()
+        with self.assertLogs('cms.jobs', 'ERROR'):
+            self.worker.execute(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertIn('Job failed on purpose', job.last_error)
+        delay = (job.run_at - timezone.now()).total_seconds()
+        self.assertTrue(7 < delay <= 12, delay)
+        # Not runnable before its time
+        self.assertIsNone(self.worker.claim())
+        
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        with self.assertLogs('cms.jobs', 'ERROR'):
+            self.worker.execute(self.worker.claim())
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+    
+    def test_backoff(self):
+        with mock.patch('random.uniform', return_value=1.0):
+            self.assertEqual([jobs.backoff(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+            self.assertEqual(jobs.backoff(30), 6 * 60 * 60)
+    
+    def test_abandoned_jobs_are_requeued(self):
+        jobs.enqueue(flaky_job, {'fail': False})
+        job = self.worker.claim()
+        Job.objects.filter(pk=job.pk).update(locked_at=timezone.now() - timedelta(hours=1))
+        self.worker.maintain()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), ('queued', 'Abandoned by its worker'))
+    
+    def test_unknown_tasks_are_refused(self):
+        with self.assertRaises(ImportError):
+            jobs.resolve('cms.tests.create_content')
+
+
+@override_settings(CMS_RELATED_POSTS_TOP_K=4)
+class RelatedPostsTests(CMSTestCase):
+    """Incremental related posts refreshes agree with a full recomputation"""
+    
+    WORDS = ('sqlite', 'caching', 'python', 'garden', 'tomato', 'deploy', 'search', 'index', 'orchard', 'queue')
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        categories = [Category.objects.create(name=name) for name in ('News', 'Guides', 'Garden')]
+        cls.posts = []
+        for number in range(30):
+            words = [cls.WORDS[(number * 7 + offset * 3) % len(cls.WORDS)] for offset in range(4)]
+            post = Post.objects.create(
+                title='%s %d' % (' '.join(words[:2]).title(), number),
+                content='<p>%s</p>' % ' '.join(words * (number % 3 + 1)),
+                author=cls.author,
+                category=categories[number % 3] if number % 4 else None,
+                status='published',
+            )
+            post.tags.add(*words[number % 2:][:2])
+            cls.posts.append(post)
+        related.rebuild()
+    
+    def stored_lists(self):
+        lists = {}
+        for post_id, related_id in RelatedPost.objects.order_by('post', 'rank').values_list('post_id', 'related_id'):
+            lists.setdefault(post_id, []).append(related_id)
+        return lists
+    
+    def expected_lists(self):
+        corpus = related.Corpus.load()
+        lists = {post_id: [other for other, _ in corpus.most_similar(post_id, 4)] for post_id in corpus.tags}
+        return {post_id: ids for post_id, ids in lists.items() if ids}
+    
+    def refresh(self, *posts):
+        # Only the neighbourhood of the posts is read, never the whole corpus
+        with mock.patch.object(related.Corpus, 'load', side_effect=AssertionError('full load')):
+            related.refresh([post.pk for post in posts])
+    
+    def test_rebuild(self):
+        self.assertEqual(self.stored_lists(), self.expected_lists())
+        self.assertTrue(RelatedTerm.objects.filter(post=self.posts[0]).exists())
+        self.assertTrue(TermFrequency.objects.exists())
+    
+    def test_refresh_after_tag_and_category_changes(self):
+        post, other = self.posts[5], self.posts[17]
+        post.tags.set(['orchard', 'tomato', 'python'])
+        Post.objects.filter(pk=other.pk).update(category=None)
+        self.refresh(post, other)
+        self.assertEqual(self.stored_lists(), self.expected_lists())
+    
+    def test_refresh_after_unpublishing(self):
+        post = self.posts[8]
+        self.assertTrue(RelatedPost.objects.filter(related=post).exists())
+        Post.objects.filter(pk=post.pk).update(status='draft')
+        self.refresh(post)
+        self.assertFalse(RelatedPost.objects.filter(related=post).exists())
+        self.assertFalse(RelatedTerm.objects.filter(post=post).exists())
+        self.assertEqual(self.stored_lists(), self.expected_lists())
+    
+    def test_refresh_after_text_change(self):
+        post = self.posts[3]
+        post.content = '<p>Quinces and medlars.</p>'
+        post.save()
+        self.refresh(post)
+        self.assertTrue(RelatedTerm.objects.filter(post=post, term='quinces').exists())
+        self.assertFalse(RelatedTerm.objects.filter(post=post, term='deploy').exists())
+
+
+class SiteSettingsCacheTests(CMSTestCase):
+    """The process-local and shared copies of SiteSettings"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.settings_object = SiteSettings.objects.first() or SiteSettings.objects.create(site_title='Test site')
+    
+    def test_cache_hits_use_no_queries(self):
+        self.assertEqual(site_settings.get_site_settings(), self.settings_object)
+        with self.assertNumQueries(0):
+            site_settings.get_site_settings()
+            # Another process: only the shared copy
+            site_settings._local.entry = None
+            site_settings.get_site_settings()
+    
+    def test_shared_copy_expires(self):
+        with mock.patch.object(site_settings, 'cache') as shared:
+            shared.get.return_value = None
+            site_settings.get_site_settings()
+        shared.set.assert_called_once_with(site_settings.CACHE_KEY, mock.ANY, 300)
+    
+    def test_save_invalidates_after_commit(self):
+        site_settings.get_site_settings()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.settings_object.site_title = 'Renamed'
+            self.settings_object.save()
+            # Still the old row until the commit, even when read again meanwhile
+            with self.assertNumQueries(0):
+                self.assertEqual(site_settings.get_site_settings().site_title, 'Test site')
+            cache.set(site_settings.CACHE_KEY, {'value': SiteSettings(site_title='Test site')})
+        self.assertEqual(site_settings.get_site_settings().site_title, 'Renamed')
+    
+    @override_settings(CMS_SITE_SETTINGS_LOCAL_TTL=60)
+    def test_local_copy_expires(self):
+        site_settings.get_site_settings()
+        # Changed and invalidated by another process: this one keeps its copy for a while
+        SiteSettings.objects.update(site_title='Elsewhere')
+        cache.delete(site_settings.CACHE_KEY)
+        with self.assertNumQueries(0):
+            self.assertEqual(site_settings.get_site_settings().site_title, 'Test site')
+        later = time.monotonic() + 61
+        with mock.patch.object(site_settings.time, 'monotonic', return_value=later):
+            self.assertEqual(site_settings.get_site_settings().site_title, 'Elsewhere')
+        # An invalidation in this process drops the local copy at once
+        SiteSettings.objects.update(site_title='Here')
+        with self.captureOnCommitCallbacks(execute=True):
+            site_settings.invalidate_site_settings()
+        self.assertEqual(site_settings.get_site_settings().site_title, 'Here')
+
+
+class SparseFieldsTests(SiteTestCase):
+    """?fields= and ?include= on API reads, and the queries they save"""
+    
+    def get(self, name, num_queries, **params):
+        kwargs = {'slug': self.post.slug} if name == 'api:post-detail' else {}
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(reverse(name, kwargs=kwargs), params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return data['results'][0] if 'results' in data else data
+    
+    def test_list(self):
+        post = self.get('api:post-list', 3)
+        self.assertIsInstance(post['author'], str)
+        self.assertIn('tags', post)
+        # No tags prefetch
+        self.assertEqual(set(self.get('api:post-list', 2, fields='id,title')), {'id', 'title'})
+        # Included relations are joined, not queried per post
+        post = self.get('api:post-list', 2, fields='id,author,category', include='author,category')
+        self.assertEqual(post['author']['username'], 'author')
+        self.assertEqual(post['category']['id'], self.post.category_id)
+    
+    def test_detail(self):
+        post = self.get('api:post-detail', 5)
+        self.assertEqual(post['author']['username'], 'author')
+        self.assertEqual(post['category']['id'], self.post.category_id)
+        # approved_comments is gone: anonymous readers get the approved comments in comments
+        self.assertNotIn('approved_comments', post)
+        self.assertEqual(len(post['comments']), self.post.comments.filter(is_approved=True).count())
+        
+        # Only the included relations are nested; no comments prefetch
+        post = self.get('api:post-detail', 4, include='author')
+        self.assertNotIn('comments', post)
+        self.assertEqual(post['category'], self.post.category_id)
+        self.assertEqual(set(self.get('api:post-detail', 3, fields='id,title')), {'id', 'title'})
+    
+    def test_unknown_names(self):
+        for params in ({'fields': 'id,secret'}, {'include': 'tags'}):
+            with self.subTest(params):
+                response = self.client.get(reverse('api:post-list'), params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.json())
+
+
+@override_settings(CMS_IMAGE_WIDTHS=(200, 400, 1000))
+class ImageDerivativeTests(CMSTestCase):
+    """Responsive derivatives of uploaded images and the tags serving them"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+    
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        override = override_settings(MEDIA_ROOT=media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+    
+    def upload(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 400), 'teal').save(buffer, 'JPEG')
+        return Post.objects.create(
+            title='Pictured', content='<p>Look</p>', author=self.author, status='published',
+            featured_image=SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg'),
+        )
+    
+    def render(self, post):
+        from django.template import Context, Template
+        template = Template(
+            '{% load cms_images %}{% responsive_image post "featured_image" alt="Photo" %}'
+            '|{% image_srcset post "featured_image" %}'
+        )
+        return template.render(Context({'post': post}))
+    
+    @override_settings(CMS_JOBS_EAGER=False)
+    def test_upload_queues_one_job(self):
+        post = self.upload()
+        post.title = 'Still pictured'
+        post.save()
+        job = Job.objects.get(name='cms.images.render_job')
+        self.assertEqual(job.dedup_key, 'images:cms.post:%d:featured_image' % post.pk)
+        self.assertEqual(
+            job.kwargs, {'model': 'cms.post', 'pk': post.pk, 'field': 'featured_image', 'using': 'default'}
+        )
+    
+    def test_job_writes_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = self.upload()
+        post.refresh_from_db()
+        manifest = post.featured_image_derivatives
+        self.assertEqual(manifest['source'], post.featured_image.name)
+        renditions = {(rendition['format'], rendition['width']) for rendition in manifest['renditions']}
+        # Never wider than the original
+        self.assertEqual(renditions, {(image_format, width) for image_format in ('webp', 'jpeg')
+                                      for width in (200, 400, 800)})
+        storage = post.featured_image.storage
+        for rendition in manifest['renditions']:
+            self.assertTrue(storage.exists(rendition['name']), rendition['name'])
+            self.assertEqual(rendition['height'], rendition['width'] // 2)
+        self.assertFalse(images.needs_derivatives(post, 'featured_image'))
+    
+    def test_tags(self):
+        with self.captureOnCommitCallbacks(execute=False):
+            post = self.upload()
+        picture, srcset = self.render(post).split('|')
+        self.assertEqual(picture, '<img src="%s" alt="Photo" loading="lazy">' % post.featured_image.url)
+        self.assertEqual(srcset, '')
+        
+        images.generate(Post, post.pk, 'featured_image')
+        post.refresh_from_db()
+        picture, srcset = self.render(post).split('|')
+        self.assertIn('<source type="image/webp" srcset="', picture)
+        # The largest fallback, with its intrinsic size
+        for attribute in ('height="400"', 'width="800"', 'alt="Photo"', 'loading="lazy"'):
+            self.assertIn(attribute, picture)
+        self.assertRegex(picture, r'<img [^>]*src="[^"]+/800w\.jpg" srcset="[^"]+/200w\.jpg 200w, ')
+        self.assertEqual(srcset.count('.webp'), 3)
+        self.assertIn('400w', srcset)
+
+
+class DerivedTextTests(CMSTestCase):
+    """Plain text, word count and reading time derived from post content"""
+    
+    # 450 words with markup, an entity and a script that readers never see
+    CONTENT = '<h2>Intro</h2><p>%s&amp; done.</p><script>var hidden = 1;</script>' % ('word ' * 447)
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+    
+    def assertDerived(self, post, text_start, word_count, minutes):
+        post = Post.objects.get(pk=post.pk)
+        self.assertTrue(post.content_text.startswith(text_start), post.content_text[:40])
+        self.assertNotIn('<', post.content_text)
+        self.assertNotIn('hidden', post.content_text)
+        self.assertEqual((post.word_count, post.reading_time), (word_count, minutes))
+    
+    def test_save(self):
+        post = Post.objects.create(title='Long', content=self.CONTENT, author=self.author)
+        self.assertDerived(post, 'Intro word word', 450, 3)
+        self.assertTrue(post.content_text.endswith('word & done.'))
+        self.assertTrue(post.excerpt.startswith('Intro word'))
+    
+    def test_derived_only_when_content_changes(self):
+        post = Post.objects.create(title='Long', content=self.CONTENT, author=self.author)
+        with mock.patch('cms.models.html_to_text', wraps=html_to_text) as extract:
+            post.title = 'Renamed'
+            post.save()
+            extract.assert_not_called()
+            post.content = '<p>Short now</p>'
+            post.save()
+            extract.assert_called_once_with('<p>Short now</p>')
+        self.assertDerived(post, 'Short now', 2, 1)
+    
+    def test_bulk_save(self):
+        post = Post.objects.create(title='Long', content=self.CONTENT, author=self.author)
+        results = bulk.bulk_save_posts([
+            {'title': 'Bulk', 'content': '<p>Three <em>small</em> words</p>'},
+            {'id': post.pk, 'content': '<ul><li>Item one</li><li>Item two</li></ul>'},
+        ], self.author)
+        self.assertEqual([result['status'] for result in results], ['created', 'updated'])
+        self.assertDerived(Post.objects.get(title='Bulk'), 'Three small words', 3, 1)
+        self.assertDerived(post, 'Item one Item two', 4, 1)
+    
+    def test_migration_backfill(self):
+        migration = importlib.import_module('cms.migrations.0009_post_content_text')
+        post = Post.objects.create(title='Long', content=self.CONTENT, author=self.author)
+        empty = Post.objects.create(title='Empty', content='', author=self.author)
+        Post.objects.update(content_text='', word_count=0, reading_time=0)
+        apps = MigrationLoader(connection).project_state(('cms', '0009_post_content_text')).apps
+        migration.populate_content_text(apps, mock.Mock(connection=connection))
+        self.assertDerived(post, 'Intro word word', 450, 3)
+        self.assertDerived(empty, '', 0, 0)
+
+
+@override_settings(CMS_PAGE_CACHE_TIMEOUT=600)
+class PageCacheTests(SiteTestCase):
+    """Saving content expires exactly the cached pages tagged with it, once committed"""
+    
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.page = Page.objects.create(title='About', content='<p>About us</p>', is_published=True)
+        cls.settings_object = SiteSettings.objects.first() or SiteSettings.objects.create(site_title='Test site')
+        news, guides = cls.categories
+        # Both on the first page of the post list
+        cls.guide, cls.story = cls.posts[1], cls.posts[2]
+        cls.urls = {
+            'list': reverse('cms:post_list'),
+            'guide': reverse('cms:post_detail', kwargs={'slug': cls.guide.slug}),
+            'story': reverse('cms:post_detail', kwargs={'slug': cls.story.slug}),
+            'news': reverse('cms:category_detail', kwargs={'slug': news.slug}),
+            'guides': reverse('cms:category_detail', kwargs={'slug': guides.slug}),
+            'page': reverse('cms:page_detail', kwargs={'slug': cls.page.slug}),
+        }
+    
+    def cache_statuses(self):
+        statuses = {}
+        for name, url in self.urls.items():
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            statuses[name] = response.get('X-Page-Cache')
+        return statuses
+    
+    def assertExpires(self, change, *expired):
+        self.cache_statuses()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+            # Rendered from the old rows until the commit
+            self.assertEqual(set(self.cache_statuses().values()), {'HIT'})
+        expected = {name: 'MISS' if name in expired else 'HIT' for name in self.urls}
+        self.assertEqual(self.cache_statuses(), expected)
+    
+    def save(self, instance, **values):
+        for field, value in values.items():
+            setattr(instance, field, value)
+        instance.save()
+    
+    def test_post_save(self):
+        self.assertExpires(lambda: self.save(self.story, meta_description='New'), 'list', 'story', 'news')
+    
+    def test_comment_approval(self):
+        self.assertExpires(lambda: self.guide.comments.approve(), 'guide')
+    
+    def test_category_save(self):
+        self.assertExpires(lambda: self.save(self.categories[1], description='New'), 'list', 'guide', 'guides')
+    
+    def test_page_save(self):
+        self.assertExpires(lambda: self.save(self.page, content='<p>New</p>'), 'page')
+    
+    def test_site_settings_save(self):
+        self.assertExpires(lambda: self.save(self.settings_object, footer_text='New'), *self.urls)
+    
+    def test_signed_in_users_bypass_the_cache(self):
+        self.cache_statuses()
+        self.client.force_login(self.author)
+        self.assertEqual(set(self.cache_statuses().values()), {None})
+        self.client.logout()
+        self.assertEqual(set(self.cache_statuses().values()), {'HIT'})
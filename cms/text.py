@@ -0,0 +1,80 @@
+"""
+Plain-text extraction helpers for rich (CKEditor) HTML content
+"""
+import math
+from html.parser import HTMLParser
+
+
+# Average adult silent reading speed
+WORDS_PER_MINUTE = 200
+
+# Elements whose text content is never shown to readers
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'template'}
+
+# Elements that break the text flow and should be separated by whitespace
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt',
+    'figcaption', 'figure', 'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre', 'section', 'table',
+    'td', 'th', 'tr', 'ul',
+}
+
+
+class _TextExtractor(HTMLParser):
+    """Single-pass HTML tokenizer collecting the visible text"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_endtag(self, tag):
+        if tag in SKIPPED_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append(' ')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """
+    Return the visible text of an HTML fragment with entities decoded,
+    script/style content removed and whitespace collapsed.
+    """
+    if not html:
+        return ''
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return ' '.join(''.join(parser.parts).split())
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def reading_time(word_count):
+    """Minutes needed to read ``word_count`` words, at least 1 for any text"""
+    return math.ceil(word_count / WORDS_PER_MINUTE) if word_count else 0
+
+
+def truncate_text(text, length, ellipsis='...'):
+    """
+    Cut plain text on a word boundary so that, ellipsis included, it is at
+    most ``length`` characters long
+    """
+    if len(text) <= length:
+        return text
+    limit = length - len(ellipsis)
+    head, space, _ = text[:limit + 1].rpartition(' ')
+    cut = head if space else text[:limit]
+    return cut.rstrip(' ,;:') + ellipsis
@@ -0,0 +1,149 @@
+"""
+Content version index and HTTP validators (ETag / Last-Modified)
+
+Every content table has a ``ContentVersion`` row whose counter is bumped, in
+the same transaction, whenever one of its rows is saved or deleted. Reading
+those few rows is enough to tell whether a listing may have changed, so
+collection ETags never touch the content tables. Detail ETags use the
+object's own ``updated_at`` plus the versions of what it embeds.
+
+``conditional()`` wraps Django's ``condition`` decorator so both validators
+come from one function, evaluated once, before the view does any work. It
+also serves async views, which Django 4.2's ``condition`` does not;
+``ConditionalViewMixin`` applies it to class-based views, async or not.
+"""
+import datetime
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
+
+from .models import ContentVersion
+
+
+def bump(*names, using='default'):
+    """Record a change to the named tables"""
+    names = set(names)
+    now = timezone.now()
+    versions = ContentVersion.objects.using(using)
+    updated = versions.filter(name__in=names).update(version=F('version') + 1, changed_at=now)
+    if updated < len(names):
+        existing = set(versions.filter(name__in=names).values_list('name', flat=True))
+        versions.bulk_create(
+            [ContentVersion(name=name, version=1, changed_at=now) for name in names - existing],
+            ignore_conflicts=True
+        )
+
+
+def get_versions(names, using=None):
+    """
+    ``{name: (version, changed_at)}``; tables never changed get ``(0, None)``.
+    Read from the database routed to unless ``using`` is given.
+    """
+    found = {
+        name: (version, changed_at)
+        for name, version, changed_at in ContentVersion.objects.using(using).filter(
+            name__in=list(names)
+        ).values_list('name', 'version', 'changed_at')
+    }
+    return {name: found.get(name, (0, None)) for name in names}
+
+
+def make_etag(*parts):
+    """Strong ETag value (unquoted) from anything with a stable repr"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+def latest(*moments):
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def collection_validators(names, *variant):
+    """
+    ``(etag, last_modified)`` of a listing built from the tables in
+    ``names``; ``variant`` holds whatever else shapes the response (query
+    string, user, format).
+    """
+    versions = get_versions(names)
+    return (
+        make_etag(sorted(versions.items()), *variant),
+        latest(*(changed_at for _, changed_at in versions.values())),
+    )
+
+
+def object_validators(updated_at, names, *variant):
+    """``(etag, last_modified)`` of one object plus the tables it embeds"""
+    versions = get_versions(names)
+    return (
+        make_etag(updated_at, sorted(versions.items()), *variant),
+        latest(updated_at, *(changed_at for _, changed_at in versions.values())),
+    )
+
+
+def conditional(validators_func):
+    """
+    View decorator answering conditional GET/HEAD requests with 304 before
+    the view runs. ``validators_func(request, *args, **kwargs)`` returns
+    ``(etag, last_modified)``; return ``(None, None)`` to skip validation.
+    """
+    def get_validators(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return None, None
+        if not hasattr(request, '_cms_validators'):
+            request._cms_validators = validators_func(request, *args, **kwargs)
+        return request._cms_validators
+    
+    def etag_func(request, *args, **kwargs):
+        return get_validators(request, *args, **kwargs)[0]
+    
+    def last_modified_func(request, *args, **kwargs):
+        return get_validators(request, *args, **kwargs)[1]
+    
+    sync_condition = condition(etag_func=etag_func, last_modified_func=last_modified_func)
+    
+    def decorator(func):
+        if not iscoroutinefunction(func):
+            return sync_condition(func)
+        
+        @wraps(func)
+        async def inner(request, *args, **kwargs):
+            return await _async_condition(func, get_validators, request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+class ConditionalViewMixin:
+    """
+    ``conditional(validators)`` around a class-based view, async or not;
+    ``validators`` is a function like those ``conditional()`` takes.
+    """
+    validators = None
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return conditional(cls.validators)(super().as_view(**initkwargs))
+
+
+async def _async_condition(view, get_validators, request, *args, **kwargs):
+    """Django's ``condition`` for an async ``view``, with the validators run in a thread"""
+    etag, last_modified = await sync_to_async(get_validators)(request, *args, **kwargs)
+    etag = quote_etag(etag) if etag is not None else None
+    if last_modified:
+        if not timezone.is_aware(last_modified):
+            last_modified = timezone.make_aware(last_modified, datetime.timezone.utc)
+        last_modified = int(last_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await view(request, *args, **kwargs)
+    if request.method in ('GET', 'HEAD'):
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        if etag:
+            response.headers.setdefault('ETag', etag)
+    return response
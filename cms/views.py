@@ -1,41 +1,96 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
-from django.db.models import Q
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
+from django.template.response import TemplateResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.views.generic import ListView, DetailView
-from django.utils import timezone
-from .models import Post, Page, Category, Comment, SiteSettings
+from .models import Post, Page, Category, Comment
 from .forms import CommentForm, PostForm, PageForm
+from . import comment_intake, page_cache, related, replicas, search, versions
+from .page_cache import CachedPageMixin
+from .pagination import KeysetPaginationMixin, apaginate
+from .site_settings import get_site_settings
+from .stats import get_dashboard_stats
+
+
+def _html_variant(request):
+    return (request.get_full_path(), request.user.pk)
+
+
+def post_detail_validators(request, slug):
+    if page_cache.has_pending_messages(request):
+        return None, None
+    updated_at = Post.objects.filter(slug=slug, status='published').values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return versions.object_validators(
+        updated_at, ('post', 'comment', 'category', 'tag', 'user', 'settings', 'related'), *_html_variant(request)
+    )
+
+
+def category_detail_validators(request, slug):
+    if page_cache.has_pending_messages(request):
+        return None, None
+    return versions.collection_validators(
+        ('post', 'category', 'tag', 'user', 'settings'), *_html_variant(request)
+    )
+
 
+def page_detail_validators(request, slug):
+    if page_cache.has_pending_messages(request):
+        return None, None
+    updated_at = Page.objects.filter(slug=slug, is_published=True).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None, None
+    return versions.object_validators(updated_at, ('settings',), *_html_variant(request))
 
-def get_site_settings():
-    """Helper function to get site settings"""
-    try:
-        return SiteSettings.objects.first()
-    except SiteSettings.DoesNotExist:
-        return None
 
+async def _alist(queryset):
+    return [obj async for obj in queryset.aiterator()]
 
-class PostListView(ListView):
+
+class AsyncDetailMixin:
+    """
+    ``async def get()`` for DetailView subclasses: the object is fetched
+    with the async ORM, and ``aget_extra_context()`` adds what the page
+    shows beside it.
+    """
+    
+    async def aget_object(self):
+        queryset = self.get_queryset()
+        try:
+            return await queryset.aget(**{self.get_slug_field(): self.kwargs[self.slug_url_kwarg]})
+        except queryset.model.DoesNotExist:
+            raise Http404('No %s found matching the query' % queryset.model._meta.verbose_name)
+    
+    async def aget_extra_context(self):
+        return {}
+    
+    async def get(self, request, *args, **kwargs):
+        self.object = await self.aget_object()
+        context = self.get_context_data(object=self.object, **await self.aget_extra_context())
+        return self.render_to_response(context)
+
+
+class PostListView(CachedPageMixin, KeysetPaginationMixin, ListView):
     model = Post
     template_name = 'cms/post_list.html'
     context_object_name = 'posts'
     paginate_by = 6
+    replica_reads = True
+    page_cache_follows_schedule = True
     
     def get_queryset(self):
-        queryset = Post.objects.filter(status='published', publish_date__lte=timezone.now())
+        queryset = Post.objects.filter(status='published').order_by('-publish_date', '-id')
         
         # Search functionality
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(title__icontains=search_query) |
-                Q(content__icontains=search_query) |
-                Q(excerpt__icontains=search_query)
-            )
+            queryset = search.search_posts(queryset, search_query)
         
         # Category filter
         category_slug = self.request.GET.get('category')
@@ -49,80 +104,115 @@ class PostListView(ListView):
         
         return queryset.select_related('author', 'category').prefetch_related('tags')
     
+    async def get(self, request, *args, **kwargs):
+        # Building a search queryset may look the index up
+        queryset = await sync_to_async(self.get_queryset)()
+        self.object_list, categories = await asyncio.gather(
+            apaginate(request, queryset, self.paginate_by),
+            _alist(Category.objects.all()),
+        )
+        search_query = request.GET.get('search', '')
+        if search_query:
+            await sync_to_async(search.highlight)(self.object_list, search_query)
+        context = self.get_context_data(categories=categories, search_query=search_query)
+        return self.render_to_response(context)
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['categories'] = Category.objects.all()
-        context['site_settings'] = get_site_settings()
-        context['search_query'] = self.request.GET.get('search', '')
+        if context['search_query']:
+            self.add_cache_tags('post-search')
+        if self.request.GET.get('tag'):
+            self.add_cache_tags('post-tags')
+        self.add_cache_tags('post-list', 'categories', *(page_cache.post_tag(post.pk) for post in context['posts']))
         return context
 
 
-class PostDetailView(DetailView):
+class PostDetailView(versions.ConditionalViewMixin, CachedPageMixin, AsyncDetailMixin, DetailView):
     model = Post
     template_name = 'cms/post_detail.html'
     context_object_name = 'post'
+    validators = post_detail_validators
+    replica_reads = True
+    page_cache_follows_schedule = True
     
     def get_queryset(self):
-        return Post.objects.filter(status='published', publish_date__lte=timezone.now())
+        return Post.objects.filter(status='published').select_related('author', 'category').prefetch_related('tags')
+    
+    async def aget_extra_context(self):
+        comments, related_posts, site_settings = await asyncio.gather(
+            _alist(self.object.comments.filter(is_approved=True)),
+            _alist(related.get_related_posts(self.object, limit=3)),
+            sync_to_async(get_site_settings)(),
+        )
+        return {'comments': comments, 'related_posts': related_posts, 'site_settings': site_settings}
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['comments'] = self.object.comments.filter(is_approved=True)
         context['comment_form'] = CommentForm()
-        context['site_settings'] = get_site_settings()
-        context['related_posts'] = Post.objects.filter(
-            status='published',
-            category=self.object.category
-        ).exclude(id=self.object.id)[:3]
+        self.add_cache_tags(
+            page_cache.post_tag(self.object.pk),
+            page_cache.comments_tag(self.object.pk),
+            page_cache.category_tag(self.object.category_id),
+            page_cache.author_tag(self.object.author_id),
+            page_cache.related_tag(self.object.pk),
+            *(page_cache.post_tag(post.pk) for post in context['related_posts'])
+        )
         return context
 
 
-class CategoryDetailView(DetailView):
+class CategoryDetailView(versions.ConditionalViewMixin, CachedPageMixin, AsyncDetailMixin, DetailView):
     model = Category
     template_name = 'cms/category_detail.html'
     context_object_name = 'category'
+    validators = category_detail_validators
+    replica_reads = True
+    page_cache_follows_schedule = True
     
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    async def aget_extra_context(self):
         posts = Post.objects.filter(
             category=self.object,
-            status='published',
-            publish_date__lte=timezone.now()
-        ).select_related('author')
+            status='published'
+        ).select_related('author').prefetch_related('tags').order_by('-publish_date', '-id')
         
-        paginator = Paginator(posts, 6)
-        page_number = self.request.GET.get('page')
-        context['posts'] = paginator.get_page(page_number)
-        context['site_settings'] = get_site_settings()
+        return {'posts': await apaginate(self.request, posts, 6)}
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        self.add_cache_tags(
+            page_cache.category_tag(self.object.pk),
+            *(page_cache.post_tag(post.pk) for post in context['posts'])
+        )
         return context
 
 
-class PageDetailView(DetailView):
+class PageDetailView(versions.ConditionalViewMixin, CachedPageMixin, AsyncDetailMixin, DetailView):
     model = Page
     template_name = 'cms/page_detail.html'
     context_object_name = 'page'
+    validators = page_detail_validators
+    replica_reads = True
     
     def get_queryset(self):
         return Page.objects.filter(is_published=True)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['site_settings'] = get_site_settings()
+        self.add_cache_tags(page_cache.page_tag(self.object.pk))
         return context
 
 
 @require_POST
 def add_comment(request, slug):
-    post = get_object_or_404(Post, slug=slug, status='published')
+    post = get_object_or_404(Post.objects.only('pk'), slug=slug, status='published')
     form = CommentForm(request.POST)
     
-    if form.is_valid():
-        comment = form.save(commit=False)
-        comment.post = post
-        comment.save()
-        messages.success(request, 'Your comment has been submitted and is awaiting approval.')
-    else:
+    if not form.is_valid():
         messages.error(request, 'There was an error with your comment. Please try again.')
+    elif comment_intake.check_rate_limit(request, post):
+        messages.error(request, 'You are commenting too fast. Please wait a minute and try again.')
+    else:
+        comment_intake.submit(post, **form.cleaned_data)
+        messages.success(request, 'Your comment has been submitted and is awaiting approval.')
     
     return redirect('cms:post_detail', slug=slug)
 
@@ -130,18 +220,11 @@ def add_comment(request, slug):
 @login_required
 def dashboard(request):
     """Admin dashboard view"""
-    context = {
-        'total_posts': Post.objects.count(),
-        'published_posts': Post.objects.filter(status='published').count(),
-        'draft_posts': Post.objects.filter(status='draft').count(),
-        'total_comments': Comment.objects.count(),
-        'pending_comments': Comment.objects.filter(is_approved=False).count(),
-        'total_categories': Category.objects.count(),
-        'total_pages': Page.objects.count(),
+    context = dict(get_dashboard_stats())
+    context.update({
         'recent_posts': Post.objects.order_by('-created_at')[:5],
-        'recent_comments': Comment.objects.order_by('-created_at')[:5],
-        'site_settings': get_site_settings(),
-    }
+        'recent_comments': Comment.objects.select_related('post').order_by('-created_at')[:5],
+    })
     return render(request, 'cms/dashboard.html', context)
 
 
@@ -192,20 +275,22 @@ def create_page(request):
     return render(request, 'cms/create_page.html', {'form': form})
 
 
-def search_posts(request):
+@replicas.replica_reads
+async def search_posts(request):
     query = request.GET.get('q')
     if query:
-        posts = Post.objects.filter(
-            Q(title__icontains=query) | Q(content__icontains=query),
-            status='published',
-            publish_date__lte=timezone.now()
-        ).select_related('author', 'category')
+        results = (await sync_to_async(search.search_posts)(
+            Post.objects.filter(status='published'),
+            query
+        )).select_related('author', 'category').prefetch_related('tags')
+        posts, result_count = await asyncio.gather(apaginate(request, results, 10), results.acount())
+        await sync_to_async(search.highlight)(posts, query)
     else:
-        posts = Post.objects.none()
+        posts, result_count = await apaginate(request, Post.objects.none(), 10), 0
     
     context = {
         'posts': posts,
+        'result_count': result_count,
         'query': query,
-        'site_settings': get_site_settings(),
     }
-    return render(request, 'cms/search_results.html', context)
+    return TemplateResponse(request, 'cms/search_results.html', context)
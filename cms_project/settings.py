@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'cms.querybudget.QueryBudgetMiddleware',
+    'cms.replicas.ReplicaMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -72,6 +74,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'cms.context_processors.site_settings',
             ],
         },
     },
@@ -87,6 +90,38 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Keep connections (and their pragmas and page cache) for a minute,
+        # checked before reuse; see CMS_SQLITE_PRAGMAS
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read replica: a copy of the primary kept by `manage.py sync_replicas`;
+    # used once listed in CMS_READ_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'var' / 'replica.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['cms.replicas.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/ref/settings/#caches
+# Shared by every process on this host, so page cache invalidations and
+# comment rate limits reach all of them; use Redis or memcached when the
+# site runs on several hosts
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
     }
 }
 
@@ -202,3 +237,70 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+
+# CMS Configuration
+# Seconds the shared dashboard statistics stay cached; writes do not clear
+# them, so this is how stale the dashboards can be
+CMS_DASHBOARD_STATS_TTL = 60
+# Seconds each process reuses its local copy of SiteSettings before
+# re-reading the shared cache
+CMS_SITE_SETTINGS_LOCAL_TTL = 5
+# Seconds the shared copy of SiteSettings stays cached; saves clear it
+CMS_SITE_SETTINGS_CACHE_TIMEOUT = 300
+# Seconds an anonymous page stays in the full-page cache (0 disables it).
+# Content changes expire the affected pages immediately.
+CMS_PAGE_CACHE_TIMEOUT = 600
+# Posts written per transaction by /api/posts/bulk/, and the most one
+# request may send
+CMS_BULK_BATCH_SIZE = 200
+CMS_BULK_MAX_ITEMS = 1000
+# Widths (px) of the responsive renditions made of uploaded images
+CMS_IMAGE_WIDTHS = (320, 640, 960, 1280)
+# Related posts stored per post (pages show the first three still published)
+CMS_RELATED_POSTS_TOP_K = 6
+# Background jobs (run by `manage.py run_workers`): attempts before a job
+# is marked failed, seconds before the first retry (doubled each time),
+# seconds before a running job is presumed abandoned, and seconds finished
+# jobs are kept. CMS_JOBS_EAGER runs jobs in-process on commit instead
+# (delayed jobs, such as scheduled publishing, are then skipped).
+CMS_JOBS_MAX_ATTEMPTS = 5
+CMS_JOBS_RETRY_DELAY = 10
+CMS_JOBS_LOCK_TIMEOUT = 600
+CMS_JOBS_KEEP_DONE = 86400
+CMS_JOBS_EAGER = False
+# Comments are spooled to this directory and written in batches by
+# `manage.py flush_comments` (None saves them on submission), and each
+# visitor IP and each post accepts at most (count, seconds) of them. Rate
+# limits live in this cache alias, which must be shared by all processes
+# (see CACHES).
+CMS_COMMENT_SPOOL_DIR = BASE_DIR / 'var' / 'comment_spool'
+CMS_COMMENT_RATE_PER_IP = (5, 60)
+CMS_COMMENT_RATE_PER_POST = (30, 60)
+CMS_RATE_LIMIT_CACHE = 'default'
+# Requests running more than CMS_QUERY_BUDGET queries (None disables the
+# check), spending more than CMS_QUERY_BUDGET_TIME seconds in the database
+# or repeating one query shape more than CMS_QUERY_REPEAT_LIMIT times are
+# logged as warnings by cms.querybudget (naming the queries run from
+# templates and serializers only under DEBUG)
+CMS_QUERY_BUDGET = 30
+CMS_QUERY_BUDGET_TIME = 0.25
+CMS_QUERY_REPEAT_LIMIT = 3
+# Database aliases public GET requests read from (e.g. ('replica',)); a
+# replica synced longer than CMS_REPLICA_MAX_LAG seconds ago is skipped.
+# After a write, a visitor reads from the primary for
+# CMS_REPLICA_STICKY_SECONDS.
+CMS_READ_REPLICAS = ()
+CMS_REPLICA_MAX_LAG = 10
+CMS_REPLICA_STICKY_SECONDS = 15
+# Pragmas set on every new SQLite connection by cms.sqlite, in order:
+# wait up to busy_timeout ms for locks, write-ahead logging (readers and
+# the writer do not block each other), fsync at checkpoints only, a
+# memory map of mmap_size bytes and a page cache of cache_size KiB when
+# negative. An empty dict keeps SQLite's defaults.
+CMS_SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+}